@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark the fetch profiles (SPAM_FETCH_PROFILE) on cases with oversized descriptions
+Runs one full check per profile against the local fake Salesforce and reports bytes transferred, time
+and close accuracy, then the accuracy of each profile's classification on the training set
+"""
+import os
+import io
+import sys
+import csv
+import time
+import argparse
+import tempfile
+import contextlib
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(REPO_DIR, 'services'))
+
+from fake_salesforce import FakeSalesforceServer
+from spam_filter_service import FETCH_PROFILES, SPAM_THRESHOLD
+from synthetic_cases import generate_cases
+from common import make_service
+
+def run_check(cases, profile, page_size):
+    """One full check with the given profile; transfer, time and how the closes line up with the labels"""
+    with FakeSalesforceServer(cases) as fake, tempfile.TemporaryDirectory() as state_dir:
+        service = make_service(fake.connect(), state_dir, SPAM_FETCH_PROFILE=profile)
+        service.page_size = page_size
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            service.run_check()
+            elapsed = time.perf_counter() - started
+        closed = {case_id for case_id, case in fake.cases.items() if case['Status'] == 'Closed'}
+    spam = {case['Id'] for case in cases if case['IsSpam']}
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'mb_sent': round(fake.bytes_sent / 1e6, 2),
+        'queries': fake.request_counts['query'],
+        'full_text_rescored': service.stats['full_text_rescored'],
+        'full_text_flipped': service.stats['full_text_flipped'],
+        'closed': len(closed),
+        'wrongly_closed': len(closed - spam),
+        'missed_spam': len(spam - closed)
+    }, closed
+
+def load_training_set(csv_path):
+    """(tickets, labels) from the training CSV (Subject, Description, is_spam)"""
+    tickets, labels = [], []
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            tickets.append({'Subject': row.get('Subject') or '', 'Description': row.get('Description') or None})
+            labels.append(str(row.get('is_spam')).strip().lower() in ('true', '1'))
+    return tickets, labels
+
+def score_set(tickets, labels, profile, batch_size):
+    """Classification time and accuracy of one profile's cap on labelled tickets"""
+    service = make_service(object(), SPAM_FETCH_PROFILE=profile)
+    decisions = []
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for offset in range(0, len(tickets), batch_size):
+            decisions += [is_spam and confidence > SPAM_THRESHOLD
+                          for is_spam, confidence, _ in service.classify_batch(tickets[offset:offset + batch_size])]
+    elapsed = time.perf_counter() - started
+    correct = sum(decision == label for decision, label in zip(decisions, labels))
+    return elapsed, correct / len(labels), service.stats['full_text_rescored']
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch profile benchmark")
+    parser.add_argument('--cases', type=int, default=5000)
+    parser.add_argument('--oversized', type=float, default=0.1, help="Share of cases with a pasted log or email thread")
+    parser.add_argument('--page-size', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('--csv', default=os.path.join(REPO_DIR, 'training-data', 'training_data.csv'),
+                        help="Training CSV to measure accuracy on")
+    args = parser.parse_args()
+
+    cases = generate_cases(args.cases, oversized=args.oversized)
+    csv_path = args.csv
+
+    print(f"{len(cases)} cases, {sum(case['IsSpam'] for case in cases)} spam, {args.oversized:.0%} oversized "
+          f"(description p100 {max(len(case['Description'] or '') for case in cases):,} chars)")
+    baseline = None
+    for profile in FETCH_PROFILES:
+        result, closed = run_check(cases, profile, args.page_size)
+        baseline = closed if baseline is None else baseline
+        result['decisions_changed'] = len(closed ^ baseline)
+        print(f"  {profile:<8} " + ', '.join(f"{key}={value}" for key, value in result.items()))
+
+    if os.path.exists(csv_path):
+        tickets, labels = load_training_set(csv_path)
+        print(f"\nTraining set {csv_path}: {len(tickets)} tickets")
+    else:
+        print(f"\nTraining set {csv_path} not found; scoring the synthetic cases instead")
+        tickets, labels = [dict(case) for case in cases], [case['IsSpam'] for case in cases]
+    for profile in FETCH_PROFILES:
+        elapsed, accuracy, rescored = score_set(tickets, labels, profile, args.batch_size)
+        print(f"  {profile:<8} classified in {elapsed:.3f}s ({len(tickets) / elapsed:,.0f} tickets/s), "
+              f"accuracy {accuracy:.2%}, {rescored} rescored on the full text")
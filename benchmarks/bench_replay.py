@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Find the service's throughput limit by replaying a recorded ticket stream at increasing speeds
+Synthetic cases arriving one per second are written as Case snapshots, then driven through
+check_tickets_periodically by ReplaySalesforce. Once arrivals outpace the service, processed_per_s stops
+following the arrival rate
+"""
+import os
+import io
+import sys
+import json
+import argparse
+import tempfile
+import contextlib
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(REPO_DIR, 'services'))
+
+from replay_salesforce import ReplaySalesforce
+from synthetic_cases import generate_cases
+from common import make_service
+
+def write_snapshots(cases, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for case in cases:
+            f.write(json.dumps({key: value for key, value in case.items() if key != 'IsSpam'}) + '\n')
+
+def replay(snapshot_file, speed, pipelined, state_dir):
+    """Drive the daemon loop over the whole recording at one speed"""
+    sf = ReplaySalesforce([snapshot_file], speed=speed)
+    service = make_service(sf, SPAM_FILTER_STATE_FILE=os.path.join(state_dir, f'state-{speed:g}.json'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        service.should_stop = lambda: sf.drained
+        service.check_tickets_periodically(pipelined=pipelined, daemon=True)
+    summary = sf.summary()
+    lag = lambda seconds: None if seconds is None else round(seconds / speed, 3)
+    return {
+        'speed': speed,
+        'arrivals_per_s': round(speed, 1) if speed else 'all',
+        'processed_per_s': round(service.stats['total_processed'] / summary['elapsed_s'], 1),
+        'polls': summary['requests'].get('query', 0),
+        'spam_closed': service.stats['spam_closed'],
+        'close_lag_p50_s': lag(summary['close_lag_p50_s']),
+        'close_lag_p99_s': lag(summary['close_lag_p99_s'])
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay throughput benchmark")
+    parser.add_argument('--cases', type=int, default=5000, help="Cases in the recording, one per second")
+    parser.add_argument('--speeds', type=float, nargs='+', default=[500, 2000, 8000, 32000])
+    parser.add_argument('--poll-interval', type=float, default=0.25, help="SPAM_POLL_MIN_INTERVAL for the replays (s)")
+    parser.add_argument('--pipelined', action='store_true')
+    args = parser.parse_args()
+
+    os.environ['SPAM_POLL_MIN_INTERVAL'] = str(args.poll_interval)
+    os.environ['SPAM_POLL_MAX_INTERVAL'] = str(args.poll_interval)
+    with tempfile.TemporaryDirectory() as state_dir:
+        snapshot_file = os.path.join(state_dir, 'cases.jsonl')
+        write_snapshots(generate_cases(args.cases), snapshot_file)
+        print(f"{args.cases} recorded cases, one per second; close lag in real seconds")
+        for speed in args.speeds:
+            result = replay(snapshot_file, speed, args.pipelined, state_dir)
+            print("  " + ', '.join(f"{key}={value}" for key, value in result.items()))
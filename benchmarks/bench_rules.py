@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark the rule stage in front of the model
+Measures the rule pass on its own, then classification with only the default rule and with a realistic
+rule set, and reports how many tickets the rules took away from the model
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services'))
+
+from rule_filter import RuleFilter, DEFAULT_RULES
+from synthetic_cases import generate_cases, CUSTOMER_DOMAINS, SPAM_DOMAINS
+from common import make_service
+
+def make_rules(extra_domains, seed=7):
+    """Known spam vendors and partners, plus filler deny domains to reach a realistic list size"""
+    rng = random.Random(seed)
+    filler = [f"{''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=10))}.example" for _ in range(extra_domains)]
+    return {
+        'allow': {
+            'domains': list(CUSTOMER_DOMAINS[:2]),
+            'subject_prefixes': ['perdot']
+        },
+        'deny': {
+            'domains': list(SPAM_DOMAINS) + filler,
+            'subject_prefixes': ['exclusive webinar invitation'],
+            'phrases': ['book at https://example.com', 'seats for', 'unsubscribe']
+        }
+    }
+
+def rule_pass(rules, cases, batch_size):
+    """Seconds for the rule stage alone and the decisions it made"""
+    decisions = {}
+    started = time.perf_counter()
+    for offset in range(0, len(cases), batch_size):
+        for i, decision in rules.evaluate(cases[offset:offset + batch_size]).items():
+            decisions[offset + i] = decision
+    return time.perf_counter() - started, decisions
+
+def classify_all(service, rules, cases, batch_size):
+    """Classify every case with the given rules; returns seconds and the stats that matter here"""
+    service.rules = rules
+    for counter in ('model_scored', 'rule_allowed', 'rule_denied'):
+        service.stats[counter] = 0
+    started = time.perf_counter()
+    for offset in range(0, len(cases), batch_size):
+        service.classify_batch(cases[offset:offset + batch_size])
+    elapsed = time.perf_counter() - started
+    return elapsed, {counter: service.stats[counter] for counter in ('model_scored', 'rule_allowed', 'rule_denied')}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rule stage benchmark")
+    parser.add_argument('--cases', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('--extra-domains', type=int, default=2000, help="Filler deny domains added to the rule set")
+    args = parser.parse_args()
+
+    cases = generate_cases(args.cases)
+    service = make_service(object())
+
+    started = time.perf_counter()
+    rules = RuleFilter(make_rules(args.extra_domains))
+    compile_s = time.perf_counter() - started
+    rule_s, decisions = rule_pass(rules, cases, args.batch_size)
+    denied = [i for i, (is_spam, _) in decisions.items() if is_spam]
+    wrongly_denied = sum(not cases[i]['IsSpam'] for i in denied)
+    wrongly_allowed = sum(cases[i]['IsSpam'] for i, (is_spam, _) in decisions.items() if not is_spam)
+
+    print(f"{len(cases)} cases, {sum(case['IsSpam'] for case in cases)} spam; {len(rules.rules)} rules "
+          f"compiled in {compile_s * 1000:.1f} ms")
+    print(f"  rule stage alone: {rule_s:.3f}s ({len(cases) / rule_s:,.0f} tickets/s), "
+          f"{len(decisions)} decided ({len(denied)} denied, {wrongly_denied} of them legitimate; "
+          f"{len(decisions) - len(denied)} allowed, {wrongly_allowed} of them spam)")
+
+    for name, rule_filter in (('default rule only', RuleFilter(DEFAULT_RULES)), ('with rule set', RuleFilter(make_rules(args.extra_domains)))):
+        elapsed, stats = classify_all(service, rule_filter, cases, args.batch_size)
+        print(f"  {name}: {elapsed:.3f}s ({len(cases) / elapsed:,.0f} tickets/s), " +
+              ', '.join(f"{key}={value}" for key, value in stats.items()))
+    print("Top rules: " + ', '.join(f"{name} ({count})" for name, count in service.rules.top_hits()))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for SpamFilterService
+Measures model load time, per-ticket and batched classification throughput and latency, and a full
+check against the local fake Salesforce, and the cold start time to the first classified ticket. Prints JSON so runs can be compared across commits.
+"""
+import os
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime
+import numpy as np
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(REPO_DIR, 'services'))
+
+from fake_salesforce import FakeSalesforceServer
+from synthetic_cases import generate_cases
+from common import make_service
+
+# Run in a fresh interpreter: a cold service start up to its first classified ticket against a fake org
+COLD_START_CHILD = """
+import io, sys, json, time, contextlib
+sys.path.insert(0, 'services')
+instance_url, token, login_latency = sys.argv[1], sys.argv[2], float(sys.argv[3])
+
+def connect():
+    from fake_salesforce import connect_to
+    return connect_to(instance_url, token, login_latency)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from spam_filter_service import SpamFilterService, MODULE_STARTED
+    service = SpamFilterService(sf_factory=connect)
+    service.run_check()
+first_ticket = time.time() - (time.perf_counter() - MODULE_STARTED - service.startup['first_ticket'])
+print(json.dumps({'first_ticket_epoch': first_ticket, 'startup': service.startup,
+                  'modules': [name for name in ('scipy', 'sklearn') if name in sys.modules]}))
+"""
+
+def latency_summary(timings, count=None):
+    """Throughput and latency percentiles (ms) for a list of per-call timings in seconds"""
+    timings = np.asarray(timings)
+    count = len(timings) if count is None else count
+    return {
+        'tickets_per_s': round(count / timings.sum(), 1) if timings.sum() else None,
+        'p50_ms': round(float(np.percentile(timings, 50)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(timings, 99)) * 1000, 3),
+        'max_ms': round(float(timings.max()) * 1000, 3)
+    }
+
+def bench_model_load(service, repeats):
+    """Median seconds to load each model format"""
+    results = {}
+    for model_format in ('bundle', 'pickle'):
+        os.environ['SPAM_MODEL_FORMAT'] = model_format
+        timings = []
+        for _ in range(repeats):
+            with contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                loaded = service.load_spam_model()
+                timings.append(time.perf_counter() - started)
+        results[model_format] = round(float(np.median(timings)) * 1000, 3) if loaded else None
+    os.environ['SPAM_MODEL_FORMAT'] = 'auto'
+    with contextlib.redirect_stdout(io.StringIO()):
+        service.load_spam_model()
+    return {'median_ms': results}
+
+def bench_classification(service, cases, batch_size, single_count):
+    """Per-ticket (classify_ticket_as_spam) and batched (classify_batch) classification"""
+    single = []
+    for case in cases[:single_count]:
+        started = time.perf_counter()
+        service.classify_ticket_as_spam(case['Subject'], case['Description'])
+        single.append(time.perf_counter() - started)
+
+    batches = []
+    for i in range(0, len(cases), batch_size):
+        started = time.perf_counter()
+        service.classify_batch(cases[i:i + batch_size])
+        batches.append(time.perf_counter() - started)
+
+    batched = latency_summary(batches, count=len(cases))
+    batched['batch_size'] = batch_size
+    return {'per_ticket': latency_summary(single), 'batched': batched}
+
+def bench_full_cycle(cases, pipelined, page_size, latency):
+    """One full check (fetch, classify, close) against the fake server"""
+    with FakeSalesforceServer(cases, latency=latency) as fake:
+        with tempfile.TemporaryDirectory() as state_dir:
+            service = make_service(fake.connect(), state_dir, SPAM_DECISION_LOG=os.path.join(state_dir, 'decisions.db'))
+            service.page_size = page_size
+            with contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                service.run_check(pipelined=pipelined)
+                elapsed = time.perf_counter() - started
+        return {
+            'pipelined': pipelined,
+            'elapsed_s': round(elapsed, 3),
+            'tickets_per_s': round(len(cases) / elapsed, 1),
+            'spam_closed': service.stats['spam_closed'],
+            'close_batches': service.stats['close_batches'],
+            'requests': dict(fake.request_counts)
+        }
+
+def bench_cold_start(cases, model_format, login_latency, repeats):
+    """Median time from starting the interpreter to the first classified ticket, with the startup breakdown"""
+    runs = []
+    for _ in range(repeats):
+        with FakeSalesforceServer(cases) as fake, tempfile.TemporaryDirectory() as state_dir:
+            env = dict(os.environ, SPAM_MODEL_FORMAT=model_format, SPAM_CACHE_SIZE='0', SPAM_WAVE_DETECTION='off',
+                       SPAM_CACHE_FILE='', SPAM_DECISION_LOG='', SPAM_METRICS_PORT='',
+                       SPAM_FILTER_STATE_FILE=os.path.join(state_dir, 'state.json'))
+            started = time.time()
+            child = subprocess.run([sys.executable, '-c', COLD_START_CHILD, fake.instance_url, fake.token,
+                                    str(login_latency)], cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True)
+            report = json.loads(child.stdout.strip().splitlines()[-1])
+            report['first_ticket_s'] = report['first_ticket_epoch'] - started
+            runs.append(report)
+    runs.sort(key=lambda report: report['first_ticket_s'])
+    median = runs[len(runs) // 2]
+    return {
+        'model_format': model_format,
+        'login_latency_s': login_latency,
+        'first_ticket_ms': round(median['first_ticket_s'] * 1000, 1),
+        'startup_ms': {phase: round(seconds * 1000, 1) for phase, seconds in median['startup'].items()},
+        'heavy_modules': median['modules']
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def run_suite(args):
+    cases = generate_cases(args.cases, spam_ratio=args.spam_ratio, wave_share=args.wave_share,
+                           waves=args.waves, seed=args.seed)
+    description_words = [len((case['Description'] or '').split()) for case in cases]
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'params': vars(args),
+        'dataset': {
+            'cases': len(cases),
+            'spam': sum(case['IsSpam'] for case in cases),
+            'description_words_p50': int(np.percentile(description_words, 50)),
+            'description_words_p99': int(np.percentile(description_words, 99))
+        }
+    }
+
+    with FakeSalesforceServer([]) as fake:
+        service = make_service(fake.connect())
+        results['model_load'] = bench_model_load(service, args.load_repeats)
+        results['model_version'] = service.model_version
+        results['classification'] = {}
+        for engine in ('tfidf', 'hashed'):
+            service.inference_engine = engine
+            with contextlib.redirect_stdout(io.StringIO()):
+                service.build_inference_engine()
+            if engine == 'hashed' and service.scorer is None:
+                continue
+            results['classification'][engine] = bench_classification(service, cases, args.batch_size, args.single)
+
+    results['full_cycle'] = [bench_full_cycle(cases, pipelined, args.page_size, args.latency)
+                             for pipelined in (False, True)]
+    results['cold_start'] = [bench_cold_start(cases[:args.cold_start_cases], model_format, args.login_latency,
+                                              args.cold_start_repeats) for model_format in ('bundle', 'pickle')]
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spam filter benchmark suite (prints JSON)")
+    parser.add_argument('--cases', type=int, default=10000)
+    parser.add_argument('--spam-ratio', type=float, default=0.3)
+    parser.add_argument('--wave-share', type=float, default=0.5, help="Share of spam that comes in templated waves")
+    parser.add_argument('--waves', type=int, default=3, help="Number of spam campaigns")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('--single', type=int, default=1000, help="Tickets classified one at a time")
+    parser.add_argument('--page-size', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.0, help="Simulated fake Salesforce latency per request (s)")
+    parser.add_argument('--load-repeats', type=int, default=5)
+    parser.add_argument('--login-latency', type=float, default=0.3,
+                        help="Simulated Salesforce login time (s) in the cold start runs")
+    parser.add_argument('--cold-start-cases', type=int, default=200, help="Cases in the fake org for the cold start runs")
+    parser.add_argument('--cold-start-repeats', type=int, default=3)
+    parser.add_argument('--output', help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    results = run_suite(args)
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report + '\n')
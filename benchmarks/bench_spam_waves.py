@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark spam wave detection on a synthetic campaign
+Runs classify_batch alone and one full check against the local fake Salesforce, with wave detection off and on
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services'))
+
+from fake_salesforce import FakeSalesforceServer
+from synthetic_cases import generate_cases
+from common import make_service
+
+def classify_only(cases, waves, batch_size):
+    """classify_batch over the cases in pages, without Salesforce; returns timing and work counters"""
+    service = make_service(object(), SPAM_WAVE_DETECTION='on' if waves else 'off')
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        for offset in range(0, len(cases), batch_size):
+            service.classify_batch(cases[offset:offset + batch_size])
+            # As if every close succeeded (finish_page does this once Salesforce confirms)
+            for wave in service.pending_waves.values():
+                service.waves.mark_spam(*wave)
+            service.pending_waves.clear()
+        elapsed = time.perf_counter() - started
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'tickets_per_s': round(len(cases) / elapsed, 1),
+        'model_scored': service.stats['model_scored'],
+        'wave_matched': service.stats['wave_matched']
+    }
+
+def run(cases, waves, page_size):
+    """One full check; returns timing and work counters"""
+    with FakeSalesforceServer(cases) as fake:
+        service = make_service(fake.connect(), SPAM_WAVE_DETECTION='on' if waves else 'off')
+        with contextlib.redirect_stdout(io.StringIO()):
+            service.page_size = page_size
+            # Always a full pass over the synthetic cases; never touch the real state file
+            service.poll_state = {'last_modstamp': None, 'last_id': None, 'classified': {}}
+            service.save_poll_state = lambda: None
+            started = time.perf_counter()
+            service.check_tickets_periodically()
+            elapsed = time.perf_counter() - started
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'tickets_per_s': round(len(cases) / elapsed, 1),
+        'model_scored': service.stats['model_scored'],
+        'wave_matched': service.stats['wave_matched'],
+        'spam_closed': service.stats['spam_closed'],
+        'campaigns': len(service.waves.campaigns()) if service.waves else 0
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spam wave detection benchmark")
+    parser.add_argument('--cases', type=int, default=20000)
+    parser.add_argument('--wave-share', type=float, default=0.8)
+    parser.add_argument('--page-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    # Everything that is not legitimate is a copy of one campaign
+    cases = generate_cases(args.cases, spam_ratio=args.wave_share, wave_share=1.0, waves=1)
+    print(f"Synthetic wave: {len(cases)} cases, {args.wave_share:.0%} from one campaign")
+    print("classify_batch only:")
+    for waves in (False, True):
+        result = classify_only(cases, waves, args.page_size)
+        print(f"  wave detection {'on ' if waves else 'off'}: " +
+              ', '.join(f"{key}={value}" for key, value in result.items()))
+    print("Full check against the fake Salesforce:")
+    for waves in (False, True):
+        result = run(cases, waves, args.page_size)
+        print(f"  wave detection {'on ' if waves else 'off'}: " +
+              ', '.join(f"{key}={value}" for key, value in result.items()))
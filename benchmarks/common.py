@@ -0,0 +1,19 @@
+"""
+Service setup shared by the benchmarks and offline checks
+"""
+import os
+import io
+import contextlib
+
+from spam_filter_service import SpamFilterService
+
+# Every ticket reaches the model, and nothing is written next to the repository
+BENCH_SETTINGS = {'SPAM_CACHE_SIZE': '0', 'SPAM_WAVE_DETECTION': 'off', 'SPAM_CACHE_FILE': '', 'SPAM_DECISION_LOG': ''}
+
+def make_service(sf, state_dir=None, **env):
+    """A quiet service with BENCH_SETTINGS (env overrides them), keeping its poll state in state_dir if given"""
+    if state_dir is not None:
+        env.setdefault('SPAM_FILTER_STATE_FILE', os.path.join(state_dir, 'state.json'))
+    os.environ.update(BENCH_SETTINGS, **env)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return SpamFilterService(sf=sf)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Offline checks of the spam filter against the local fake Salesforce
+Each check runs the service on synthetic cases and asserts on what the fake org ends up with; no credentials needed
+"""
+import os
+import io
+import sys
+import math
+import tempfile
+import contextlib
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(REPO_DIR, 'services'))
+
+from fake_salesforce import FakeSalesforceServer
+from rule_filter import RuleFilter
+from synthetic_cases import generate_cases
+from common import make_service
+
+def run_check(service, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return service.run_check(**kwargs)
+
+def closed_ids(fake):
+    return {case_id for case_id, case in fake.cases.items() if case['Status'] == 'Closed'}
+
+def check_close_batches():
+    """Closes go out in composite batches of at most 200, and per-record failures are retried next poll"""
+    cases = generate_cases(3000)
+    with tempfile.TemporaryDirectory() as state_dir:
+        # Which cases the model closes, with no failures
+        with FakeSalesforceServer(cases) as fake:
+            run_check(make_service(fake.connect(), state_dir))
+            expected = closed_ids(fake)
+        assert len(expected) > 400, f"need more than two batches of spam, got {len(expected)}"
+        os.remove(os.path.join(state_dir, 'state.json'))
+
+        with FakeSalesforceServer(cases) as fake:
+            # Above the API limit, so the service has to clamp it; the fake rejects batches over 200
+            service = make_service(fake.connect(), state_dir, SPAM_CLOSE_BATCH_SIZE='500')
+            service.page_size = 500
+            failing = sorted(expected)[len(expected) // 2]
+            fake.fail_ids = {failing}
+            failing_mark = fake.cases[failing]['SystemModstamp']
+
+            run_check(service)
+            assert service.close_batch_size == 200
+            assert fake.request_counts['composite_update'] >= math.ceil(len(expected) / 200)
+            assert service.stats['close_failed'] == 1, service.stats['close_failed']
+            assert closed_ids(fake) == expected - {failing}
+            assert service.poll_state['last_modstamp'] == failing_mark, "watermark should hold at the failed close"
+
+            fake.fail_ids = set()
+            run_check(service)
+            assert closed_ids(fake) == expected
+            newest = max(case['SystemModstamp'] for case in fake.cases.values() if case['Status'] != 'Closed')
+            assert service.poll_state['last_modstamp'] == newest, "watermark should move past the retried close"
+
+            processed = run_check(service)
+            assert processed == 0, f"{processed} unchanged cases classified again"
+    print(f"ok  close batches: {len(expected)} closes, {fake.request_counts['composite_update']} composite calls, "
+          f"failed close retried, watermark at {newest}")
+
+def check_close_gives_up():
+    """A close that keeps failing holds the watermark for SPAM_CLOSE_MAX_ATTEMPTS polls, then is given up on"""
+    cases = generate_cases(600)
+    with tempfile.TemporaryDirectory() as state_dir:
+        with FakeSalesforceServer(cases) as fake:
+            run_check(make_service(fake.connect(), state_dir))
+            failing = sorted(closed_ids(fake))[0]
+        os.remove(os.path.join(state_dir, 'state.json'))
+
+        with FakeSalesforceServer(cases) as fake:
+            service = make_service(fake.connect(), state_dir, SPAM_CLOSE_MAX_ATTEMPTS='3')
+            fake.fail_ids = {failing}
+            for attempt in (1, 2):
+                run_check(service)
+                assert service.poll_state['close_failures'] == {failing: attempt}, service.poll_state['close_failures']
+                assert service.poll_state['last_id'] == failing, "watermark should hold at the failing close"
+
+            run_check(service)
+            assert service.stats['close_given_up'] == 1, service.stats['close_given_up']
+            assert service.poll_state['close_failures'] == {}
+            assert service.poll_state['last_id'] != failing, "watermark should move past the abandoned close"
+            processed = run_check(service)
+            assert processed == 0, f"{processed} cases classified again after giving up"
+    print(f"ok  close gives up: watermark moved on after 3 failed closes of {failing}")
+
+def check_close_interval():
+    """SPAM_CLOSE_FLUSH_INTERVAL batches closes across pages, sequential and pipelined"""
+    cases = generate_cases(3000)
+    newest = max(case['SystemModstamp'] for case in cases)
+    calls = {}
+    with tempfile.TemporaryDirectory() as state_dir:
+        for pipelined in (False, True):
+            for interval in ('0', '3600'):
+                with FakeSalesforceServer(cases) as fake:
+                    service = make_service(fake.connect(), state_dir, SPAM_CLOSE_FLUSH_INTERVAL=interval)
+                    service.page_size = 200
+                    service.poll_state = {'last_modstamp': None, 'last_id': None, 'classified': {}}
+                    run_check(service, pipelined=pipelined)
+                    closed = closed_ids(fake)
+                    calls[pipelined, interval] = fake.request_counts['composite_update']
+                    assert service.poll_state['last_modstamp'] == newest, (pipelined, interval)
+                assert service.stats['spam_closed'] == len(closed), (pipelined, interval)
+            # 15 pages with spam on each: one batch per page without waiting, full batches when closes can wait
+            assert calls[pipelined, '0'] >= 15, calls
+            assert calls[pipelined, '3600'] == math.ceil(len(closed) / 200), calls
+    print(f"ok  close interval: {len(closed)} closes in {calls[False, '0']} calls per page, "
+          f"{calls[False, '3600']} across pages")
+
+def check_allow_wins():
+    """An allow rule keeps a case open even where a longer or earlier deny phrase overlaps it"""
+    rules = RuleFilter({
+        'allow': {'phrases': ['invoice', 'demo at acme'], 'domains': ['customer.example']},
+        'deny': {'phrases': ['invoice scam', 'book a demo', 'winner'], 'domains': ['leadgen.example']}
+    })
+    tickets = [
+        {'Subject': 'invoice scam here'},
+        {'Subject': 'Meeting', 'Description': 'book a demo at acme'},
+        {'Subject': 'Question', 'Description': 'about my invoice', 'SuppliedEmail': 'sales@leadgen.example'},
+        {'Subject': 'You are a winner', 'SuppliedEmail': 'buyer@customer.example'},
+        {'Subject': 'You are a winner'},
+        {'Subject': 'Password reset'}
+    ]
+    decisions = rules.evaluate(tickets)
+    expected = {0: False, 1: False, 2: False, 3: False, 4: True}
+    assert {i: is_spam for i, (is_spam, _) in decisions.items()} == expected, decisions
+    print(f"ok  allow wins: {len(decisions)} of {len(tickets)} tickets decided by rules")
+
+CHECKS = [check_close_batches, check_close_gives_up, check_close_interval, check_allow_wins]
+
+if __name__ == "__main__":
+    for check in CHECKS:
+        check()
+    print(f"All {len(CHECKS)} checks passed")
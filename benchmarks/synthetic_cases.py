@@ -0,0 +1,117 @@
+"""
+Synthetic Salesforce Case records for benchmarks
+Subject and description lengths follow long-tailed (log-normal) distributions like real inboxes,
+with a configurable spam ratio and waves of lightly templated copies of the same spam message
+"""
+import random
+from datetime import datetime, timedelta
+
+LEGIT_WORDS = ("need help reset password error blue screen network mouse printer good morning thanks advance "
+               "laptop login issue vpn access email outlook minutes additional context afternoon screen "
+               "account locked install software update license monitor keyboard meeting teams calendar "
+               "shared drive folder permission request ticket urgent broken slow wifi phone headset").split()
+SPAM_WORDS = ("exclusive offer healthcare analytics solution demo webinar discount compliance hipaa platform "
+              "partner growth revenue leads marketing campaign consistent performance clinical patient data "
+              "schedule call introduce team pricing limited time free trial unsubscribe newsletter").split()
+# Senders are picked by case number (not the random stream), so adding them left the generated text unchanged
+CUSTOMER_DOMAINS = ('acme-health.example', 'northwind.example', 'contoso-clinic.example', 'fabrikam.example')
+SPAM_DOMAINS = ('hipaacompliancesolution.example', 'leadgen-pros.example', 'webinar-invites.example')
+WEBMAIL_DOMAINS = ('gmail.example', 'outlook.example')
+WAVE_TEMPLATES = [
+    ("HIPAA compliance solution for {org}",
+     "{greeting} {name}, our HIPAA compliance solution offers consistent performance for {org}. "
+     "Built to help healthcare teams manage patient data and clinical analytics. "
+     "Consider exploring a demo at https://example.com/{slug} - sincerely, {sender}"),
+    ("{greeting}, quick question about {org}",
+     "{greeting} {name}, I wanted to introduce our lead generation platform. Teams like {org} grow revenue "
+     "with our marketing campaigns. Do you have 15 minutes this week? Book at https://example.com/{slug}. {sender}"),
+    ("Exclusive webinar invitation for {org}",
+     "{greeting} {name}, join our exclusive webinar on clinical analytics next Thursday. Seats for {org} "
+     "are limited - reserve yours at https://example.com/{slug}. Best regards, {sender}"),
+]
+
+LOG_LINE = "{date} {level} [worker-{thread}] com.example.{module}.Client - {event} (request {request}, {ms} ms)"
+LOG_EVENTS = ("connection reset by peer", "retrying request", "token refreshed", "sync completed",
+              "timeout waiting for response", "cache miss for key", "record locked, backing off")
+
+def _words(rng, vocabulary, median, sigma, maximum):
+    count = min(maximum, max(1, int(rng.lognormvariate(0, sigma) * median)))
+    return ' '.join(rng.choices(vocabulary, k=count))
+
+def _wave_case(rng, template):
+    slots = {
+        'greeting': rng.choice(['Hi', 'Hello', 'Dear']),
+        'name': f"user{rng.randint(1, 9999)}",
+        'org': rng.choice(['your practice', 'your hospital', 'your team', 'your clinic']),
+        'slug': rng.randint(100, 999),
+        'sender': rng.choice(['Alex', 'Sam', 'Jordan', 'Casey'])
+    }
+    subject, description = template
+    return subject.format(**slots), description.format(**slots)
+
+def _pasted_log(rng, chars):
+    """Application log lines, as pasted into a ticket, up to roughly chars characters"""
+    lines = []
+    size = 0
+    while size < chars:
+        line = LOG_LINE.format(date=f"2025-08-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+                               level=rng.choice(['INFO', 'WARN', 'ERROR']), thread=rng.randint(1, 16),
+                               module=rng.choice(['sync', 'auth', 'mail', 'storage']), event=rng.choice(LOG_EVENTS),
+                               request=rng.randint(10000, 99999), ms=rng.randint(1, 30000))
+        lines.append(line)
+        size += len(line) + 1
+    return '\n'.join(lines)
+
+def _oversized(rng, description, spam):
+    """A huge tail: a pasted log for legitimate tickets, a quoted email thread for spam"""
+    chars = int(min(30000, rng.lognormvariate(0, 0.7) * 8000))
+    if not spam:
+        return f"{description or ''}\n{_pasted_log(rng, chars)}"
+    quoted = '\n'.join('> ' + line for line in (description or '').split('. '))
+    separator = '\n-- earlier message --\n'
+    return f"{description or ''}\n" + separator.join([quoted] * max(1, chars // (len(quoted) + len(separator))))
+
+def sender_domain(i, spam):
+    """A third of senders use webmail; the rest write from their company (or spam vendor) domain"""
+    if i % 3 == 0:
+        return WEBMAIL_DOMAINS[i % len(WEBMAIL_DOMAINS)]
+    domains = SPAM_DOMAINS if spam else CUSTOMER_DOMAINS
+    return domains[i % len(domains)]
+
+def generate_cases(count, spam_ratio=0.3, wave_share=0.5, waves=3, empty_description=0.05, seed=7,
+                   start=datetime(2025, 8, 8), oversized=0.0):
+    """Case records; wave_share of the spam are templated copies from one of `waves` campaigns
+    and an oversized share carry a pasted log or quoted email thread of several thousand characters"""
+    rng = random.Random(seed)
+    # A separate stream, so the other cases come out the same whatever the oversized share
+    oversized_rng = random.Random(seed + 1)
+    templates = [WAVE_TEMPLATES[i % len(WAVE_TEMPLATES)] for i in range(waves)]
+    cases = []
+    for i in range(count):
+        spam = rng.random() < spam_ratio
+        if spam and templates and rng.random() < wave_share:
+            subject, description = _wave_case(rng, rng.choice(templates))
+        elif spam:
+            subject = _words(rng, SPAM_WORDS, 6, 0.4, 20)
+            description = _words(rng, SPAM_WORDS + LEGIT_WORDS[:10], 60, 0.8, 1500)
+        else:
+            subject = _words(rng, LEGIT_WORDS, 5, 0.4, 20)
+            description = _words(rng, LEGIT_WORDS, 40, 1.0, 2000)
+        if rng.random() < empty_description:
+            description = None
+        if oversized and oversized_rng.random() < oversized:
+            description = _oversized(oversized_rng, description, spam)
+
+        modstamp = (start + timedelta(seconds=i)).strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+        cases.append({
+            # 15 ordered characters plus the 3-character suffix of an 18-character Id
+            'Id': f"500{i:012d}AAA",
+            'Subject': subject,
+            'Description': description,
+            'Status': 'New',
+            'SuppliedEmail': f"sender{i}@{sender_domain(i, spam)}",
+            'CreatedDate': modstamp,
+            'SystemModstamp': modstamp,
+            'IsSpam': spam
+        })
+    return cases
@@ -1,37 +1,91 @@
 import os
-import pandas as pd
+import glob
 import json
+import argparse
+import threading
+import pandas as pd
+from itertools import islice
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from simple_salesforce import Salesforce
 
+TRAINING_DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'training-data')
+SHARD_DIR = os.path.join(TRAINING_DATA_DIR, 'shards')
+CHECKPOINT_FILE = os.path.join(TRAINING_DATA_DIR, 'extract_checkpoint.json')
+CASE_QUERY = "SELECT Id, Subject, Description, CreatedDate, Status FROM Case"
+TRAINING_COLUMNS = ['Subject', 'Description', 'is_spam', 'CreatedDate']
+
+def soql_datetime(value):
+    """Format a datetime as a SOQL datetime literal"""
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def parse_created_date(value):
+    """Parse a Salesforce timestamp like 2025-08-08T12:34:56.000+0000"""
+    return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
+
+def created_date_windows(first, last, window_days):
+    """Split [first, last] into consecutive [start, end) windows of window_days"""
+    windows = []
+    start = first.replace(hour=0, minute=0, second=0, microsecond=0)
+    while start <= last:
+        end = start + timedelta(days=window_days)
+        windows.append((soql_datetime(start), soql_datetime(end)))
+        start = end
+    return windows
+
 class SalesforceDataLoader:
     """
     Class for loading and processing Salesforce data for spam training
     """
     
-    def __init__(self):
+    def __init__(self, sf=None):
         load_dotenv()
+        self.sf = sf
+        self._checkpoint_lock = threading.Lock()
     
-    def _load_raw_data(self):
+    def connect(self):
         """
-        Load raw case data from Salesforce
+        Salesforce connection, created on first use
         """
-        try:
-            sf = Salesforce(
+        if self.sf is None:
+            self.sf = Salesforce(
                 username=os.getenv('SF_USERNAME'),
                 password=os.getenv('SF_PASSWORD'),
                 security_token=os.getenv('SF_SECURITY_TOKEN')
             )
             print("Salesforce connection established successfully")
+        return self.sf
+    
+    def _load_raw_data(self, chunk_size=2000, start=None, end=None):
+        """
+        Stream raw case data from Salesforce, one list of records per page
+        Optionally limited to cases created in the [start, end) window
+        """
+        try:
+            sf = self.connect()
 
-            query = "SELECT Id, Subject, Description, CreatedDate, Status FROM Case ORDER BY CreatedDate DESC LIMIT 1000"
-            cases = sf.query_all(query)
+            conditions = []
+            if start:
+                conditions.append(f"CreatedDate >= {start}")
+            if end:
+                conditions.append(f"CreatedDate < {end}")
+            query = CASE_QUERY
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            query += " ORDER BY CreatedDate DESC"
+            records = sf.query_all_iter(query)
             
-            return cases['records']
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if not chunk:
+                    return
+                yield chunk
             
         except Exception as e:
+            # Raised so callers never mistake a failed load for an export with fewer cases
             print(f"Error loading Salesforce data: {e}")
-            return None
+            raise
     
     def _create_dataframe(self, raw_data):
         """
@@ -40,19 +94,32 @@ class SalesforceDataLoader:
         if raw_data is None:
             return None
             
-        df = pd.DataFrame(raw_data)
+        df = pd.DataFrame(raw_data, columns=['Subject', 'Description', 'CreatedDate'])
         
-        df['is_spam'] = ~df['Subject'].str.startswith('Pardot', case=False, na=False)
-        df = df[['Subject', 'Description', 'is_spam']]
+        df['is_spam'] = ~df['Subject'].str.lower().str.startswith('pardot', na=False)
+        # CreatedDate lets incremental training pick up only cases labelled since its last run
+        df = df[TRAINING_COLUMNS]
         
         return df
     
+    def iter_training_data(self):
+        """
+        Yield training dataframes chunk by chunk as Salesforce pages arrive
+        """
+        for raw_chunk in self._load_raw_data():
+            yield self._create_dataframe(raw_chunk)
+    
     def get_training_data(self):
         """
         Load and process Salesforce data for spam model training
         """
-        raw_data = self._load_raw_data()
-        return self._create_dataframe(raw_data)
+        try:
+            chunks = list(self.iter_training_data())
+        except Exception:
+            return None
+        if not chunks:
+            return None
+        return pd.concat(chunks, ignore_index=True)
     
     def save_to_csv(self, df, filename='training_data.csv'):
         """
@@ -62,22 +129,186 @@ class SalesforceDataLoader:
             print("No data to save")
             return False
 
-        training_data_dir = os.path.join(os.path.dirname(__file__), '..', 'training-data')
-        os.makedirs(training_data_dir, exist_ok=True)
+        self.save_chunks_to_csv([df], filename)
+        return True
+    
+    def save_chunks_to_csv(self, chunks, filename='training_data.csv'):
+        """
+        Write dataframe chunks to a CSV in training-data folder, returns rows written
+        The existing CSV is only replaced once every chunk is written and there was at least one row
+        """
+        os.makedirs(TRAINING_DATA_DIR, exist_ok=True)
+        
+        filepath = os.path.join(TRAINING_DATA_DIR, filename)
+        tmp_path = filepath + '.tmp'
+        rows = 0
+        try:
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+                for i, df in enumerate(chunks):
+                    df.to_csv(f, index=False, header=(i == 0))
+                    rows += len(df)
+        except Exception as e:
+            print(f"Training data export failed, keeping the existing {filepath}: {e}")
+            rows = 0
         
-        filepath = os.path.join(training_data_dir, filename)
-        df.to_csv(filepath, index=False)
+        if not rows:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return 0
+        os.replace(tmp_path, filepath)
         print(f"Training data saved to: {filepath}")
-        return True
+        return rows
+    
+    def _created_date_bounds(self):
+        """
+        CreatedDate of the oldest and newest case, or (None, None) when there are none
+        """
+        sf = self.connect()
+        bounds = []
+        for direction in ('ASC', 'DESC'):
+            records = sf.query(f"SELECT CreatedDate FROM Case ORDER BY CreatedDate {direction} LIMIT 1")['records']
+            if not records:
+                return None, None
+            bounds.append(parse_created_date(records[0]['CreatedDate']))
+        return bounds[0], bounds[1]
+    
+    def _load_checkpoint(self, window_days):
+        try:
+            with open(CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if checkpoint.get('window_days') == window_days:
+                return checkpoint
+            print("Checkpoint was written with a different window size, starting over")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Could not read extraction checkpoint: {e}")
+        return None
+    
+    def _save_checkpoint(self, checkpoint):
+        """
+        Write the checkpoint atomically; called from worker threads
+        """
+        with self._checkpoint_lock:
+            tmp_path = CHECKPOINT_FILE + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(checkpoint, f, indent=2)
+            os.replace(tmp_path, CHECKPOINT_FILE)
+    
+    def _shard_path(self, start, end):
+        name = f"cases_{start[:10]}_{end[:10]}.csv"
+        return os.path.join(SHARD_DIR, name)
+    
+    def _extract_window(self, start, end):
+        """
+        Fetch one CreatedDate window into its own CSV shard, returns rows written
+        """
+        path = self._shard_path(start, end)
+        tmp_path = path + '.tmp'
+        rows = 0
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            for i, raw_chunk in enumerate(self._load_raw_data(start=start, end=end)):
+                df = self._create_dataframe(raw_chunk)
+                df.to_csv(f, index=False, header=(i == 0))
+                rows += len(df)
+            if rows == 0:
+                # Windows without cases still get a header, so the shard reads back as an empty frame
+                pd.DataFrame(columns=TRAINING_COLUMNS).to_csv(f, index=False)
+        # A shard only appears under its final name once the whole window is written
+        os.replace(tmp_path, path)
+        return rows
+    
+    def _extract_and_record(self, checkpoint, start, end):
+        """
+        Extract one window and record it in the checkpoint from the worker, so it counts even after Ctrl+C
+        """
+        rows = self._extract_window(start, end)
+        with self._checkpoint_lock:
+            checkpoint['completed'][start] = rows
+        self._save_checkpoint(checkpoint)
+        return rows
+    
+    def extract_windows(self, window_days=30, workers=4, restart=False):
+        """
+        Export every case in CreatedDate windows fetched concurrently, one CSV shard per window
+        Finished windows are recorded in a checkpoint so an interrupted export resumes
+        Returns the number of cases exported, or None while windows are still missing
+        """
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        checkpoint = None if restart else self._load_checkpoint(window_days)
+        
+        if checkpoint is None:
+            first, last = self._created_date_bounds()
+            if first is None:
+                print("No cases to extract")
+                return 0
+            # Cases created after the export starts are left for the next export
+            checkpoint = {
+                'window_days': window_days,
+                'windows': created_date_windows(first, last, window_days),
+                'completed': {}
+            }
+            for stale in glob.glob(os.path.join(SHARD_DIR, 'cases_*.csv*')):
+                os.remove(stale)
+            self._save_checkpoint(checkpoint)
+        
+        remaining = [(start, end) for start, end in checkpoint['windows'] if start not in checkpoint['completed']]
+        print(f"Extracting {len(remaining)} of {len(checkpoint['windows'])} windows of {window_days} days with {workers} workers")
+        
+        failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {executor.submit(self._extract_and_record, checkpoint, start, end): (start, end)
+                       for start, end in remaining}
+            try:
+                for future in as_completed(futures):
+                    start, end = futures[future]
+                    try:
+                        rows = future.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"Window {start} - {end} failed: {e}")
+                        continue
+                    print(f"Window {start[:10]} - {end[:10]}: {rows} cases")
+            except KeyboardInterrupt:
+                # Windows already downloading finish and checkpoint themselves; queued ones are dropped
+                print("Interrupted, finishing the windows in progress; run again to resume")
+                executor.shutdown(cancel_futures=True)
+                raise
+        
+        if failed:
+            print(f"{failed} windows failed; run again to resume")
+            return None
+        return sum(checkpoint['completed'].values())
+    
+    def merge_shards(self, filename='training_data.csv'):
+        """
+        Concatenate the window shards (oldest first) into one training CSV, returns rows written
+        """
+        # Empty windows from earlier versions were written as 0-byte shards
+        shards = [shard for shard in sorted(glob.glob(os.path.join(SHARD_DIR, 'cases_*.csv'))) if os.path.getsize(shard) > 0]
+        chunks = (chunk for shard in shards for chunk in pd.read_csv(shard, chunksize=50000) if len(chunk))
+        # save_chunks_to_csv leaves the destination alone unless a shard has at least one row
+        return self.save_chunks_to_csv(chunks, filename)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract labelled cases from Salesforce for training")
+    parser.add_argument('--windows', action='store_true',
+                        help="Export in CreatedDate windows fetched in parallel, resuming from the checkpoint")
+    parser.add_argument('--window-days', type=int, default=30, help="Size of each CreatedDate window in days")
+    parser.add_argument('--workers', type=int, default=4, help="Windows fetched at the same time")
+    parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and export everything again")
+    args = parser.parse_args()
+    
     print("Starting Salesforce data extraction...")
     
     loader = SalesforceDataLoader()
-    df = loader.get_training_data()
+    if args.windows:
+        extracted = loader.extract_windows(args.window_days, args.workers, args.restart)
+        rows = loader.merge_shards() if extracted else 0
+    else:
+        rows = loader.save_chunks_to_csv(loader.iter_training_data())
     
-    if df is not None:
-        loader.save_to_csv(df)
-        print(f"Pipeline complete. Extracted {len(df)} records.")
+    if rows:
+        print(f"Pipeline complete. Extracted {rows} records.")
     else:
         print("Pipeline failed - no data extracted.")
\ No newline at end of file
@@ -4,18 +4,53 @@ Train a local spam classification model using TF-IDF + Logistic Regression
 For hackathon demo
 """
 import pandas as pd
+import numpy as np
 import pickle
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, accuracy_score
+import json
+import time
+import hashlib
+import argparse
+from itertools import product
+from datetime import datetime
+from joblib import Parallel, delayed
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.model_selection import train_test_split, StratifiedKFold
+from sklearn.metrics import classification_report, accuracy_score, precision_score, f1_score
 import os
+
+MODEL_DIR = './models'
+CANDIDATE_DIR = './models/candidate'  # shadow-mode candidate, see SPAM_SHADOW_MODEL_DIR in the service
+BUNDLE_DIR = './models/spam_model_bundle'
+BUNDLE_FORMAT_VERSION = 1  # keep in sync with services/model_bundle.py
+STREAMING_STATE_FILE = 'streaming_state.json'  # kept next to the model it describes
+MODEL_VERSION_FILE = 'model_version.json'  # keep in sync with services/spam_filter_service.py
+HASHING_FEATURES = 2 ** 18
+SPAM_THRESHOLD = 0.53  # confidence the service needs before closing a case
+LEADERBOARD_FILE = './models/search_leaderboard.csv'
+MIN_PRECISION = 0.95  # --search only picks configurations that close at most 5% legitimate cases
+
+# --search grid: every vectorizer setting is fitted once per fold and shared by all classifier settings
+VECTORIZER_GRID = {
+    'max_features': [1000, 5000, 20000],
+    'ngram_range': [(1, 2), (1, 3)],
+    'sublinear_tf': [False, True]
+}
+CLASSIFIER_GRID = {
+    'C': [0.3, 1.0, 3.0, 10.0],
+    'class_weight': [None, 'balanced']
+}
+CLASSES = np.array(['legitimate', 'spam'])
+
+def default_csv_path():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(script_dir, '..', 'training-data', 'training_data.csv')
+
 def load_training_data(csv_path=None):
     """Load training data from CSV file"""
     if csv_path is None:
         # Default path to training-data folder
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        csv_path = os.path.join(script_dir, '..', 'training-data', 'training_data.csv')
+        csv_path = default_csv_path()
     
     try:
         print(f"Loading training data from {csv_path}...")
@@ -35,21 +70,136 @@ def load_training_data(csv_path=None):
         print("Run 'python models/get_training_data_from_salesforce.py' first to generate the CSV.")
         raise FileNotFoundError(f"Training data file {csv_path} not found")
 
-def preprocess_data(df):
+def preprocess_data(df, verbose=True):
     """Combine text fields and convert labels"""
-    print("Preprocessing data...")
+    if verbose:
+        print("Preprocessing data...")
 
     df['text'] = df['Subject'].fillna('') + ' ' + df['Description'].fillna('')
     df['label'] = df['is_spam'].map({True: 'spam', False: 'legitimate'})
     df['text'] = df['text'].str.strip()
     
-    print(f"Combined text from subject + description")
-    print(f"Converted {df['is_spam'].sum()} True values to 'spam'")
-    print(f"Converted {(~df['is_spam']).sum()} False values to 'legitimate'")
+    if verbose:
+        print(f"Combined text from subject + description")
+        print(f"Converted {df['is_spam'].sum()} True values to 'spam'")
+        print(f"Converted {(~df['is_spam']).sum()} False values to 'legitimate'")
     
     return df
 
-def train_model():
+def iter_training_chunks(csv_path=None, chunksize=50000, since=None):
+    """Stream preprocessed training data from the CSV, optionally only cases created after since"""
+    if csv_path is None:
+        csv_path = default_csv_path()
+    
+    if not os.path.exists(csv_path):
+        print(f"Training data file {csv_path} not found.")
+        raise FileNotFoundError(f"Training data file {csv_path} not found")
+    
+    for df in pd.read_csv(csv_path, chunksize=chunksize):
+        missing_cols = [col for col in ['Subject', 'Description', 'is_spam'] if col not in df.columns]
+        if missing_cols:
+            raise ValueError(f"CSV is missing columns: {missing_cols}")
+        if since and 'CreatedDate' in df.columns:
+            # Salesforce timestamps share one format, so string order is time order
+            df = df[df['CreatedDate'].fillna('') > since]
+        if len(df):
+            yield preprocess_data(df.copy(), verbose=False)
+
+def holdout_mask(df):
+    """Deterministic 20% holdout by text hash, so a row stays on the same side in every run"""
+    return (pd.util.hash_pandas_object(df['text'], index=False) % 5 == 0).to_numpy()
+
+def make_hashing_vectorizer():
+    """Stateless vectorizer for streaming training - nothing to fit, so chunks can be vectorized independently"""
+    return HashingVectorizer(
+        n_features=HASHING_FEATURES,
+        stop_words='english',
+        lowercase=True,
+        ngram_range=(1, 2),
+        alternate_sign=False
+    )
+
+def load_streaming_state(model_dir=MODEL_DIR):
+    try:
+        with open(os.path.join(model_dir, STREAMING_STATE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def train_model_streaming(csv_path=None, epochs=None, chunksize=50000, incremental=False, model_dir=MODEL_DIR):
+    """Train out of core: HashingVectorizer + SGDClassifier.partial_fit over CSV chunks
+    With incremental=True the saved model keeps learning from cases created since the last run"""
+    state = {}
+    since = None
+    if incremental:
+        try:
+            with open(os.path.join(model_dir, 'spam_model.pkl'), 'rb') as f:
+                model = pickle.load(f)
+            with open(os.path.join(model_dir, 'tfidf_vectorizer.pkl'), 'rb') as f:
+                vectorizer = pickle.load(f)
+        except FileNotFoundError:
+            print("No saved model to update. Run with --streaming first.")
+            return False
+        if not isinstance(vectorizer, HashingVectorizer) or not hasattr(model, 'partial_fit'):
+            print("The saved model was not trained in streaming mode. Run with --streaming first.")
+            return False
+        state = load_streaming_state(model_dir)
+        since = state.get('last_created_date')
+        print(f"Updating the streaming model with cases created after {since or 'the beginning'}")
+    else:
+        vectorizer = make_hashing_vectorizer()
+        model = SGDClassifier(loss='log_loss', alpha=1e-5, random_state=42)
+    
+    epochs = epochs or (1 if incremental else 5)
+    trained = 0
+    spam = 0
+    last_created_date = since
+    for epoch in range(epochs):
+        print(f"Epoch {epoch + 1}/{epochs}...")
+        for df in iter_training_chunks(csv_path, chunksize, since):
+            train = df[~holdout_mask(df)]
+            if len(train) == 0:
+                continue
+            model.partial_fit(vectorizer.transform(train['text']), train['label'], classes=CLASSES)
+            if epoch == 0:
+                trained += len(train)
+                spam += int((train['label'] == 'spam').sum())
+                if 'CreatedDate' in df.columns and df['CreatedDate'].notna().any():
+                    newest = df['CreatedDate'].dropna().max()
+                    last_created_date = max(last_created_date or newest, newest)
+    
+    if trained == 0:
+        print("No new training rows found.")
+        return False
+    print(f"Trained on {trained} samples (spam: {spam}, legitimate: {trained - spam})")
+    
+    # Holdout rows are never trained on, so this is the same kind of test split the in-memory mode reports
+    y_test = []
+    y_pred = []
+    for df in iter_training_chunks(csv_path, chunksize, since):
+        test = df[holdout_mask(df)]
+        if len(test):
+            y_test.extend(test['label'])
+            y_pred.extend(model.predict(vectorizer.transform(test['text'])))
+    
+    if y_test:
+        accuracy = accuracy_score(y_test, y_pred)
+        print(f"\nModel accuracy: {accuracy:.2%} on {len(y_test)} holdout samples")
+        print("\nClassification report:")
+        print(classification_report(y_test, y_pred))
+    
+    save_model(model, vectorizer, model_dir)
+    
+    state = {
+        'last_created_date': last_created_date,
+        'samples_trained': state.get('samples_trained', 0) + trained,
+        'updated': datetime.now().isoformat(timespec='seconds')
+    }
+    with open(os.path.join(model_dir, STREAMING_STATE_FILE), 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    return True
+
+def train_model(model_dir=MODEL_DIR):
     """Train the spam classification model"""
     print("Loading training data...")
     df = load_training_data()
@@ -88,15 +238,264 @@ def train_model():
     print("\nClassification report:")
     print(classification_report(y_test, y_pred))
 
+    save_model(model, vectorizer, model_dir)
+
+def save_model(model, vectorizer, model_dir=MODEL_DIR):
+    """Write the pickles and the bundle the service loads"""
     print("\nSaving model...")
-    with open('./models/spam_model.pkl', 'wb') as f:
+    os.makedirs(model_dir, exist_ok=True)
+    with open(os.path.join(model_dir, 'spam_model.pkl'), 'wb') as f:
         pickle.dump(model, f)
     
-    with open('./models/tfidf_vectorizer.pkl', 'wb') as f:
+    with open(os.path.join(model_dir, 'tfidf_vectorizer.pkl'), 'wb') as f:
         pickle.dump(vectorizer, f)
     
-    print("Model saved as spam_model.pkl")
-    print("Vectorizer saved as tfidf_vectorizer.pkl")
+    print(f"Model saved as {os.path.join(model_dir, 'spam_model.pkl')}")
+    print(f"Vectorizer saved as {os.path.join(model_dir, 'tfidf_vectorizer.pkl')}")
+    
+    metadata = export_model_bundle(model, vectorizer, os.path.join(model_dir, 'spam_model_bundle'))
+    write_model_version(model_dir, metadata['model_version'])
+
+def write_model_version(model_dir, model_version):
+    """Record the bundle's version next to the pickles, so both formats report the same model_version
+    The pickles' digest is stored with it; the service ignores the file once the pickles change"""
+    with open(os.path.join(model_dir, 'spam_model.pkl'), 'rb') as f:
+        digest = hashlib.sha256(f.read())
+    with open(os.path.join(model_dir, 'tfidf_vectorizer.pkl'), 'rb') as f:
+        digest.update(f.read())
+    with open(os.path.join(model_dir, MODEL_VERSION_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'model_version': model_version, 'pickle_sha256': digest.hexdigest()}, f, indent=2)
+
+def grid(options):
+    """Every combination of a {name: [values]} grid as a list of dicts"""
+    return [dict(zip(options, values)) for values in product(*options.values())]
+
+def make_vectorizer(params):
+    return TfidfVectorizer(stop_words='english', lowercase=True, **params)
+
+def make_classifier(params):
+    return LogisticRegression(random_state=42, max_iter=1000, **params)
+
+def evaluate_fold(texts, labels, train_index, test_index, vectorizer_params, classifier_grid, keep_models):
+    """Fit one vectorizer on a training fold and score every classifier setting on it"""
+    vectorizer = make_vectorizer(vectorizer_params)
+    X_train = vectorizer.fit_transform(texts[train_index])
+    X_test = vectorizer.transform(texts[test_index])
+    y_train = labels[train_index]
+    y_test = labels[test_index]
+    
+    results = []
+    for classifier_params in classifier_grid:
+        model = make_classifier(classifier_params).fit(X_train, y_train)
+        spam_probs = model.predict_proba(X_test)[:, list(model.classes_).index('spam')]
+        closed = spam_probs > SPAM_THRESHOLD
+        results.append({
+            'accuracy': accuracy_score(y_test, model.classes_[(spam_probs > 0.5).astype(int)]),
+            'precision_at_threshold': precision_score(y_test == 'spam', closed, zero_division=0),
+            'recall_at_threshold': closed[y_test == 'spam'].mean() if (y_test == 'spam').any() else 0.0,
+            'f1_at_threshold': f1_score(y_test == 'spam', closed, zero_division=0),
+            # the fitted artifacts of one fold are kept to measure size and latency afterwards
+            'artifacts': pickle.dumps((model, vectorizer)) if keep_models else None
+        })
+    return vectorizer_params, classifier_grid, results
+
+def measure_latency(artifacts, texts, samples=200):
+    """Median seconds to classify one ticket, the way the service does it"""
+    model, vectorizer = pickle.loads(artifacts)
+    timings = []
+    for text in texts[:samples]:
+        started = time.perf_counter()
+        model.predict_proba(vectorizer.transform([text]))
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings))
+
+def search_hyperparameters(folds=5, jobs=-1, model_dir=MODEL_DIR, min_precision=MIN_PRECISION):
+    """Cross-validated grid search over vectorizer and classifier settings; saves the winner"""
+    df = load_training_data()
+    X_train, X_test, y_train, y_test = train_test_split(
+        df['text'], df['label'], test_size=0.2, random_state=42
+    )
+    texts = X_train.to_numpy()
+    labels = y_train.to_numpy()
+    
+    vectorizer_grid = grid(VECTORIZER_GRID)
+    classifier_grid = grid(CLASSIFIER_GRID)
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=42).split(texts, labels))
+    print(f"\nSearching {len(vectorizer_grid) * len(classifier_grid)} configurations with {folds}-fold "
+          f"cross-validation ({len(vectorizer_grid) * folds} vectorizer fits)...")
+    
+    started = time.perf_counter()
+    fold_results = Parallel(n_jobs=jobs)(
+        delayed(evaluate_fold)(texts, labels, train_index, test_index, vectorizer_params, classifier_grid, fold == 0)
+        for vectorizer_params in vectorizer_grid
+        for fold, (train_index, test_index) in enumerate(splits)
+    )
+    print(f"Search finished in {time.perf_counter() - started:.1f}s")
+    
+    # Average the folds of each (vectorizer, classifier) configuration
+    scores = {}
+    for vectorizer_params, classifier_params, results in fold_results:
+        for params, result in zip(classifier_params, results):
+            key = (repr(vectorizer_params), repr(params))
+            entry = scores.setdefault(key, {'vectorizer': vectorizer_params, 'classifier': params, 'folds': []})
+            entry['folds'].append(result)
+            if result['artifacts'] is not None:
+                entry['artifacts'] = result['artifacts']
+    
+    sample_texts = list(X_test)
+    rows = []
+    for entry in scores.values():
+        folds_scored = entry['folds']
+        rows.append({
+            **{name: str(value) for name, value in entry['vectorizer'].items()},
+            **{name: str(value) for name, value in entry['classifier'].items()},
+            'accuracy': np.mean([r['accuracy'] for r in folds_scored]),
+            'precision_at_threshold': np.mean([r['precision_at_threshold'] for r in folds_scored]),
+            'recall_at_threshold': np.mean([r['recall_at_threshold'] for r in folds_scored]),
+            'f1_at_threshold': np.mean([r['f1_at_threshold'] for r in folds_scored]),
+            'model_bytes': len(entry['artifacts']),
+            'latency_ms': measure_latency(entry['artifacts'], sample_texts) * 1000,
+            'params': (entry['vectorizer'], entry['classifier'])
+        })
+    
+    # Configurations precise enough to close cases come first, best F1 at the threshold (the most spam
+    # caught for the cases wrongly closed) first; the rest follow by precision, ties broken by recall
+    leaderboard = pd.DataFrame(rows)
+    leaderboard['meets_min_precision'] = leaderboard['precision_at_threshold'] >= min_precision
+    leaderboard['rank_score'] = np.where(leaderboard['meets_min_precision'],
+                                         leaderboard['f1_at_threshold'], leaderboard['precision_at_threshold'])
+    leaderboard = leaderboard.sort_values(
+        ['meets_min_precision', 'rank_score', 'recall_at_threshold', 'accuracy', 'latency_ms'],
+        ascending=[False, False, False, False, True]
+    ).drop(columns='rank_score').reset_index(drop=True)
+    leaderboard.index += 1
+    leaderboard.drop(columns='params').to_csv(LEADERBOARD_FILE, index_label='rank')
+    
+    with pd.option_context('display.width', 160, 'display.max_columns', None, 'display.precision', 4):
+        print("\nLeaderboard (top 10):")
+        print(leaderboard.drop(columns='params').head(10))
+    print(f"Full leaderboard saved to {LEADERBOARD_FILE}")
+    
+    if not leaderboard.iloc[0]['meets_min_precision']:
+        print(f"\nNo configuration reaches {min_precision:.0%} precision at the threshold; using the most precise one")
+    vectorizer_params, classifier_params = leaderboard.iloc[0]['params']
+    print(f"\nRetraining the winner: {vectorizer_params} {classifier_params}")
+    vectorizer = make_vectorizer(vectorizer_params)
+    model = make_classifier(classifier_params).fit(vectorizer.fit_transform(X_train), y_train)
+    
+    y_pred = model.predict(vectorizer.transform(X_test))
+    print(f"\nModel accuracy: {accuracy_score(y_test, y_pred):.2%}")
+    print("\nClassification report:")
+    print(classification_report(y_test, y_pred))
+    
+    save_model(model, vectorizer, model_dir)
+
+def export_model_bundle(model, vectorizer, bundle_dir=BUNDLE_DIR):
+    """Write the compact NumPy bundle the service loads without scikit-learn"""
+    if vectorizer.analyzer != 'word' or vectorizer.tokenizer or vectorizer.preprocessor or vectorizer.strip_accents:
+        raise ValueError("Only word analyzers with the default tokenizer/preprocessor can be exported")
+    if len(model.classes_) != 2:
+        raise ValueError("Only binary classifiers can be exported")
+    
+    print(f"\nExporting model bundle to {bundle_dir}...")
+    os.makedirs(bundle_dir, exist_ok=True)
+    
+    # A hashing vectorizer is stateless: only its parameters and the weights per hash bucket are stored
+    hashing = isinstance(vectorizer, HashingVectorizer)
+    coef = np.ascontiguousarray(model.coef_.ravel(), dtype=np.float64)
+    intercept = np.ascontiguousarray(model.intercept_, dtype=np.float64)
+    if hashing:
+        terms = []
+        arrays = {'coef.npy': coef, 'intercept.npy': intercept}
+    else:
+        terms = sorted(vectorizer.vocabulary_)
+        columns = np.array([vectorizer.vocabulary_[term] for term in terms], dtype=np.int32)
+        idf = np.ascontiguousarray(vectorizer.idf_, dtype=np.float64)
+        arrays = {'columns.npy': columns, 'idf.npy': idf, 'coef.npy': coef, 'intercept.npy': intercept}
+    
+    digest = hashlib.sha256('\n'.join(terms).encode('utf-8'))
+    for array in arrays.values():
+        digest.update(array.tobytes())
+    stop_words = vectorizer.get_stop_words()
+    
+    metadata = {
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'model_version': digest.hexdigest()[:12],
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'vectorizer': 'hashing' if hashing else 'tfidf',
+        'classes': [str(c) for c in model.classes_],
+        'n_features': len(coef),
+        'token_pattern': vectorizer.token_pattern,
+        'ngram_range': list(vectorizer.ngram_range),
+        'lowercase': vectorizer.lowercase,
+        'stop_words': sorted(stop_words) if stop_words else [],
+        'norm': vectorizer.norm
+    }
+    if hashing:
+        metadata['alternate_sign'] = vectorizer.alternate_sign
+    else:
+        metadata['sublinear_tf'] = vectorizer.sublinear_tf
+    
+    # Remove the previous metadata first, so a half-written bundle is never picked up
+    metadata_path = os.path.join(bundle_dir, 'metadata.json')
+    if os.path.exists(metadata_path):
+        os.remove(metadata_path)
+    for name in ('vocabulary.txt', 'columns.npy', 'idf.npy'):
+        if hashing and os.path.exists(os.path.join(bundle_dir, name)):
+            os.remove(os.path.join(bundle_dir, name))
+    if not hashing:
+        with open(os.path.join(bundle_dir, 'vocabulary.txt'), 'w', encoding='utf-8', newline='\n') as f:
+            f.write('\n'.join(terms))
+    for name, array in arrays.items():
+        np.save(os.path.join(bundle_dir, name), array)
+    with open(metadata_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+    
+    if hashing:
+        print(f"Model bundle {metadata['model_version']} saved ({len(coef)} hashed features)")
+    else:
+        print(f"Model bundle {metadata['model_version']} saved ({len(terms)} terms)")
+    return metadata
+
+def export_existing_model():
+    """Export the bundle from the pickled model and vectorizer already on disk"""
+    with open('./models/spam_model.pkl', 'rb') as f:
+        model = pickle.load(f)
+    
+    with open('./models/tfidf_vectorizer.pkl', 'rb') as f:
+        vectorizer = pickle.load(f)
+    
+    metadata = export_model_bundle(model, vectorizer)
+    write_model_version(MODEL_DIR, metadata['model_version'])
+    return metadata
 
 if __name__ == "__main__":
-    train_model() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the spam classification model")
+    parser.add_argument('--export-only', action='store_true',
+                        help="Skip training and export the fast-loading bundle from the existing .pkl files")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Train out of core with HashingVectorizer + SGDClassifier over CSV chunks")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Keep training the saved streaming model on cases created since its last run")
+    parser.add_argument('--csv', help="Training CSV (default training-data/training_data.csv)")
+    parser.add_argument('--epochs', type=int, help="Passes over the data (default 5, or 1 with --incremental)")
+    parser.add_argument('--chunksize', type=int, default=50000, help="Rows read from the CSV at a time")
+    parser.add_argument('--search', action='store_true',
+                        help="Cross-validated hyperparameter search on all cores; saves the best model")
+    parser.add_argument('--folds', type=int, default=5, help="Cross-validation folds for --search")
+    parser.add_argument('--jobs', type=int, default=-1, help="Parallel workers for --search (-1 = all cores)")
+    parser.add_argument('--min-precision', type=float, default=MIN_PRECISION,
+                        help="Precision at the threshold a --search winner needs; the best F1 among those wins")
+    parser.add_argument('--candidate', action='store_true',
+                        help=f"Save to {CANDIDATE_DIR} for shadow evaluation instead of replacing the active model")
+    args = parser.parse_args()
+    model_dir = CANDIDATE_DIR if args.candidate else MODEL_DIR
+    
+    if args.export_only:
+        export_existing_model()
+    elif args.search:
+        search_hyperparameters(args.folds, args.jobs, model_dir, args.min_precision)
+    elif args.streaming or args.incremental:
+        train_model_streaming(args.csv, args.epochs, args.chunksize, args.incremental, model_dir)
+    else:
+        train_model(model_dir) 
\ No newline at end of file
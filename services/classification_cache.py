@@ -0,0 +1,101 @@
+"""
+Bounded LRU cache of classification results keyed by normalized ticket text
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+def normalize_text(text):
+    """Lowercase and collapse whitespace - neither changes what the lowercasing TF-IDF model sees"""
+    return ' '.join(text.lower().split())
+
+class ClassificationCache:
+    """LRU map from (model version, normalized text) to (is_spam, confidence, reason)"""
+
+    def __init__(self, max_size=10000, stats=None):
+        self.max_size = max_size
+        self.stats = stats if stats is not None else {}
+        for counter in ('cache_hits', 'cache_misses', 'cache_evictions'):
+            self.stats.setdefault(counter, 0)
+        self.model_version = None
+        self.entries = OrderedDict()
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def set_model_version(self, model_version):
+        """Drop every cached result when a different model is loaded"""
+        with self._lock:
+            if model_version != self.model_version:
+                self.entries.clear()
+                self.model_version = model_version
+                self.dirty = True
+
+    def key(self, text):
+        return hashlib.sha1(f"{self.model_version}\0{normalize_text(text)}".encode('utf-8')).hexdigest()[:20]
+
+    def get(self, text):
+        if self.max_size <= 0:
+            return None
+        key = self.key(text)
+        with self._lock:
+            result = self.entries.get(key)
+            if result is None:
+                self.stats['cache_misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return result
+
+    def put(self, text, result):
+        if self.max_size <= 0:
+            return
+        is_spam, confidence, reason = result
+        key = self.key(text)
+        with self._lock:
+            self.entries[key] = (bool(is_spam), float(confidence), reason)
+            self.entries.move_to_end(key)
+            self.dirty = True
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.stats['cache_evictions'] += 1
+
+    def load(self, path):
+        """Load entries saved by save(); ignored when they belong to another model version"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            print(f"Could not read classification cache: {e}")
+            return 0
+
+        if saved.get('model_version') != self.model_version:
+            print("Classification cache belongs to another model version, starting empty")
+            return 0
+
+        with self._lock:
+            for key, is_spam, confidence, reason in saved.get('entries', [])[-self.max_size:]:
+                self.entries[key] = (is_spam, confidence, reason)
+            self.dirty = False
+        return len(self.entries)
+
+    def save(self, path):
+        """Persist entries (oldest first) atomically"""
+        with self._lock:
+            if not self.dirty:
+                return
+            saved = {
+                'model_version': self.model_version,
+                'entries': [[key, *result] for key, result in self.entries.items()]
+            }
+            self.dirty = False
+        try:
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(saved, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Error saving classification cache: {e}")
@@ -0,0 +1,114 @@
+"""
+Append-only local log of every classification decision, stored in SQLite (WAL mode)
+Closed cases can be audited and reopened without querying Salesforce
+"""
+import sqlite3
+import threading
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS decisions (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    case_id TEXT NOT NULL,
+    text_hash TEXT,
+    model_version TEXT,
+    spam_probability REAL,
+    action TEXT NOT NULL,
+    status TEXT,
+    reason TEXT
+);
+CREATE INDEX IF NOT EXISTS decisions_ts ON decisions (ts);
+CREATE INDEX IF NOT EXISTS decisions_case ON decisions (case_id, id);
+"""
+COLUMNS = ('ts', 'case_id', 'text_hash', 'model_version', 'spam_probability', 'action', 'status', 'reason')
+INSERT = f"INSERT INTO decisions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+def log_timestamp(value=None):
+    """Timestamps are local ISO strings to the second, so they sort and compare as text"""
+    if value is None:
+        return datetime.now().isoformat(timespec='seconds')
+    return datetime.fromisoformat(value).isoformat(timespec='seconds')
+
+class DecisionLog:
+    """Decisions are only ever inserted; a reopen is a new 'reopened' row for the case"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # WAL with synchronous=NORMAL only syncs at checkpoints; a crash can lose the last commits but never corrupts
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def record(self, rows):
+        """Insert decision rows (tuples in COLUMNS order) in one transaction"""
+        if not rows:
+            return 0
+        with self._lock, self.conn:
+            self.conn.executemany(INSERT, rows)
+        return len(rows)
+
+    def _where(self, since=None, until=None, case_id=None, action=None):
+        """WHERE clause and parameters for the query filters"""
+        clauses, params = [], []
+        if since:
+            clauses.append('ts >= ?')
+            params.append(log_timestamp(since))
+        if until:
+            clauses.append('ts < ?')
+            params.append(log_timestamp(until))
+        if case_id:
+            clauses.append('case_id = ?')
+            params.append(case_id)
+        if action:
+            clauses.append('action = ?')
+            params.append(action)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def query(self, since=None, until=None, case_id=None, action=None, limit=None, newest_first=False):
+        """Decisions in [since, until), oldest first; with newest_first the limit keeps the most recent"""
+        where, params = self._where(since, until, case_id, action)
+        sql = 'SELECT * FROM decisions' + where + (' ORDER BY ts DESC, id DESC' if newest_first else ' ORDER BY ts, id')
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def count_by_action(self, since=None, until=None, case_id=None, action=None):
+        """{action: number of decisions} in [since, until)"""
+        where, params = self._where(since, until, case_id, action)
+        with self._lock:
+            return dict(self.conn.execute(f'SELECT action, COUNT(*) FROM decisions{where} GROUP BY action', params).fetchall())
+
+    def closed_cases(self, since, until=None):
+        """Closes in [since, until) that are still each case's latest decision (not reopened or kept since)"""
+        sql = "SELECT * FROM decisions d WHERE d.action = 'closed' AND d.ts >= ?"
+        params = [log_timestamp(since)]
+        if until:
+            sql += " AND d.ts < ?"
+            params.append(log_timestamp(until))
+        sql += " AND d.id = (SELECT MAX(id) FROM decisions WHERE case_id = d.case_id) ORDER BY d.ts, d.id"
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+def audit_report(log, since=None, until=None, case_id=None, action=None, limit=100):
+    """Print the most recent limit decisions matching the filters and a count per action; returns the printed rows
+    Only the printed rows are read; the counts are aggregated by SQLite"""
+    rows = log.query(since=since, until=until, case_id=case_id, action=action, limit=limit, newest_first=True)[::-1]
+    counts = log.count_by_action(since=since, until=until, case_id=case_id, action=action)
+    total = sum(counts.values())
+    for row in rows:
+        probability = f"{row['spam_probability']:.3f}" if row['spam_probability'] is not None else '  -  '
+        print(f"{row['ts']}  {row['case_id']}  {row['action']:<12} {probability}  model {row['model_version']}  {row['reason'] or ''}")
+    if total > len(rows):
+        print(f"... {total - len(rows)} earlier decisions not shown")
+    print(f"\n{total} decisions: " + ', '.join(f"{count} {name}" for name, count in sorted(counts.items())))
+    return rows
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Salesforce REST API
+Serves Case queries and updates from memory so the service can run offline
+"""
+import re
+import json
+import time
+import threading
+import itertools
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+API_PATH = re.compile(r'^/services/data/v[\d.]+/(.*)$')
+SELECT_FIELDS = re.compile(r'SELECT\s+(.*?)\s+FROM\s+Case', re.IGNORECASE | re.DOTALL)
+STATUS_IN = re.compile(r"Status\s+IN\s*\(([^)]*)\)", re.IGNORECASE)
+ID_IN = re.compile(r"\bId\s+IN\s*\(([^)]*)\)", re.IGNORECASE)
+ID_RANGE = re.compile(r"\bId\s*(>=|<)\s*'(\w+)'", re.IGNORECASE)
+DATE_FILTER = re.compile(r'(SystemModstamp|CreatedDate)\s*(>=|<=|>|<)\s*([0-9T:.\-+Z]+)', re.IGNORECASE)
+ORDER_BY = re.compile(r'ORDER\s+BY\s+(\w+)(?:\s+(ASC|DESC))?', re.IGNORECASE)
+LIMIT = re.compile(r'LIMIT\s+(\d+)', re.IGNORECASE)
+
+def _timestamp_key(value):
+    """Compare Salesforce timestamps and SOQL literals to the second"""
+    return (value or '')[:19]
+
+def select_cases(cases, soql):
+    """Evaluate the small subset of SOQL the spam filter sends against Case records"""
+    fields_match = SELECT_FIELDS.search(soql)
+    fields = [f.strip() for f in fields_match.group(1).split(',')] if fields_match else ['Id']
+    records = list(cases)
+
+    status_match = STATUS_IN.search(soql)
+    if status_match:
+        statuses = {s.strip().strip("'\"") for s in status_match.group(1).split(',')}
+        records = [r for r in records if r.get('Status') in statuses]
+
+    id_match = ID_IN.search(soql)
+    if id_match:
+        ids = {s.strip().strip("'\"") for s in id_match.group(1).split(',')}
+        records = [r for r in records if r['Id'] in ids]
+
+    # Plain string order matches SOQL's for 15-character Ids, which sort like base62 numbers
+    for op, bound in ID_RANGE.findall(soql):
+        records = [r for r in records if (r['Id'] >= bound if op == '>=' else r['Id'] < bound)]
+
+    for field, op, literal in DATE_FILTER.findall(soql):
+        bound = _timestamp_key(literal)
+        compare = {'>=': lambda v: v >= bound, '>': lambda v: v > bound,
+                   '<=': lambda v: v <= bound, '<': lambda v: v < bound}[op]
+        records = [r for r in records if compare(_timestamp_key(r.get(field)))]
+
+    order_match = ORDER_BY.search(soql)
+    if order_match:
+        key = order_match.group(1)
+        descending = (order_match.group(2) or '').upper() == 'DESC'
+        records.sort(key=lambda r: (r.get(key) or '', r['Id']), reverse=descending)
+
+    limit_match = LIMIT.search(soql)
+    if limit_match:
+        records = records[:int(limit_match.group(1))]
+
+    return [project_case(r, fields) for r in records]
+
+def project_case(record, fields):
+    """A Case record as the REST API returns it: the queried fields plus attributes"""
+    projected = {'attributes': {'type': 'Case', 'url': f"/services/data/v59.0/sobjects/Case/{record['Id']}"}}
+    for field in fields:
+        projected[field] = record.get(field)
+    return projected
+
+def connect_to(instance_url, token, login_latency=0.0):
+    """simple_salesforce client for a fake server, also from another process
+    login_latency stands in for the username/password login round trip a real org takes"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from simple_salesforce import Salesforce
+
+    class PlainHTTPAdapter(HTTPAdapter):
+        # simple_salesforce always builds https:// URLs; the fake serves plain HTTP
+        def send(self, request, **kwargs):
+            request.url = 'http://' + request.url[len('https://'):]
+            return super().send(request, **kwargs)
+
+    time.sleep(login_latency)
+    session = requests.Session()
+    session.mount(instance_url, PlainHTTPAdapter())
+    return Salesforce(instance_url=instance_url, session_id=token, session=session)
+
+class FakeSalesforceServer:
+    """In-memory Salesforce org serving the REST endpoints the spam filter uses"""
+
+    def __init__(self, cases=None, page_size=2000, latency=0.0, token='fake-session'):
+        self.cases = {case['Id']: dict(case) for case in (cases or [])}
+        self.page_size = page_size
+        self.latency = latency
+        self.token = token
+        self.fail_ids = set()
+        self.request_counts = Counter()
+        self.bytes_sent = 0
+        self._cursors = {}
+        self._cursor_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def instance_url(self):
+        return f"https://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        """Start serving on a free local port in a background thread"""
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def expire_session(self):
+        """Invalidate the current token so the next call gets INVALID_SESSION_ID"""
+        self.token = f"{self.token}-renewed"
+
+    def connect(self):
+        """Return a simple_salesforce client bound to this server"""
+        return connect_to(self.instance_url, self.token)
+
+    # --- request handling -------------------------------------------------
+
+    def _select(self, soql):
+        return select_cases(self.cases.values(), soql)
+
+    def _page(self, cursor_id, records, offset, page_size):
+        page = records[offset:offset + page_size]
+        done = offset + page_size >= len(records)
+        result = {'totalSize': len(records), 'done': done, 'records': page}
+        if not done:
+            locator = f"01gFAKE{cursor_id:06d}-{offset + page_size}"
+            self._cursors[locator] = (cursor_id, records, offset + page_size, page_size)
+            result['nextRecordsUrl'] = f"/services/data/v59.0/query/{locator}"
+        return result
+
+    def _update_case(self, case_id, fields):
+        if case_id not in self.cases:
+            return False, {'statusCode': 'ENTITY_IS_DELETED', 'message': 'entity is deleted', 'fields': []}
+        if case_id in self.fail_ids:
+            return False, {'statusCode': 'UNABLE_TO_LOCK_ROW', 'message': 'unable to obtain exclusive access to this record', 'fields': []}
+        self.cases[case_id].update(fields)
+        self.cases[case_id]['SystemModstamp'] = time.strftime('%Y-%m-%dT%H:%M:%S.000+0000', time.gmtime())
+        return True, None
+
+    def _handle(self, method, path, query, body, headers=None):
+        """Return (status, payload) for one API call"""
+        route = API_PATH.match(path)
+        if not route:
+            return 404, [{'errorCode': 'NOT_FOUND', 'message': path}]
+        resource = route.group(1).rstrip('/')
+
+        with self._lock:
+            if method == 'GET' and resource == 'query':
+                self.request_counts['query'] += 1
+                records = self._select(query.get('q', [''])[0])
+                page_size = self.page_size
+                batch_match = re.search(r'batchSize=(\d+)', (headers or {}).get('Sforce-Query-Options', ''))
+                if batch_match:
+                    page_size = min(page_size, int(batch_match.group(1)))
+                return 200, self._page(next(self._cursor_ids), records, 0, page_size)
+
+            if method == 'GET' and resource.startswith('query/'):
+                self.request_counts['query_more'] += 1
+                cursor = self._cursors.pop(resource.split('/', 1)[1], None)
+                if cursor is None:
+                    return 400, [{'errorCode': 'INVALID_QUERY_LOCATOR', 'message': 'invalid query locator'}]
+                return 200, self._page(*cursor)
+
+            if method == 'PATCH' and resource.startswith('sobjects/Case/'):
+                self.request_counts['case_update'] += 1
+                ok, error = self._update_case(resource.rsplit('/', 1)[1], body)
+                return (204, None) if ok else (400, [{'errorCode': error['statusCode'], 'message': error['message']}])
+
+            if method == 'PATCH' and resource == 'composite/sobjects':
+                self.request_counts['composite_update'] += 1
+                records = body.get('records', [])
+                if len(records) > 200:
+                    return 400, [{'errorCode': 'EXCEEDED_ID_LIMIT', 'message': 'record limit exceeded: 200'}]
+                results = []
+                for record in records:
+                    fields = {k: v for k, v in record.items() if k not in ('attributes', 'id')}
+                    ok, error = self._update_case(record.get('id'), fields)
+                    results.append({'id': record.get('id'), 'success': ok, 'errors': [error] if error else []})
+                return 200, results
+
+        return 404, [{'errorCode': 'NOT_FOUND', 'message': f"{method} {resource} is not supported by the fake"}]
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _dispatch(self, method):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if self.headers.get('Authorization') != f"Bearer {fake.token}":
+                    self._reply(401, [{'errorCode': 'INVALID_SESSION_ID', 'message': 'Session expired or invalid'}])
+                    return
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                url = urlparse(self.path)
+                status, payload = fake._handle(method, url.path, parse_qs(url.query), body, self.headers)
+                self._reply(status, payload)
+
+            def _reply(self, status, payload):
+                data = b'' if payload is None else json.dumps(payload).encode('utf-8')
+                fake.bytes_sent += len(data)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_PATCH(self):
+                self._dispatch('PATCH')
+
+            def log_message(self, format, *args):
+                pass  # Suppress server logs
+
+        return Handler
+
+if __name__ == "__main__":
+    sample_cases = [
+        {'Id': '5000000000000001', 'Subject': 'Limited offer: boost your SEO today', 'Description': 'Click here',
+         'Status': 'New', 'SuppliedEmail': 'promo@example.com', 'SystemModstamp': '2025-08-08T12:00:00.000+0000'},
+        {'Id': '5000000000000002', 'Subject': 'Cannot log in to portal', 'Description': 'Password reset fails',
+         'Status': 'Open', 'SuppliedEmail': 'user@customer.com', 'SystemModstamp': '2025-08-08T12:05:00.000+0000'},
+    ]
+    with FakeSalesforceServer(sample_cases) as server:
+        print(f"Fake Salesforce serving at {server.instance_url} (token: {server.token})")
+        print("Press Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
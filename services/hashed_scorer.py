@@ -0,0 +1,151 @@
+"""
+Hashed scorer for the TF-IDF + logistic regression spam model
+Only builds the n-grams that can be in the vocabulary and scores them as a sparse dot product
+"""
+import re
+from itertools import repeat
+import numpy as np
+
+STOP = -1      # token id of a stop word (dropped before n-grams are formed, like sklearn)
+UNKNOWN = -2   # token id of a token no vocabulary term contains
+
+class HashedScorer:
+    """Scores text against a fitted TF-IDF vocabulary and binary logistic regression"""
+
+    def __init__(self, vocabulary, idf, coef, intercept, classes, token_pattern, ngram_range,
+                 lowercase=True, stop_words=None, norm='l2', sublinear_tf=False):
+        self.classes_ = np.array(classes)
+        self.token_pattern = re.compile(token_pattern) if isinstance(token_pattern, str) else token_pattern
+        self.min_n, self.max_n = ngram_range
+        self.lowercase = lowercase
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+        self.intercept = float(np.ravel(intercept)[0])
+
+        # Every token that occurs in some vocabulary term gets a small integer id; an n-gram is
+        # then keyed by packing its token ids into one integer, so no n-gram strings are built
+        token_ids = {}
+        for term in vocabulary:
+            for token in term.split(' '):
+                token_ids.setdefault(token, len(token_ids))
+        self.id_space = len(token_ids) + 1
+        self.lookup = {word: STOP for word in (stop_words or ())}
+        self.lookup.update(token_ids)
+
+        self.columns = {}
+        self.unigram_columns = np.full(len(token_ids), -1, dtype=np.int64)
+        for term, column in vocabulary.items():
+            tokens = term.split(' ')
+            if len(tokens) == 1:
+                self.unigram_columns[token_ids[term]] = column
+            else:
+                key = 0
+                for token in tokens:
+                    key = key * self.id_space + token_ids[token] + 1
+                self.columns[key] = int(column)
+
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.weights = np.ravel(coef) * self.idf
+        self.n_features = len(self.idf)
+
+    @classmethod
+    def from_model(cls, model, vectorizer):
+        """Build from a fitted TfidfVectorizer/LogisticRegression pair or a model bundle"""
+        stop_words = vectorizer.get_stop_words() if hasattr(vectorizer, 'get_stop_words') else vectorizer.stop_words
+        return cls(
+            vocabulary=vectorizer.vocabulary_,
+            idf=vectorizer.idf_,
+            coef=model.coef_,
+            intercept=model.intercept_,
+            classes=model.classes_,
+            token_pattern=vectorizer.token_pattern,
+            ngram_range=vectorizer.ngram_range,
+            lowercase=vectorizer.lowercase,
+            stop_words=stop_words,
+            norm=vectorizer.norm,
+            sublinear_tf=vectorizer.sublinear_tf
+        )
+
+    def _token_ids(self, texts):
+        """Token ids of all texts back to back, plus the text each token came from"""
+        findall = self.token_pattern.findall
+        get = self.lookup.get
+        ids = []
+        lengths = []
+        for text in texts:
+            tokens = findall(text.lower() if self.lowercase else text)
+            ids.extend(map(get, tokens, repeat(UNKNOWN)))
+            # separator so n-grams never span two texts
+            ids.append(UNKNOWN)
+            lengths.append(len(tokens) + 1)
+
+        ids = np.array(ids, dtype=np.int64)
+        rows = np.repeat(np.arange(len(texts)), lengths)
+        kept = ids != STOP
+        return ids[kept], rows[kept]
+
+    def _hits(self, ids, rows):
+        """(rows, columns) of every vocabulary n-gram occurrence"""
+        known = ids >= 0
+        hit_rows = []
+        hit_columns = []
+
+        if self.min_n == 1:
+            columns = np.full(len(ids), -1, dtype=np.int64)
+            columns[known] = self.unigram_columns[ids[known]]
+            hit_rows.append(rows[columns >= 0])
+            hit_columns.append(columns[columns >= 0])
+
+        for n in range(max(self.min_n, 2), self.max_n + 1):
+            count = len(ids) - n + 1
+            if count <= 0:
+                break
+            # Only windows made entirely of vocabulary tokens can be vocabulary n-grams
+            candidates = np.ones(count, dtype=bool)
+            for offset in range(n):
+                candidates &= known[offset:offset + count]
+            starts = np.flatnonzero(candidates)
+            if len(starts) == 0:
+                continue
+
+            keys = np.zeros(len(starts), dtype=np.int64)
+            for offset in range(n):
+                keys = keys * self.id_space + ids[starts + offset] + 1
+            columns = np.fromiter(map(self.columns.get, keys.tolist(), repeat(-1)), dtype=np.int64, count=len(keys))
+            matched = columns >= 0
+            hit_rows.append(rows[starts[matched]])
+            hit_columns.append(columns[matched])
+
+        if not hit_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(hit_rows), np.concatenate(hit_columns)
+
+    def decision_function(self, texts):
+        """coef . tfidf(text) + intercept for each text"""
+        ids, rows = self._token_ids(texts)
+        hit_rows, hit_columns = self._hits(ids, rows)
+
+        cells, tf = np.unique(hit_rows * self.n_features + hit_columns, return_counts=True)
+        cell_rows = cells // self.n_features
+        cell_columns = cells % self.n_features
+        tf = 1.0 + np.log(tf) if self.sublinear_tf else tf.astype(np.float64)
+
+        # bincount returns integers when there are no hits at all
+        dot = np.bincount(cell_rows, tf * self.weights[cell_columns], minlength=len(texts)).astype(np.float64)
+        if self.norm == 'l2':
+            norms = np.sqrt(np.bincount(cell_rows, (tf * self.idf[cell_columns]) ** 2, minlength=len(texts)))
+            dot = np.divide(dot, norms, out=np.zeros_like(dot), where=norms > 0)
+        elif self.norm == 'l1':
+            norms = np.bincount(cell_rows, np.abs(tf * self.idf[cell_columns]), minlength=len(texts))
+            dot = np.divide(dot, norms, out=np.zeros_like(dot), where=norms > 0)
+        return dot + self.intercept
+
+    def predict_proba(self, texts):
+        """Probabilities in the order of classes_, like LogisticRegression.predict_proba"""
+        positive = 1.0 / (1.0 + np.exp(-self.decision_function(texts)))
+        return np.column_stack([1.0 - positive, positive])
+
+    def max_difference(self, model, vectorizer, texts):
+        """Largest probability difference from the reference model on texts"""
+        reference = model.predict_proba(vectorizer.transform(texts))
+        return float(np.abs(reference - self.predict_proba(texts)).max())
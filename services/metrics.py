@@ -0,0 +1,186 @@
+"""
+Lightweight in-process metrics: counters and fixed-bucket histograms
+Rendered in the Prometheus text format on an optional local /metrics endpoint
+"""
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds; covers a single small vectorize call up to a slow Salesforce round trip
+TIMING_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Spam probability; 0.53 is the service's closing threshold
+PROBABILITY_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.53, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+class Histogram:
+    """Cumulative-bucket histogram; observe_many takes a whole array with one lock acquisition"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_many(self, values):
+        # Imported here so importing metrics doesn't pull NumPy onto the service's startup path
+        import numpy as np
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return
+        slots = np.bincount(np.searchsorted(self.buckets, values, side='left'), minlength=len(self.counts))
+        for i, n in enumerate(slots.tolist()):
+            self.counts[i] += n
+        self.sum += float(values.sum())
+        self.count += int(values.size)
+
+    def bounds(self):
+        """Bucket upper bounds as Prometheus le labels"""
+        return [repr(float(b)) for b in self.buckets] + ['+Inf']
+
+class Metrics:
+    """Registry of labelled counters and histograms, safe to update from worker threads"""
+
+    def __init__(self, prefix='spam_filter'):
+        self.prefix = prefix
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def add_collector(self, collector):
+        """collector() returns {name: number}, exported as gauges (e.g. the service stats dict)"""
+        self.collectors.append(collector)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def _histogram(self, name, labels, buckets):
+        key = (name, _label_key(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        return histogram
+
+    def observe(self, name, value, buckets=TIMING_BUCKETS, **labels):
+        with self._lock:
+            self._histogram(name, labels, buckets).observe(value)
+
+    def observe_many(self, name, values, buckets=TIMING_BUCKETS, **labels):
+        with self._lock:
+            self._histogram(name, labels, buckets).observe_many(values)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the block into the name histogram (seconds)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        """Plain dict of every metric, for JSON logs"""
+        with self._lock:
+            counters = {name + _format_labels(key): value for (name, key), value in self.counters.items()}
+            histograms = {name + _format_labels(key): {'count': h.count, 'sum': round(h.sum, 6)}
+                          for (name, key), h in self.histograms.items()}
+        return {'counters': counters, 'histograms': histograms}
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {self.prefix}_{name} {self.help[name]}")
+                lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+        with self._lock:
+            for (name, key), value in sorted(self.counters.items()):
+                header(name, 'counter')
+                lines.append(f"{self.prefix}_{name}{_format_labels(key)} {value}")
+
+            for (name, key), h in sorted(self.histograms.items()):
+                header(name, 'histogram')
+                cumulative = 0
+                for bound, count in zip(h.bounds(), h.counts):
+                    cumulative += count
+                    lines.append(f"{self.prefix}_{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.prefix}_{name}_sum{_format_labels(key)} {h.sum}")
+                lines.append(f"{self.prefix}_{name}_count{_format_labels(key)} {h.count}")
+
+        for collector in self.collectors:
+            for name, value in collector().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    header(name, 'gauge')
+                    lines.append(f"{self.prefix}_{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+class MetricsServer:
+    """Serves GET /metrics from a daemon thread"""
+
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        self.metrics = metrics
+        from http.server import ThreadingHTTPServer
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _make_handler(self):
+        from http.server import BaseHTTPRequestHandler
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,190 @@
+"""
+Compact spam model bundle for fast service startup
+Scores text with NumPy alone - scikit-learn is only needed to train and export
+
+Bundle layout (written by models/train_spam_model.py):
+    metadata.json    format/model version, vectorizer type, classes and tokenizer settings
+    vocabulary.txt   vocabulary terms, sorted, one per line
+    columns.npy      feature column of each vocabulary term
+    idf.npy          idf weight per feature column
+    coef.npy         logistic regression weights per feature column
+    intercept.npy    logistic regression intercept
+
+Streaming-trained models use a stateless HashingVectorizer, so their bundles only hold
+metadata.json, coef.npy (one weight per hash bucket) and intercept.npy. Scoring those
+needs scikit-learn's murmurhash, which is imported only when such a bundle is loaded.
+"""
+import os
+import re
+import json
+import numpy as np
+
+BUNDLE_FORMAT_VERSION = 1
+
+class SparseRows:
+    """CSR matrix (data, indices, indptr) with the few operations the service needs, in NumPy alone
+    scikit-learn models read it as a dense array"""
+
+    def __init__(self, data, indices, indptr, shape):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = shape
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def _rows(self):
+        return np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+
+    def __matmul__(self, vector):
+        """Matrix-vector product, one value per row"""
+        return np.bincount(self._rows(), self.data * np.asarray(vector)[self.indices], minlength=self.shape[0])
+
+    def multiply(self, factor):
+        """Scale columns by a 1-d or (1, features) factor, or rows by a (rows, 1) one"""
+        factor = np.asarray(factor, dtype=np.float64)
+        if factor.ndim == 2 and factor.shape[1] == 1 and self.shape[1] != 1:
+            scaled = self.data * factor.ravel()[self._rows()]
+        else:
+            scaled = self.data * factor.ravel()[self.indices]
+        return SparseRows(scaled, self.indices, self.indptr, self.shape)
+
+    def power(self, exponent):
+        return SparseRows(self.data ** exponent, self.indices, self.indptr, self.shape)
+
+    def sum(self, axis=1):
+        """Row sums as a (rows, 1) array"""
+        if axis != 1:
+            raise ValueError("SparseRows only sums rows")
+        return np.bincount(self._rows(), self.data, minlength=self.shape[0])[:, None]
+
+    def tocsr(self):
+        return self
+
+    def toarray(self):
+        matrix = np.zeros(self.shape)
+        matrix[self._rows(), self.indices] = self.data
+        return matrix
+
+    def __array__(self, dtype=None, copy=None):
+        matrix = self.toarray()
+        return matrix if dtype is None else matrix.astype(dtype)
+
+class BundleVectorizer:
+    """TF-IDF transform equivalent to the fitted TfidfVectorizer it was exported from"""
+
+    def __init__(self, vocabulary, idf, token_pattern, ngram_range, lowercase=True,
+                 stop_words=None, norm='l2', sublinear_tf=False):
+        self.vocabulary_ = vocabulary
+        self.idf_ = idf
+        self.token_pattern = re.compile(token_pattern)
+        self.ngram_range = tuple(ngram_range)
+        self.lowercase = lowercase
+        self.stop_words = frozenset(stop_words or ())
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+
+    def analyze(self, text):
+        """Tokens and n-grams of text, in the same form as sklearn's word analyzer"""
+        if self.lowercase:
+            text = text.lower()
+        tokens = [t for t in self.token_pattern.findall(text) if t not in self.stop_words]
+
+        min_n, max_n = self.ngram_range
+        grams = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), max_n + 1):
+            grams.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return grams
+
+    def transform(self, texts):
+        """Sparse TF-IDF rows (texts x features) for a list of texts"""
+        vocabulary = self.vocabulary_
+        hit_rows = []
+        hit_columns = []
+        for row, text in enumerate(texts):
+            for gram in self.analyze(text):
+                column = vocabulary.get(gram)
+                if column is not None:
+                    hit_rows.append(row)
+                    hit_columns.append(column)
+
+        # Sorted (row, column) cells with their term counts, as in CSR order
+        n_features = len(self.idf_)
+        cells, tf = np.unique(np.array(hit_rows, dtype=np.int64) * n_features +
+                              np.array(hit_columns, dtype=np.int64), return_counts=True)
+        rows = cells // n_features
+        columns = cells % n_features
+        tf = 1.0 + np.log(tf) if self.sublinear_tf else tf.astype(np.float64)
+        data = tf * self.idf_[columns]
+
+        if self.norm in ('l1', 'l2'):
+            weights = data ** 2 if self.norm == 'l2' else np.abs(data)
+            norms = np.bincount(rows, weights, minlength=len(texts))
+            if self.norm == 'l2':
+                norms = np.sqrt(norms)
+            data /= norms[rows]  # every stored row has a nonzero norm
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(texts)))])
+        return SparseRows(data, columns, indptr, (len(texts), n_features))
+
+class BundleClassifier:
+    """Binary logistic regression scorer matching LogisticRegression.predict_proba"""
+
+    def __init__(self, classes, coef, intercept):
+        self.classes_ = np.array(classes)
+        self.coef_ = coef
+        self.intercept_ = intercept
+
+    def decision_function(self, matrix):
+        return matrix @ self.coef_ + self.intercept_[0]
+
+    def predict_proba(self, matrix):
+        positive = 1.0 / (1.0 + np.exp(-self.decision_function(matrix)))
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, matrix):
+        return self.classes_[(self.decision_function(matrix) > 0).astype(int)]
+
+def load_model_bundle(bundle_dir):
+    """Load a bundle; returns (model, vectorizer, metadata). Arrays are memory-mapped."""
+    with open(os.path.join(bundle_dir, 'metadata.json'), 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+
+    if metadata.get('format_version') != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported model bundle format {metadata.get('format_version')}, "
+                         f"expected {BUNDLE_FORMAT_VERSION}")
+
+    load = lambda name: np.load(os.path.join(bundle_dir, name), mmap_mode='r')
+    model = BundleClassifier(metadata['classes'], load('coef.npy'), load('intercept.npy'))
+
+    if metadata.get('vectorizer', 'tfidf') == 'hashing':
+        from sklearn.feature_extraction.text import HashingVectorizer
+        vectorizer = HashingVectorizer(
+            n_features=metadata['n_features'],
+            token_pattern=metadata['token_pattern'],
+            ngram_range=tuple(metadata['ngram_range']),
+            lowercase=metadata['lowercase'],
+            stop_words=metadata['stop_words'] or None,
+            norm=metadata['norm'],
+            alternate_sign=metadata['alternate_sign']
+        )
+        return model, vectorizer, metadata
+
+    with open(os.path.join(bundle_dir, 'vocabulary.txt'), 'r', encoding='utf-8') as f:
+        terms = f.read().split('\n')
+    columns = np.load(os.path.join(bundle_dir, 'columns.npy'), mmap_mode='r')
+    if len(terms) != len(columns):
+        raise ValueError("Model bundle vocabulary and column table differ in length")
+
+    vectorizer = BundleVectorizer(
+        vocabulary=dict(zip(terms, columns.tolist())),
+        idf=load('idf.npy'),
+        token_pattern=metadata['token_pattern'],
+        ngram_range=metadata['ngram_range'],
+        lowercase=metadata['lowercase'],
+        stop_words=metadata['stop_words'],
+        norm=metadata['norm'],
+        sublinear_tf=metadata['sublinear_tf']
+    )
+    return model, vectorizer, metadata
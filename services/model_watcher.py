@@ -0,0 +1,73 @@
+"""
+Hot model reload: watch the model directory and validate new artifacts before the service uses them
+"""
+import os
+import threading
+import numpy as np
+
+MODEL_FILES = ('spam_model.pkl', 'tfidf_vectorizer.pkl', os.path.join('spam_model_bundle', 'metadata.json'))
+
+def artifact_fingerprint(model_dir):
+    """(mtime, size) of each model artifact, None for missing ones"""
+    fingerprint = []
+    for name in MODEL_FILES:
+        try:
+            stat = os.stat(os.path.join(model_dir, name))
+            fingerprint.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            fingerprint.append(None)
+    return tuple(fingerprint)
+
+def validate_model(model, vectorizer, canaries, threshold, min_accuracy):
+    """Score canned (text, expected label) tickets with a freshly loaded model
+    Returns the canary accuracy, raises ValueError when the model is not fit to serve"""
+    classes = list(getattr(model, 'classes_', []))
+    if 'spam' not in classes:
+        raise ValueError(f"model classes {classes} have no 'spam'")
+    if not canaries:
+        return None
+
+    texts = [text for text, _ in canaries]
+    probs = model.predict_proba(vectorizer.transform(texts))[:, classes.index('spam')]
+    if not np.all(np.isfinite(probs)) or probs.min() < 0 or probs.max() > 1:
+        raise ValueError("model returned invalid probabilities")
+
+    expected = np.array([label == 'spam' for _, label in canaries])
+    accuracy = float(((probs > threshold) == expected).mean())
+    if accuracy < min_accuracy:
+        raise ValueError(f"canary accuracy {accuracy:.0%} is below {min_accuracy:.0%}")
+    return accuracy
+
+class ModelWatcher:
+    """Polls the model directory on a daemon thread and calls on_change once a new set of artifacts has settled"""
+
+    def __init__(self, model_dir, on_change, interval=10.0):
+        self.model_dir = model_dir
+        self.on_change = on_change
+        self.interval = interval
+        self.fingerprint = artifact_fingerprint(model_dir)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='model-watcher', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        seen = self.fingerprint
+        while not self.stopped.wait(self.interval):
+            current = artifact_fingerprint(self.model_dir)
+            if current != seen:
+                # Training writes several files; wait for a poll with no further changes
+                seen = current
+                continue
+            if current != self.fingerprint:
+                # Recorded even when the load fails, so a broken model is not retried until it changes again
+                self.fingerprint = current
+                try:
+                    self.on_change()
+                except Exception as e:
+                    print(f"Error reloading model: {e}")
@@ -0,0 +1,32 @@
+"""
+Adaptive poll scheduling for the spam filter daemon
+"""
+import random
+
+class PollScheduler:
+    """Chooses how long to wait before the next poll from recent activity and API errors"""
+
+    def __init__(self, min_interval=15, max_interval=300, idle_factor=1.5, error_base=5, error_max=600):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_factor = idle_factor
+        self.error_base = error_base
+        self.error_max = error_max
+        self.interval = min_interval
+        self.consecutive_errors = 0
+
+    def next_delay(self, new_tickets, api_error=False):
+        """Seconds to wait after a poll that found new_tickets tickets"""
+        if api_error:
+            # Exponential backoff with jitter so several workers don't retry in lockstep
+            self.consecutive_errors += 1
+            cap = min(self.error_max, self.error_base * 2 ** (self.consecutive_errors - 1))
+            return random.uniform(cap / 2, cap)
+
+        self.consecutive_errors = 0
+        if new_tickets:
+            # Cases are arriving, so poll at the fastest rate
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.idle_factor)
+        return self.interval
@@ -0,0 +1,199 @@
+"""
+Offline replay of recorded Case snapshots in place of the Salesforce connection
+A live run records every Case it fetches (SPAM_RECORD_FILE); ReplaySalesforce serves those snapshots as they
+happen on a replay clock running at the recorded or an accelerated speed, and captures updates to a log
+"""
+import glob
+import json
+import time
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from fake_salesforce import select_cases
+
+MODSTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.000+0000'
+
+def parse_modstamp(value):
+    """Salesforce timestamp like 2025-08-08T12:34:56.000+0000 as a naive UTC datetime"""
+    return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+
+def load_snapshots(patterns):
+    """(time, Case) for every snapshot in the JSONL files (globs allowed), oldest SystemModstamp first"""
+    snapshots = []
+    skipped = 0
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    case = json.loads(line)
+                    if not case.get('Id') or not case.get('SystemModstamp'):
+                        skipped += 1
+                        continue
+                    snapshots.append((parse_modstamp(case['SystemModstamp']), case))
+    if skipped:
+        print(f"Skipped {skipped} snapshots without an Id or SystemModstamp")
+    # Stable, so snapshots of the same second keep their recorded order
+    snapshots.sort(key=lambda snapshot: snapshot[0])
+    return snapshots
+
+class CaseRecorder:
+    """Appends every fetched Case record to a JSONL file, once per (Id, SystemModstamp)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.seen = {}
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def record(self, records):
+        lines = []
+        with self._lock:
+            for record in records:
+                # Polls overlap on the watermark second, so the same snapshot is fetched twice
+                if self.seen.get(record['Id']) == record.get('SystemModstamp'):
+                    continue
+                self.seen[record['Id']] = record.get('SystemModstamp')
+                lines.append(json.dumps({key: value for key, value in record.items() if key != 'attributes'}))
+            if lines:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(lines) + '\n')
+            self.recorded += len(lines)
+        return len(lines)
+
+class ReplayCase:
+    """sf.Case: single-record updates"""
+
+    def __init__(self, replay):
+        self.replay = replay
+
+    def update(self, case_id, fields):
+        ok, error = self.replay.apply_updates([(case_id, fields)], call='update')[0]
+        if not ok:
+            raise ValueError(f"{error['statusCode']}: {error['message']}")
+        return 204
+
+class ReplaySalesforce:
+    """Stands in for simple_salesforce.Salesforce
+    Queries see the snapshots the replay clock has reached, updates change the replayed cases and are
+    appended to capture_path instead of being sent anywhere. speed 0 makes every snapshot visible at once"""
+
+    def __init__(self, paths, speed=1.0, capture_path=None):
+        self.snapshots = load_snapshots(paths)
+        self.speed = speed
+        self.capture_path = capture_path
+        self.cases = {}
+        self.arrived = {}  # case Id -> replay time of its latest snapshot
+        self.position = 0
+        self.drained = False  # a Case poll has run after the last snapshot arrived
+        self.request_counts = Counter()
+        self.captured = 0
+        self.close_lags = []
+        self.Case = ReplayCase(self)
+        self._lock = threading.Lock()
+        self._capture_file = open(capture_path, 'w', encoding='utf-8') if capture_path else None
+        self.origin = self.snapshots[0][0] if self.snapshots else datetime.utcnow()
+        self.end = self.snapshots[-1][0] if self.snapshots else self.origin
+        self.started = time.monotonic()
+
+    def now(self):
+        """Replay time: the first snapshot's time plus the elapsed time scaled by speed"""
+        if not self.speed:
+            return self.end
+        return self.origin + timedelta(seconds=(time.monotonic() - self.started) * self.speed)
+
+    def _advance(self):
+        """Apply the snapshots the clock has reached; a later snapshot replaces the case's state"""
+        now = self.now()
+        while self.position < len(self.snapshots) and self.snapshots[self.position][0] <= now:
+            arrived, case = self.snapshots[self.position]
+            self.cases[case['Id']] = dict(case)
+            self.arrived[case['Id']] = arrived
+            self.position += 1
+        return now
+
+    def query_all_iter(self, query, include_deleted=False, **kwargs):
+        with self._lock:
+            self._advance()
+            self.request_counts['query'] += 1
+            records = select_cases(self.cases.values(), query)
+            if self.position == len(self.snapshots):
+                self.drained = True
+        return iter(records)
+
+    def query_all(self, query, include_deleted=False, **kwargs):
+        with self._lock:
+            self._advance()
+            self.request_counts['query'] += 1
+            records = select_cases(self.cases.values(), query)
+        return {'totalSize': len(records), 'done': True, 'records': records}
+
+    def restful(self, path, params=None, method='GET', **kwargs):
+        if path == 'composite/sobjects' and method == 'PATCH':
+            records = (kwargs.get('json') or {}).get('records', [])
+            if len(records) > 200:
+                raise ValueError("EXCEEDED_ID_LIMIT: record limit exceeded: 200")
+            updates = [(record.get('id'), {k: v for k, v in record.items() if k not in ('attributes', 'id')})
+                       for record in records]
+            return [{'id': case_id, 'success': ok, 'errors': [error] if error else []}
+                    for (case_id, _), (ok, error) in zip(updates, self.apply_updates(updates, call='composite_update'))]
+        raise ValueError(f"{method} {path} is not supported by the replay")
+
+    def apply_updates(self, updates, call):
+        """Apply (case Id, fields) updates and capture them; returns (ok, error) per update"""
+        results = []
+        entries = []
+        with self._lock:
+            now = self._advance()
+            self.request_counts[call] += 1
+            for case_id, fields in updates:
+                case = self.cases.get(case_id)
+                if case is None:
+                    results.append((False, {'statusCode': 'ENTITY_IS_DELETED', 'message': 'entity is deleted', 'fields': []}))
+                    continue
+                case.update(fields)
+                case['SystemModstamp'] = now.strftime(MODSTAMP_FORMAT)
+                # How far behind the recorded traffic the service acted (meaningless when replaying at max speed)
+                lag = (now - self.arrived[case_id]).total_seconds() if self.speed else None
+                if fields.get('Status') == 'Closed' and lag is not None:
+                    self.close_lags.append(lag)
+                entries.append({'replay_time': case['SystemModstamp'], 'case_id': case_id, 'call': call,
+                                'lag_s': None if lag is None else round(lag, 3), 'fields': fields})
+                results.append((True, None))
+            self.captured += len(entries)
+            if self._capture_file is not None and entries:
+                self._capture_file.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+                self._capture_file.flush()
+        return results
+
+    def summary(self):
+        lags = sorted(self.close_lags)
+        return {
+            'snapshots': len(self.snapshots),
+            'replayed': self.position,
+            'cases': len(self.cases),
+            'elapsed_s': round(time.monotonic() - self.started, 3),
+            'replay_span_s': (self.end - self.origin).total_seconds(),
+            'captured': self.captured,
+            'close_lag_p50_s': round(lags[len(lags) // 2], 3) if lags else None,
+            'close_lag_p99_s': round(lags[min(len(lags) - 1, int(len(lags) * 0.99))], 3) if lags else None,
+            'requests': dict(self.request_counts)
+        }
+
+    def report(self):
+        """Print what was replayed and how far closes lagged behind the recorded traffic"""
+        summary = self.summary()
+        speed = f"{self.speed:g}x" if self.speed else "max"
+        print(f"\nReplayed {summary['replayed']} of {summary['snapshots']} snapshots ({summary['cases']} cases, "
+              f"{summary['replay_span_s']:.0f}s of recorded traffic) in {summary['elapsed_s']:.1f}s at {speed} speed")
+        print(f"Captured {summary['captured']} updates" + (f" to {self.capture_path}" if self.capture_path else ""))
+        if summary['close_lag_p50_s'] is not None:
+            real = f" ({summary['close_lag_p50_s'] / self.speed:.2f}s and {summary['close_lag_p99_s'] / self.speed:.2f}s real)"
+            print(f"Close lag behind the recording: p50 {summary['close_lag_p50_s']:.1f}s, p99 {summary['close_lag_p99_s']:.1f}s{real}")
+        return summary
+
+    def close(self):
+        if self._capture_file is not None:
+            self._capture_file.close()
+            self._capture_file = None
@@ -0,0 +1,116 @@
+"""
+Rule stage ahead of the ML model: sender domain, subject prefix and phrase allow/deny lists
+Subject prefixes and phrases are compiled into one trie-shaped regular expression per action that is run
+once over a whole batch; sender domains are looked up in a dict, which stays O(1) however long the lists get
+"""
+import re
+import json
+from bisect import bisect_right
+from itertools import accumulate
+from collections import Counter
+
+RULE_KINDS = {'domains': 'domain', 'subject_prefixes': 'subject prefix', 'phrases': 'phrase'}
+# Used when no rules file is configured: the original hard-coded 'perdot' pre-filter
+DEFAULT_RULES = {'allow': {'subject_prefixes': ['perdot']}}
+
+# Each ticket becomes SUBJECT subject BODY description, so prefix rules can be anchored to the subject
+SUBJECT, BODY = '\x1d', '\x1f'
+# Markers are blanked out of the fields themselves, so a description can't fake a subject
+CLEAN_FIELD = str.maketrans({SUBJECT: ' ', BODY: ' '})
+
+def sender_domain(email):
+    if not email or '@' not in email:
+        return ''
+    return email.rsplit('@', 1)[1].strip()
+
+def trie_regex(node):
+    """Regex for a trie node {'children': {char: node}, 'rule': rule number or None}
+    Shared prefixes are matched once and an empty named group where a literal ends tells which rule matched"""
+    branches = [re.escape(char) + trie_regex(child) for char, child in sorted(node['children'].items())]
+    # Longer literals are tried before the one ending here
+    if node['rule'] is not None:
+        branches.append(f"(?P<r{node['rule']}>)")
+    return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+class RuleFilter:
+    """Allow rules keep a case open, deny rules close it as spam; allow wins when both match"""
+
+    def __init__(self, rules, metrics=None):
+        self.metrics = metrics
+        self.rules = []  # (action, kind, value) by rule number
+        self.domains = {}  # lowercased domain -> rule number
+        # One trie per action: regex matches don't overlap, so a shared one could hide an allow behind a deny
+        self.patterns = {}
+        for action in ('allow', 'deny'):
+            root = {'children': {}, 'rule': None}
+            for kind in RULE_KINDS:
+                for value in filter(None, rules.get(action, {}).get(kind, [])):
+                    rule = len(self.rules)
+                    self.rules.append((action, kind, value))
+                    # A duplicate keeps its first (allow) rule
+                    if kind == 'domains':
+                        self.domains.setdefault(value.lower(), rule)
+                        continue
+                    node = root
+                    for char in (SUBJECT if kind == 'subject_prefixes' else '') + value.lower():
+                        node = node['children'].setdefault(char, {'children': {}, 'rule': None})
+                    if node['rule'] is None:
+                        node['rule'] = rule
+            if root['children']:
+                self.patterns[action] = re.compile(trie_regex(root))
+        self.hits = Counter()
+
+    @classmethod
+    def from_file(cls, path, metrics=None):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f), metrics=metrics)
+
+    def rule_name(self, rule):
+        action, kind, value = self.rules[rule]
+        return f"{action} {RULE_KINDS[kind]} '{value}'"
+
+    def evaluate(self, tickets):
+        """{ticket index: (is_spam, reason)} for the tickets a rule decides"""
+        matched = {}
+        if self.domains:
+            for i, ticket in enumerate(tickets):
+                # The sender's domain or the closest parent domain with a rule
+                domain = sender_domain(ticket.get('SuppliedEmail')).lower()
+                while domain:
+                    rule = self.domains.get(domain)
+                    if rule is not None:
+                        matched[i] = rule
+                        break
+                    domain = domain.partition('.')[2]
+
+        if self.patterns and tickets:
+            # Lowercased per record: lowercasing can change a string's length, and the offsets must match
+            records = [f"{SUBJECT}{(t.get('Subject') or '').translate(CLEAN_FIELD)}"
+                       f"{BODY}{(t.get('Description') or '').translate(CLEAN_FIELD)}".lower() for t in tickets]
+
+            # Allow runs first and may override a deny domain; deny only scans tickets nothing matched yet
+            for action, pattern in self.patterns.items():
+                if action == 'allow':
+                    indices = [i for i in range(len(tickets)) if matched.get(i) is None or self.rules[matched[i]][0] == 'deny']
+                else:
+                    indices = [i for i in range(len(tickets)) if i not in matched]
+                if not indices:
+                    continue
+                starts = list(accumulate((len(records[i]) for i in indices[:-1]), initial=0))
+                for match in pattern.finditer(''.join(records[i] for i in indices)):
+                    ticket = indices[bisect_right(starts, match.start()) - 1]
+                    rule = int(match.lastgroup[1:])
+                    # The first match of the pass decides; an allow pass replaces a deny domain
+                    if ticket not in matched or self.rules[matched[ticket]][0] != action:
+                        matched[ticket] = rule
+
+        decisions = {}
+        for ticket, rule in matched.items():
+            self.hits[rule] += 1
+            if self.metrics is not None:
+                self.metrics.inc('rule_hits_total', rule=self.rule_name(rule))
+            decisions[ticket] = (self.rules[rule][0] == 'deny', f"Rule: {self.rule_name(rule)}")
+        return decisions
+
+    def top_hits(self, limit=5):
+        return [(self.rule_name(rule), count) for rule, count in self.hits.most_common(limit)]
@@ -0,0 +1,189 @@
+"""
+Shadow-mode evaluation of a candidate spam model next to the active one
+The candidate scores the same batches on a background thread, never closes anything,
+and every disagreement is written to a compact JSON-lines log
+"""
+import json
+import time
+import queue
+import threading
+from datetime import datetime
+import numpy as np
+
+def _stop_words(vectorizer):
+    if hasattr(vectorizer, 'get_stop_words'):
+        return frozenset(vectorizer.get_stop_words() or ())
+    return frozenset(getattr(vectorizer, 'stop_words', None) or ())
+
+def _pattern(vectorizer):
+    pattern = getattr(vectorizer, 'token_pattern', None)
+    return getattr(pattern, 'pattern', pattern)
+
+def shared_features(active, candidate):
+    """How the candidate can reuse the active model's TF-IDF rows instead of tokenizing again
+    'same' when the vectorizers are equivalent, 'rescale' when only the idf weights differ
+    (l2-normalized rows can be re-weighted column by column), otherwise None"""
+    if not all(hasattr(v, 'vocabulary_') and hasattr(v, 'idf_') for v in (active, candidate)):
+        return None
+    settings = ('lowercase', 'norm', 'sublinear_tf')
+    if any(getattr(active, name, None) != getattr(candidate, name, None) for name in settings):
+        return None
+    if tuple(active.ngram_range) != tuple(candidate.ngram_range) or _pattern(active) != _pattern(candidate):
+        return None
+    if _stop_words(active) != _stop_words(candidate) or active.vocabulary_ != candidate.vocabulary_:
+        return None
+    if np.array_equal(np.asarray(active.idf_), np.asarray(candidate.idf_)):
+        return 'same'
+    return 'rescale' if active.norm == 'l2' else None
+
+def rescale_rows(features, ratio):
+    """Multiply columns by ratio and re-normalize rows to unit l2 length (dense, scipy sparse or bundle SparseRows)"""
+    if hasattr(features, 'multiply'):
+        scaled = features.multiply(ratio).tocsr()
+        norms = np.sqrt(np.asarray(scaled.power(2).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return scaled.multiply(1.0 / norms[:, None]).tocsr()
+    scaled = features * ratio
+    norms = np.linalg.norm(scaled, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return scaled / norms
+
+class ShadowEvaluator:
+    """Scores batches with a candidate model on a worker thread and logs where it disagrees with the active model"""
+
+    def __init__(self, model, vectorizer, model_version, active_vectorizer, active_version, threshold,
+                 log_path, max_pending=8, metrics=None):
+        self.model = model
+        self.vectorizer = vectorizer
+        self.model_version = model_version
+        self.threshold = threshold
+        self.log_path = log_path
+        self.metrics = metrics
+        self.spam_column = list(model.classes_).index('spam')
+        self.set_active(active_vectorizer, active_version)
+        self.dropped = 0
+        self.jobs = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._run, name='shadow', daemon=True)
+        self.thread.start()
+
+    def set_active(self, active_vectorizer, active_version):
+        """Compare against a newly loaded active model; batches already queued keep the features they came with"""
+        share = shared_features(active_vectorizer, self.vectorizer)
+        idf_ratio = None
+        if share == 'rescale':
+            idf_ratio = np.asarray(self.vectorizer.idf_) / np.asarray(active_vectorizer.idf_)
+        self.share, self.idf_ratio, self.active_version = share, idf_ratio, active_version
+
+    def submit(self, ticket_ids, texts, active_probs, active_seconds, features=None):
+        """Queue a scored batch for the candidate; drops it rather than block when the worker is behind"""
+        job = (ticket_ids, texts, np.asarray(active_probs, dtype=np.float64), active_seconds,
+               features if self.share else None, self.share, self.idf_ratio, self.active_version)
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            self.dropped += 1
+
+    def wait_idle(self, timeout=30.0):
+        """Wait until every submitted batch has been scored and logged"""
+        deadline = time.monotonic() + timeout
+        while self.jobs.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.jobs.unfinished_tasks == 0
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                self._evaluate(*job)
+            except Exception as e:
+                print(f"Error scoring shadow batch: {e}")
+            finally:
+                self.jobs.task_done()
+
+    def _evaluate(self, ticket_ids, texts, active_probs, active_seconds, features, share, idf_ratio, active_version):
+        started = time.perf_counter()
+        if features is not None and share == 'same':
+            matrix = features
+        elif features is not None and share == 'rescale':
+            matrix = rescale_rows(features, idf_ratio)
+        else:
+            matrix = self.vectorizer.transform(texts)
+        probs = self.model.predict_proba(matrix)[:, self.spam_column]
+        seconds = time.perf_counter() - started
+
+        active_close = active_probs > self.threshold
+        candidate_close = probs > self.threshold
+        disagreements = np.flatnonzero(active_close != candidate_close)
+
+        now = datetime.now().isoformat(timespec='seconds')
+        lines = [json.dumps({
+            'type': 'batch', 'ts': now, 'active': active_version, 'candidate': self.model_version,
+            'tickets': len(texts), 'disagreements': len(disagreements),
+            'active_ms': round(active_seconds * 1000, 3), 'candidate_ms': round(seconds * 1000, 3),
+            'shared_features': features is not None,
+            'mean_abs_diff': round(float(np.abs(probs - active_probs).mean()), 6) if len(texts) else 0.0,
+            'dropped': self.dropped
+        })]
+        lines += [json.dumps({'type': 'disagreement', 'ts': now, 'id': ticket_ids[i],
+                              'active_prob': round(float(active_probs[i]), 4),
+                              'candidate_prob': round(float(probs[i]), 4)})
+                  for i in disagreements]
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        if self.metrics is not None:
+            self.metrics.observe('shadow_predict_seconds', seconds)
+            self.metrics.inc('shadow_tickets_total', len(texts))
+            self.metrics.inc('shadow_disagreements_total', len(disagreements))
+
+def shadow_report(log_path, threshold, examples=10):
+    """Print a summary of a shadow log per (active, candidate) pair; returns the summaries"""
+    summaries = {}
+    recent = {}
+    try:
+        with open(log_path, 'r', encoding='utf-8') as f:
+            pair = None
+            for line in f:
+                entry = json.loads(line)
+                if entry['type'] == 'batch':
+                    pair = (entry['active'], entry['candidate'])
+                    summary = summaries.setdefault(pair, {
+                        'batches': 0, 'tickets': 0, 'disagreements': 0, 'candidate_closes_more': 0,
+                        'candidate_closes_less': 0, 'active_ms': 0.0, 'candidate_ms': 0.0,
+                        'shared_batches': 0, 'abs_diff_sum': 0.0, 'dropped': 0, 'first': entry['ts']})
+                    summary['batches'] += 1
+                    summary['tickets'] += entry['tickets']
+                    summary['disagreements'] += entry['disagreements']
+                    summary['active_ms'] += entry['active_ms']
+                    summary['candidate_ms'] += entry['candidate_ms']
+                    summary['shared_batches'] += entry['shared_features']
+                    summary['abs_diff_sum'] += entry['mean_abs_diff'] * entry['tickets']
+                    summary['dropped'] = max(summary['dropped'], entry['dropped'])
+                    summary['last'] = entry['ts']
+                elif entry['type'] == 'disagreement' and pair is not None:
+                    # Disagreement lines follow their batch line
+                    if entry['candidate_prob'] > threshold:
+                        summaries[pair]['candidate_closes_more'] += 1
+                    else:
+                        summaries[pair]['candidate_closes_less'] += 1
+                    recent.setdefault(pair, []).append(entry)
+    except FileNotFoundError:
+        print(f"No shadow log at {log_path}")
+        return {}
+
+    for (active, candidate), summary in summaries.items():
+        tickets = max(summary['tickets'], 1)
+        print(f"\nCandidate {candidate} vs active {active} ({summary['first']} - {summary['last']})")
+        print(f"  Tickets compared: {summary['tickets']} in {summary['batches']} batches")
+        print(f"  Disagreements: {summary['disagreements']} ({summary['disagreements'] / tickets:.2%})")
+        print(f"    candidate would close, active kept: {summary['candidate_closes_more']}")
+        print(f"    candidate would keep, active closed: {summary['candidate_closes_less']}")
+        print(f"  Mean spam probability difference: {summary['abs_diff_sum'] / tickets:.4f}")
+        print(f"  Latency per ticket: active {summary['active_ms'] / tickets:.4f} ms, "
+              f"candidate {summary['candidate_ms'] / tickets:.4f} ms "
+              f"(shared features in {summary['shared_batches']} of {summary['batches']} batches)")
+        if summary['dropped']:
+            print(f"  Batches dropped because the shadow worker was behind: {summary['dropped']}")
+        for entry in recent.get((active, candidate), [])[-examples:]:
+            print(f"    {entry['id']}: active {entry['active_prob']:.3f} -> candidate {entry['candidate_prob']:.3f}")
+    return summaries
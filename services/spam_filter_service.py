@@ -3,48 +3,417 @@
 AI Spam Filter Service for Salesforce Cases
 Hackathon Demo Version
 """
-import os
 import time
+MODULE_STARTED = time.perf_counter()
+import os
+import io
+import sys
 import json
-import pickle
+import queue
+import zlib
+import hashlib
+import argparse
+import threading
+from itertools import islice
 from datetime import datetime
 from dotenv import load_dotenv
-from simple_salesforce import Salesforce
+from poll_scheduler import PollScheduler
+from metrics import Metrics, PROBABILITY_BUCKETS
+from classification_cache import ClassificationCache, normalize_text
+from rule_filter import RuleFilter, DEFAULT_RULES
+from decision_log import DecisionLog, audit_report, log_timestamp
+# Heavy or optional modules (simple_salesforce, requests, NumPy and the model bundle, profiling, waves,
+# shadow mode, hot reload) are imported where they are first needed, so they don't delay startup
+MODULE_IMPORTED = time.perf_counter()
+
+CASE_FIELDS = "Id, Subject, Description, Status, SuppliedEmail, SystemModstamp"
+# What the poll query fetches and how many description characters the model scores (None: all of them).
+# SOQL can't truncate a long text field, so only 'subject' saves transfer: it leaves Description out of the query
+FETCH_PROFILES = {
+    'full': {'fields': CASE_FIELDS, 'description_chars': None},
+    'capped': {'fields': CASE_FIELDS, 'description_chars': 2000},
+    'subject': {'fields': "Id, Subject, Status, SuppliedEmail, SystemModstamp", 'description_chars': 0}
+}
+FULL_TEXT_MARGIN = 0.05  # capped scores this close to the threshold are redone on the full text
+FULL_TEXT_BATCH = 200  # case Ids per full description query, well inside the SOQL query length limit
+CLOSE_BATCH_LIMIT = 200  # sObject Collections accepts at most 200 records per call
+QUERY_PAGE_SIZE = 2000  # Salesforce's default (and maximum) query batch size
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_DIR = os.path.join(REPO_DIR, 'models')  # next to services/, wherever the service is started from
+MODEL_VERSION_FILE = 'model_version.json'  # written by models/train_spam_model.py next to the pickles
+CANARY_FILE = os.path.join(MODEL_DIR, 'canary_tickets.json')  # canned tickets a reloaded model must still classify correctly
+SHADOW_LOG = './shadow_log.jsonl'
+DECISION_LOG = './spam_decisions.db'
+SPAM_THRESHOLD = 0.53  # confidence a spam prediction needs before the case is closed
+HASHED_SCORER_TOLERANCE = 1e-9  # max probability difference from the TF-IDF model
+CLASSIFIED_LIMIT = 200000  # text hashes kept in the poll state; the least recently classified are dropped first
+STATE_SAVE_INTERVAL = 5  # seconds between poll state saves within a check; it is always saved at the end
+CLOSE_MAX_ATTEMPTS = 5  # polls a failing close is retried before the watermark moves past it
+
+def ticket_text(ticket, description_chars=None):
+    """Build the text the model scores from a Case record, with at most description_chars of its description"""
+    description = ticket.get('Description', '') or ''
+    if description_chars is not None:
+        description = description[:description_chars]
+    return f"{ticket.get('Subject', 'No Subject')} {description}"
+
+def is_capped(ticket, description_chars):
+    """Whether the model saw less than the full description (or none of an unfetched one)"""
+    if description_chars is None:
+        return False
+    if 'Description' not in ticket:
+        return True
+    return len(ticket['Description'] or '') > description_chars
+
+def ticket_text_hash(ticket):
+    """Short stable hash of a ticket's classified text"""
+    return hashlib.sha1(ticket_text(ticket).encode('utf-8')).hexdigest()[:16]
+
+def load_model_artifacts(model_dir, model_format='auto'):
+    """Load (model, vectorizer, model_version) from a model directory
+    auto uses the fast NumPy bundle when it has been exported, otherwise the pickles"""
+    from model_bundle import load_model_bundle
+    bundle_dir = os.path.join(model_dir, 'spam_model_bundle')
+    bundle_exists = os.path.exists(os.path.join(bundle_dir, 'metadata.json'))
+    
+    if model_format == 'bundle' or (model_format == 'auto' and bundle_exists):
+        try:
+            model, vectorizer, metadata = load_model_bundle(bundle_dir)
+            return model, vectorizer, metadata['model_version']
+        except Exception as e:
+            if model_format == 'bundle':
+                raise
+            print(f"Error loading model bundle: {e}")
+            print("Falling back to pickled model...")
+    
+    import pickle
+    with open(os.path.join(model_dir, 'spam_model.pkl'), 'rb') as f:
+        model_bytes = f.read()
+    with open(os.path.join(model_dir, 'tfidf_vectorizer.pkl'), 'rb') as f:
+        vectorizer_bytes = f.read()
+    
+    digest = hashlib.sha256(model_bytes + vectorizer_bytes).hexdigest()
+    model_version = digest[:12]
+    try:
+        # Training records the bundle's version next to the pickles it was exported from
+        with open(os.path.join(model_dir, MODEL_VERSION_FILE), 'r', encoding='utf-8') as f:
+            recorded = json.load(f)
+        if recorded.get('pickle_sha256') == digest:
+            model_version = recorded['model_version']
+    except (OSError, ValueError, KeyError):
+        pass
+    return pickle.loads(model_bytes), pickle.loads(vectorizer_bytes), model_version
+
+def shard_of(case_id, shards):
+    """Deterministic shard of a case Id, stable across processes and runs"""
+    return zlib.crc32(case_id.encode('utf-8')) % shards
+
+def soql_datetime(modstamp):
+    """Convert a Salesforce timestamp like 2025-08-08T12:34:56.000+0000 to a SOQL literal"""
+    return modstamp[:19] + 'Z'
+
+def chunked(iterable, size):
+    """Yield lists of up to size items from iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def prefetch(iterable, depth=1):
+    """Iterate over iterable while a background thread fetches up to depth items ahead"""
+    buffer = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+    
+    def producer():
+        try:
+            for item in iterable:
+                while not stopped.is_set():
+                    try:
+                        buffer.put(('item', item), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stopped.is_set():
+                    return
+            buffer.put(('done', None))
+        except Exception as e:
+            buffer.put(('error', e))
+    
+    threading.Thread(target=producer, daemon=True).start()
+    try:
+        while True:
+            kind, item = buffer.get()
+            if kind == 'done':
+                return
+            if kind == 'error':
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+class BackgroundCall:
+    """Run fn(*args) on a daemon thread; result() waits for it and returns its value or raises its error"""
+
+    def __init__(self, fn, *args):
+        self.value = None
+        self.error = None
+        self.seconds = None
+        self.thread = threading.Thread(target=self._run, args=(fn, args), name='background-call', daemon=True)
+        self.thread.start()
+
+    def _run(self, fn, args):
+        started = time.perf_counter()
+        try:
+            self.value = fn(*args)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.seconds = time.perf_counter() - started
+
+    def result(self):
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
 
 class SpamFilterService:
-    def __init__(self):
+    def __init__(self, sf=None, sf_factory=None, model=None):
+        init_started = time.perf_counter()
         print("Initializing AI Spam Filter...")
         
         # Load environment variables
         load_dotenv()
         
+        # The model loads on a background thread while the Salesforce login runs
+        self.startup = {'imports': MODULE_IMPORTED - MODULE_STARTED}
+        self.startup_profile = False
+        model_loader = None
+        if model is None:
+            model_loader = BackgroundCall(load_model_artifacts, MODEL_DIR, os.getenv('SPAM_MODEL_FORMAT', 'auto'))
+        
         # Initialize stats tracking
         self.stats = {
             'total_processed': 0,
             'spam_closed': 0,
             'legitimate_kept': 0,
+            'skipped_unchanged': 0,
+            'close_failed': 0,
+            'close_given_up': 0,
+            'close_batches': 0,
+            'polls': 0,
+            'api_errors': 0,
+            'reconnects': 0,
+            'cache_hits': 0,
+            'cache_misses': 0,
+            'cache_evictions': 0,
+            'model_scored': 0,
+            'full_text_rescored': 0,
+            'full_text_flipped': 0,
+            'wave_matched': 0,
+            'rule_allowed': 0,
+            'rule_denied': 0,
+            'model_version': None,
+            'model_reloads': 0,
+            'model_reload_failures': 0,
+            'model_rollbacks': 0,
             'start_time': datetime.now().isoformat()
         }
         
-        # Connect to Salesforce
-        if not self.initialize_salesforce_connection():
+        # Timing histograms and API counters, served on /metrics when SPAM_METRICS_PORT is set
+        self.metrics = Metrics()
+        self.metrics.add_collector(lambda: self.stats)
+        self.describe_metrics()
+        self.metrics_server = None
+        if os.getenv('SPAM_METRICS_PORT'):
+            try:
+                from metrics import MetricsServer
+                self.metrics_server = MetricsServer(self.metrics, int(os.getenv('SPAM_METRICS_PORT')),
+                                                    os.getenv('SPAM_METRICS_HOST', '127.0.0.1')).start()
+                print(f"Metrics available at http://{os.getenv('SPAM_METRICS_HOST', '127.0.0.1')}:{self.metrics_server.port}/metrics")
+            except Exception as e:
+                print(f"Could not start metrics endpoint: {e}")
+        self.json_log = os.getenv('SPAM_JSON_LOG')  # file path, or - for stdout
+        self.profile_cycles = int(os.getenv('SPAM_PROFILE_CYCLES', '0'))
+        self.profile_dir = os.getenv('SPAM_PROFILE_DIR', './profiles')
+        
+        # Incremental polling state (high-water mark + hashes of classified text)
+        self.state_file = os.getenv('SPAM_FILTER_STATE_FILE', './spam_filter_state.json')
+        self.classified_limit = int(os.getenv('SPAM_CLASSIFIED_LIMIT', CLASSIFIED_LIMIT))
+        self.state_saved = 0.0
+        self.load_poll_state()
+        
+        # Spam closes are queued and sent through the sObject Collections API in batches
+        self.close_batch_size = max(1, min(int(os.getenv('SPAM_CLOSE_BATCH_SIZE', CLOSE_BATCH_LIMIT)), CLOSE_BATCH_LIMIT))
+        self.close_flush_interval = float(os.getenv('SPAM_CLOSE_FLUSH_INTERVAL', '5'))
+        self.close_max_attempts = max(1, int(os.getenv('SPAM_CLOSE_MAX_ATTEMPTS', CLOSE_MAX_ATTEMPTS)))
+        self.close_queue = []
+        self.close_queue_started = None
+        self.close_results = {}  # results of sent closes whose page is still waiting on others
+        self.waiting_pages = []  # (handled, spam tickets, page mark) of pages with closes still queued, in order
+        
+        # Sharding (see supervisor.py): SPAM_ID_RANGE=lo:hi limits the query to Ids in [lo, hi) (either end may
+        # be empty), SPAM_SHARD=i/n keeps the fetched cases whose Id hashes to shard i, and
+        # SPAM_CREATED_AFTER/SPAM_CREATED_BEFORE limit the query to a CreatedDate window
+        self.id_range = None
+        if os.getenv('SPAM_ID_RANGE'):
+            self.id_range = tuple(os.getenv('SPAM_ID_RANGE').split(':', 1))
+        self.shard = None
+        if os.getenv('SPAM_SHARD'):
+            index, count = (int(part) for part in os.getenv('SPAM_SHARD').split('/'))
+            self.shard = (index, count)
+        self.created_after = os.getenv('SPAM_CREATED_AFTER')
+        self.created_before = os.getenv('SPAM_CREATED_BEFORE')
+        self.on_check = None  # called with the stats after every check
+        self.should_stop = None  # checked after every daemon poll; returning True ends the loop
+        
+        # SPAM_RECORD_FILE appends every fetched Case to a JSONL file that --replay can play back
+        self.recorder = None
+        if os.getenv('SPAM_RECORD_FILE'):
+            from replay_salesforce import CaseRecorder
+            self.recorder = CaseRecorder(os.getenv('SPAM_RECORD_FILE'))
+        
+        # Fetch profile (see FETCH_PROFILES); checked against the phrase rules once those are loaded
+        profile_name = os.getenv('SPAM_FETCH_PROFILE', 'full')
+        if profile_name not in FETCH_PROFILES:
+            print(f"Unknown fetch profile '{profile_name}', using 'full'")
+            profile_name = 'full'
+        self.set_fetch_profile(profile_name)
+        self.full_text_margin = float(os.getenv('SPAM_FULL_TEXT_MARGIN', FULL_TEXT_MARGIN))
+        
+        # Tickets are fetched and classified page by page
+        self.page_size = max(200, min(int(os.getenv('SPAM_QUERY_PAGE_SIZE', QUERY_PAGE_SIZE)), QUERY_PAGE_SIZE))
+        
+        # Pipelined mode: pages queued between fetch and classify, close batches between classify and the close workers
+        self.pipeline_depth = max(1, int(os.getenv('SPAM_PIPELINE_DEPTH', '2')))
+        self.close_workers = max(1, int(os.getenv('SPAM_CLOSE_WORKERS', '4')))
+        self.stats_lock = threading.Lock()
+        
+        # Hot reload state, set before anything that can end initialization early
+        self.model_lock = threading.Lock()
+        self.pending_model = None
+        self.previous_model = None
+        self.model_watcher = None
+        self.ready = False  # True once initialization got through the login and model load
+        
+        # Daemon mode poll scheduling (seconds)
+        self.scheduler = PollScheduler(
+            min_interval=float(os.getenv('SPAM_POLL_MIN_INTERVAL', '15')),
+            max_interval=float(os.getenv('SPAM_POLL_MAX_INTERVAL', '300')),
+            error_max=float(os.getenv('SPAM_POLL_ERROR_MAX_INTERVAL', '600'))
+        )
+        self.session_expired = False
+        
+        # Connect to Salesforce (or use an existing connection / connection factory, e.g. the local fake)
+        self.sf_factory = sf_factory
+        login_started = time.perf_counter()
+        if sf is not None:
+            self.sf = sf
+        elif not self.initialize_salesforce_connection():
             print("Failed to initialize Salesforce connection!")
             return
+        self.startup['salesforce_login'] = time.perf_counter() - login_started
+        
+        # Classification results cache, keyed by normalized text + model version
+        self.cache = ClassificationCache(max_size=int(os.getenv('SPAM_CACHE_SIZE', '10000')), stats=self.stats)
+        self.cache_file = os.getenv('SPAM_CACHE_FILE')
+        
+        # Append-only SQLite log of every decision; an empty SPAM_DECISION_LOG turns it off
+        self.decision_log = None
+        self.pending_decisions = {}
+        if os.getenv('SPAM_DECISION_LOG', DECISION_LOG):
+            try:
+                self.decision_log = DecisionLog(os.getenv('SPAM_DECISION_LOG', DECISION_LOG))
+            except Exception as e:
+                print(f"Could not open decision log: {e}")
+        
+        # Near-duplicate spam wave detection (opt-in): members of a wave with closed spam skip the model
+        self.waves = None
+        self.wave_min_confidence = float(os.getenv('SPAM_WAVE_MIN_CONFIDENCE', '0.7'))
+        self.pending_waves = {}
+        if os.getenv('SPAM_WAVE_DETECTION', 'off').lower() in ('1', 'on', 'true'):
+            from spam_waves import SpamWaveIndex
+            self.waves = SpamWaveIndex(
+                similarity=float(os.getenv('SPAM_WAVE_SIMILARITY', '0.4')),
+                ttl=float(os.getenv('SPAM_WAVE_TTL', '86400')),
+                max_clusters=int(os.getenv('SPAM_WAVE_MAX_CLUSTERS', '50000'))
+            )
+        
+        # Allow/deny rules checked before the model; SPAM_RULES_FILE replaces the default 'perdot' rule
+        self.rules = RuleFilter(DEFAULT_RULES, metrics=self.metrics)
+        if os.getenv('SPAM_RULES_FILE'):
+            try:
+                self.rules = RuleFilter.from_file(os.getenv('SPAM_RULES_FILE'), metrics=self.metrics)
+                print(f"Loaded {len(self.rules.rules)} filter rules")
+            except Exception as e:
+                print(f"Error loading filter rules, using the default rules: {e}")
+        
+        if 'Description' not in self.fetch_fields:
+            # Phrase rules would only ever see the subject
+            phrase_rules = sum(kind == 'phrases' for _, kind, _ in self.rules.rules)
+            if phrase_rules:
+                print(f"The '{self.fetch_profile}' fetch profile leaves out the description that "
+                      f"{phrase_rules} phrase rules match on, using 'capped'")
+                self.set_fetch_profile('capped')
+            else:
+                print(f"The '{self.fetch_profile}' fetch profile leaves out descriptions: description edits don't make "
+                      f"a case be classified again" + (", and recorded snapshots have none" if self.recorder else ""))
         
         # Load ML model
-        if not self.load_spam_model():
+        self.inference_engine = os.getenv('SPAM_INFERENCE_ENGINE', 'tfidf')
+        self.scorer = None
+        if model is not None:
+            # Loaded once by the supervisor and shared with its other workers
+            self.model, self.vectorizer, self.model_version = model
+            self.cache.set_model_version(self.model_version)
+            self.stats['model_version'] = self.model_version
+            print(f"Using shared spam model {self.model_version}")
+        elif not self.load_spam_model(model_loader):
             print("Failed to load spam classification model!")
             return
+        engine_started = time.perf_counter()
+        self.build_inference_engine()
+        self.startup['inference_engine'] = time.perf_counter() - engine_started
         
+        # Shadow mode: a candidate model scores the same batches in the background and never closes anything
+        self.shadow = None
+        if os.getenv('SPAM_SHADOW_MODEL_DIR'):
+            self.load_shadow_model(os.getenv('SPAM_SHADOW_MODEL_DIR'))
+        
+        # Hot reload: a new model in MODEL_DIR is loaded and validated in the background, then swapped in between batches
+        if os.getenv('SPAM_MODEL_RELOAD', 'off').lower() in ('1', 'on', 'true'):
+            self.start_model_watcher()
+        if self.cache_file:
+            print(f"Loaded {self.cache.load(self.cache_file)} cached classifications")
+        
+        self.startup['init'] = time.perf_counter() - init_started
+        self.ready = True
         print("Service initialized")
 
     def initialize_salesforce_connection(self):
         try:
             print("Connecting to Salesforce...")
+            if self.sf_factory is not None:
+                self.sf = self.sf_factory()
+                print("Connected to Salesforce!")
+                return True
+            
+            started = time.perf_counter()
+            import requests
+            from requests.adapters import HTTPAdapter
+            from simple_salesforce import Salesforce
+            self.startup['salesforce_import'] = time.perf_counter() - started
+            
+            # One pooled session shared by the fetch stage and every close worker
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=self.close_workers + 2))
+            
             self.sf = Salesforce(
                 username=os.getenv('SF_USERNAME'),
                 password=os.getenv('SF_PASSWORD'),
-                security_token=os.getenv('SF_SECURITY_TOKEN')
+                security_token=os.getenv('SF_SECURITY_TOKEN'),
+                session=session
             )
             
             print("Connected to Salesforce!")
@@ -54,18 +423,69 @@ class SpamFilterService:
             print(f"Salesforce connection failed: {e}")
             return False
 
-    def load_spam_model(self):
-        """Load the trained spam classification model"""
+    def describe_metrics(self):
+        describe = self.metrics.describe
+        describe('salesforce_query_seconds', "Time to fetch one page of cases")
+        describe('close_seconds', "Time of one close call to Salesforce")
+        describe('vectorize_seconds', "Time to vectorize one batch of tickets")
+        describe('predict_seconds', "Time to score one batch of tickets")
+        describe('cycle_seconds', "Time of one full check")
+        describe('spam_probability', "Model spam probability of each scored ticket")
+        describe('rule_hits_total', "Tickets decided by each filter rule")
+        describe('salesforce_api_calls_total', "Salesforce API requests by call")
+        describe('salesforce_api_errors_total', "Failed Salesforce API requests by call")
+        describe('shadow_predict_seconds', "Time for the shadow candidate to score one batch")
+        describe('shadow_tickets_total', "Tickets scored by the shadow candidate")
+        describe('shadow_disagreements_total', "Tickets the shadow candidate would close differently")
+
+    def log_json(self, event, **fields):
+        """Write one structured log line when SPAM_JSON_LOG is set"""
+        if not self.json_log:
+            return
+        line = json.dumps({'ts': datetime.now().isoformat(timespec='milliseconds'), 'event': event, **fields},
+                          default=str)
+        try:
+            if self.json_log == '-':
+                print(line)
+            else:
+                with open(self.json_log, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+        except Exception as e:
+            print(f"Error writing JSON log: {e}")
+
+    def reconnect(self):
+        """Re-authenticate with Salesforce after the session expired, keeping the loaded model"""
+        print("Salesforce session expired, re-authenticating...")
+        if self.initialize_salesforce_connection():
+            self.session_expired = False
+            self.stats['reconnects'] += 1
+            return True
+        return False
+
+    def record_api_error(self, e, call='other'):
+        """Count a failed Salesforce call and note whether the session needs renewing"""
+        with self.stats_lock:
+            self.stats['api_errors'] += 1
+        self.metrics.inc('salesforce_api_errors_total', call=call)
+        from simple_salesforce.exceptions import SalesforceExpiredSession
+        if isinstance(e, SalesforceExpiredSession):
+            self.session_expired = True
+
+    def load_spam_model(self, loader=None):
+        """Load the trained spam classification model, or take the one a BackgroundCall loaded"""
         try:
             print("Loading spam classification model...")
-            
-            with open('./models/spam_model.pkl', 'rb') as f:
-                self.model = pickle.load(f)
-            
-            with open('./models/tfidf_vectorizer.pkl', 'rb') as f:
-                self.vectorizer = pickle.load(f)
-            
-            print("Spam model loaded successfully!")
+            if loader is not None:
+                waited = time.perf_counter()
+                self.model, self.vectorizer, self.model_version = loader.result()
+                self.startup['model_load'] = loader.seconds
+                self.startup['model_wait'] = time.perf_counter() - waited
+            else:
+                self.model, self.vectorizer, self.model_version = load_model_artifacts(
+                    MODEL_DIR, os.getenv('SPAM_MODEL_FORMAT', 'auto'))
+            self.cache.set_model_version(self.model_version)
+            self.stats['model_version'] = self.model_version
+            print(f"Spam model {self.model_version} loaded successfully!")
             return True
             
         except FileNotFoundError:
@@ -75,106 +495,914 @@ class SpamFilterService:
             print(f"Error loading model: {e}")
             return False
 
-    def classify_ticket_as_spam(self, subject, description):
-        """Classify ticket using local ML model"""
+    def load_shadow_model(self, model_dir):
+        """Start shadow-scoring with the candidate model in model_dir"""
+        try:
+            print(f"Loading shadow candidate model from {model_dir}...")
+            from shadow_model import ShadowEvaluator
+            model, vectorizer, model_version = load_model_artifacts(model_dir)
+            self.shadow = ShadowEvaluator(
+                model, vectorizer, model_version,
+                active_vectorizer=self.vectorizer,
+                active_version=self.model_version,
+                threshold=SPAM_THRESHOLD,
+                log_path=os.getenv('SPAM_SHADOW_LOG', SHADOW_LOG),
+                max_pending=int(os.getenv('SPAM_SHADOW_MAX_PENDING', '8')),
+                metrics=self.metrics
+            )
+            sharing = {'same': "shares the active TF-IDF features", 'rescale': "re-weights the active TF-IDF features"}
+            print(f"Shadow candidate {model_version} loaded ({sharing.get(self.shadow.share, 'tokenizes separately')})")
+            return True
+        except Exception as e:
+            print(f"Error loading shadow candidate model: {e}")
+            return False
+
+    def build_inference_engine(self):
+        """Use the hashed scorer instead of vectorize + predict_proba when configured and it agrees with the model"""
+        self.scorer = self.make_scorer(self.model, self.vectorizer)
+
+    def make_scorer(self, model, vectorizer):
+        """Hashed scorer for model, or None to use the model's own vectorizer"""
+        if self.inference_engine != 'hashed':
+            return None
+        
+        if not hasattr(vectorizer, 'vocabulary_'):
+            print("Hashed scorer needs a TF-IDF vocabulary, using the model's own vectorizer")
+            return None
+        
+        try:
+            from hashed_scorer import HashedScorer
+            scorer = HashedScorer.from_model(model, vectorizer)
+            
+            # Check against the model on text built from its own vocabulary, so every n-gram path is exercised
+            terms = sorted(vectorizer.vocabulary_)
+            check_texts = [' '.join(terms[i:i + 25]) for i in range(0, len(terms), 25)] + ['', 'No Subject ']
+            difference = scorer.max_difference(model, vectorizer, check_texts)
+            if difference > HASHED_SCORER_TOLERANCE:
+                print(f"Hashed scorer differs from the model by {difference:.2e}, using TF-IDF inference")
+                return None
+            
+            print("Using hashed scorer for inference")
+            return scorer
+            
+        except Exception as e:
+            print(f"Error building hashed scorer, using TF-IDF inference: {e}")
+            return None
+
+    def start_model_watcher(self):
+        """Watch MODEL_DIR for retrained model artifacts"""
+        if self.model_watcher is None:
+            from model_watcher import ModelWatcher
+            interval = float(os.getenv('SPAM_MODEL_WATCH_INTERVAL', '10'))
+            self.model_watcher = ModelWatcher(MODEL_DIR, self.reload_model, interval=interval).start()
+            print(f"Watching {MODEL_DIR} for new models every {interval:g} seconds")
+
+    def load_canary_tickets(self):
+        """Canned (text, expected label) tickets used to sanity-check a reloaded model"""
+        path = os.getenv('SPAM_MODEL_CANARIES', CANARY_FILE)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return [(ticket_text(ticket), ticket['expected']) for ticket in json.load(f)]
+        except FileNotFoundError:
+            print(f"No canary tickets at {path}, only checking the model's classes")
+            return []
+
+    def reload_model(self):
+        """Load and validate the model now in MODEL_DIR (on the watcher thread); it is swapped in before the next batch"""
         try:
-            # Pre-filter: Skip ML model if subject starts with "perdot" (case-insensitive)
-            if subject and subject.lower().startswith('perdot'):
-                return False, 1.0, "Pre-filtered: Subject starts with 'perdot'"
+            print("Model artifacts changed, loading the new model...")
+            model, vectorizer, model_version = load_model_artifacts(MODEL_DIR, os.getenv('SPAM_MODEL_FORMAT', 'auto'))
+            if model_version == self.model_version:
+                print(f"Model {model_version} is already active")
+                return False
             
-            text = f"{subject} {description or ''}"
+            from model_watcher import validate_model
+            accuracy = validate_model(model, vectorizer, self.load_canary_tickets(), SPAM_THRESHOLD,
+                                      float(os.getenv('SPAM_MODEL_CANARY_MIN_ACCURACY', '0.9')))
+            scorer = self.make_scorer(model, vectorizer)
+            with self.model_lock:
+                self.pending_model = (model, vectorizer, model_version, scorer)
+            checked = f"{accuracy:.0%} canary accuracy" if accuracy is not None else "no canaries"
+            print(f"Model {model_version} validated ({checked}), switching before the next batch")
+            return True
             
-            text_tfidf = self.vectorizer.transform([text])
+        except Exception as e:
+            print(f"Model reload failed, keeping model {self.model_version}: {e}")
+            with self.stats_lock:
+                self.stats['model_reload_failures'] += 1
+            self.log_json('model_reload_failed', model_version=self.model_version, error=str(e))
+            return False
+
+    def set_model(self, model, vectorizer, model_version, scorer):
+        """Make a loaded model the active one"""
+        self.model, self.vectorizer, self.model_version, self.scorer = model, vectorizer, model_version, scorer
+        self.stats['model_version'] = model_version
+        self.cache.set_model_version(model_version)
+        if self.shadow is not None:
+            self.shadow.set_active(vectorizer, model_version)
+
+    def apply_pending_model(self):
+        """Swap in a validated reloaded model; only called between batches"""
+        with self.model_lock:
+            pending, self.pending_model = self.pending_model, None
+        if pending is None:
+            return False
+        
+        old_version = self.model_version
+        # The old model is kept until the new one has scored a batch
+        self.previous_model = (self.model, self.vectorizer, self.model_version, self.scorer)
+        self.set_model(*pending)
+        self.stats['model_reloads'] += 1
+        print(f"Switched spam model {old_version} -> {self.model_version}")
+        self.log_json('model_reloaded', previous=old_version, model_version=self.model_version)
+        return True
+
+    def rollback_model(self):
+        """Go back to the model that was active before the last reload"""
+        failed_version = self.model_version
+        self.set_model(*self.previous_model)
+        self.previous_model = None
+        self.stats['model_rollbacks'] += 1
+        print(f"Rolled back spam model {failed_version} -> {self.model_version}")
+        self.log_json('model_rollback', failed=failed_version, model_version=self.model_version)
+
+    def classify_ticket_as_spam(self, subject, description):
+        """Classify ticket using local ML model"""
+        return self.classify_batch([{'Subject': subject, 'Description': description}])[0]
+
+    def classify_batch(self, tickets):
+        """Classify a list of tickets with one vectorizer pass and one predict_proba call"""
+        if not tickets:
+            return []
+        
+        self.apply_pending_model()
+        try:
+            subjects = [ticket.get('Subject', 'No Subject') for ticket in tickets]
+            texts = [ticket_text(ticket, self.description_chars) for ticket in tickets]
             
-            prediction = self.model.predict(text_tfidf)[0]
-            probabilities = self.model.predict_proba(text_tfidf)[0]
+            # Rule stage: sender domain, subject prefix and phrase rules decide obvious cases without the model
+            results = [None] * len(tickets)
+            ruled = self.rules.evaluate(tickets)
+            for i, (is_spam, reason) in ruled.items():
+                results[i] = (is_spam, 1.0, reason)
+            denied = sum(is_spam for is_spam, _ in ruled.values())
+            self.stats['rule_denied'] += denied
+            self.stats['rule_allowed'] += len(ruled) - denied
             
-            spam_prob = probabilities[1] if self.model.classes_[1] == 'spam' else probabilities[0]
+            # Cached results first; identical (normalized) texts in the batch are signed and scored once.
+            # Capped tickets may be rescored on their full text, which can differ past the cap, so they stay apart
+            rescoring = self.description_chars is not None and self.full_text_margin > 0
+            pending = {}
+            for i, result in enumerate(results):
+                if result is not None:
+                    continue
+                cached = self.cache.get(texts[i])
+                if cached is not None:
+                    results[i] = cached
+                elif rescoring and is_capped(tickets[i], self.description_chars):
+                    pending[(normalize_text(texts[i]), i)] = [i]
+                else:
+                    pending.setdefault(normalize_text(texts[i]), []).append(i)
             
-            is_spam = prediction == 'spam'
-            confidence = spam_prob if is_spam else (1 - spam_prob)
+            wave_ids = {}
+            wave_matched = set()
+            if self.waves is not None and pending:
+                # Near-duplicates of a wave that already has closed spam are closed without inference
+                groups = list(pending.items())
+                assigned = self.waves.assign([texts[indices[0]] for _, indices in groups],
+                                             [subjects[indices[0]] for _, indices in groups],
+                                             counts=[len(indices) for _, indices in groups])
+                for (key, indices), wave_id in zip(groups, assigned):
+                    wave_ids.update((i, wave_id) for i in indices)
+                    wave = self.waves.spam_wave(wave_id)
+                    if wave is not None:
+                        for i in indices:
+                            results[i] = (True, wave.confidence,
+                                          f"Spam wave #{wave_id}: near-duplicate of {wave.spam_closed} closed spam case(s)")
+                        wave_matched.update(indices)
+                        del pending[key]
+                self.stats['wave_matched'] += len(wave_matched)
+            if pending:
+                to_score = [indices[0] for indices in pending.values()]
+                scored_texts = [texts[i] for i in to_score]
+                self.stats['model_scored'] += len(scored_texts)
+                scoring_started = time.perf_counter()
+                text_tfidf = None
+                if self.scorer is not None:
+                    # The hashed scorer tokenizes and scores in one pass
+                    with self.metrics.timer('predict_seconds', engine='hashed'):
+                        probabilities = self.scorer.predict_proba(scored_texts)
+                else:
+                    with self.metrics.timer('vectorize_seconds'):
+                        text_tfidf = self.vectorizer.transform(scored_texts)
+                    with self.metrics.timer('predict_seconds', engine='tfidf'):
+                        probabilities = self.model.predict_proba(text_tfidf)
+                
+                spam_column = list(self.model.classes_).index('spam')
+                spam_probs = probabilities[:, spam_column]
+                if self.shadow is not None:
+                    self.shadow.submit([tickets[i].get('Id') for i in to_score], scored_texts, spam_probs,
+                                       time.perf_counter() - scoring_started, features=text_tfidf)
+                rescored = set()
+                if rescoring:
+                    probabilities, rescored = self.rescore_full_text(tickets, to_score, probabilities, spam_column)
+                    spam_probs = probabilities[:, spam_column]
+                self.metrics.observe_many('spam_probability', spam_probs, buckets=PROBABILITY_BUCKETS)
+                predictions = self.model.classes_[probabilities.argmax(axis=1)]
+                
+                for position, (indices, prediction, spam_prob) in enumerate(zip(pending.values(), predictions, spam_probs)):
+                    is_spam = prediction == 'spam'
+                    confidence = spam_prob if is_spam else (1 - spam_prob)
+                    reason = f"ML model prediction: {prediction} ({confidence:.1%} confidence)"
+                    if position in rescored:
+                        reason += " on the full description"
+                    for i in indices:
+                        results[i] = (is_spam, confidence, reason)
+                    # A full text score is not the capped text's score
+                    if position not in rescored:
+                        self.cache.put(texts[indices[0]], results[indices[0]])
+                # A reloaded model stays on probation until it has scored a batch
+                self.previous_model = None
             
-            reason = f"ML model prediction: {prediction} ({confidence:.1%} confidence)"
+            # Confident model spam seeds its wave once the close succeeds (see finish_page)
+            for i, wave_id in wave_ids.items():
+                is_spam, confidence, _ = results[i]
+                if i not in wave_matched and is_spam and confidence >= self.wave_min_confidence and tickets[i].get('Id'):
+                    self.pending_waves[tickets[i]['Id']] = (wave_id, confidence)
             
-            return is_spam, confidence, reason
+            return results
             
         except Exception as e:
             print(f"Error in classification: {e}")
-            return False, 0.0, "Classification error"
+            if self.previous_model is not None:
+                self.rollback_model()
+                return self.classify_batch(tickets)
+            return [(False, 0.0, "Classification error")] * len(tickets)
 
-    def get_new_tickets(self):
-        """Get all new/open tickets from Salesforce"""
+    def score_texts(self, texts):
+        """Model probabilities for texts with the active inference engine"""
+        if self.scorer is not None:
+            return self.scorer.predict_proba(texts)
+        return self.model.predict_proba(self.vectorizer.transform(texts))
+
+    def rescore_full_text(self, tickets, to_score, probabilities, spam_column):
+        """Score capped tickets that landed within full_text_margin of the threshold again on their full text
+        Descriptions the fetch profile left out are queried by Id; returns (probabilities, rescored positions)"""
+        borderline = [position for position, i in enumerate(to_score)
+                      if abs(probabilities[position, spam_column] - SPAM_THRESHOLD) <= self.full_text_margin
+                      and is_capped(tickets[i], self.description_chars)]
+        missing = [tickets[to_score[position]].get('Id') for position in borderline
+                   if 'Description' not in tickets[to_score[position]]]
+        fetched = self.fetch_descriptions([case_id for case_id in missing if case_id]) if missing else {}
+        
+        full_texts = {}
+        for position in borderline:
+            ticket = tickets[to_score[position]]
+            if 'Description' in ticket:
+                full_texts[position] = ticket_text(ticket)
+            elif ticket.get('Id') in fetched:
+                full_texts[position] = ticket_text({'Subject': ticket.get('Subject', 'No Subject'),
+                                                    'Description': fetched[ticket['Id']]})
+        if not full_texts:
+            return probabilities, set()
+        
+        probabilities = probabilities.copy()
+        before = probabilities[list(full_texts), spam_column] > SPAM_THRESHOLD
+        with self.metrics.timer('predict_seconds', engine='full_text'):
+            probabilities[list(full_texts)] = self.score_texts(list(full_texts.values()))
+        self.stats['full_text_rescored'] += len(full_texts)
+        self.stats['full_text_flipped'] += int(((probabilities[list(full_texts), spam_column] > SPAM_THRESHOLD) != before).sum())
+        return probabilities, set(full_texts)
+
+    def fetch_descriptions(self, case_ids):
+        """{case Id: full description} for the given cases, FULL_TEXT_BATCH Ids per query"""
+        descriptions = {}
+        for batch in chunked(case_ids, FULL_TEXT_BATCH):
+            ids = ', '.join(f"'{case_id}'" for case_id in batch)
+            try:
+                result = self.sf.query_all(f"SELECT Id, Description FROM Case WHERE Id IN ({ids})")
+                self.metrics.inc('salesforce_api_calls_total', call='full_text_query')
+                descriptions.update((record['Id'], record.get('Description')) for record in result['records'])
+            except Exception as e:
+                print(f"Error fetching full descriptions: {e}")
+                self.record_api_error(e, call='full_text_query')
+        return descriptions
+
+    def load_poll_state(self):
+        """Load the polling high-water mark and classified-text hashes from the state file"""
+        self.poll_state = {'last_modstamp': None, 'last_id': None, 'classified': {}, 'close_failures': {}}
+        try:
+            with open(self.state_file, 'r') as f:
+                self.poll_state.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Could not read poll state, starting from scratch: {e}")
+
+    def set_fetch_profile(self, profile_name):
+        """Use one of FETCH_PROFILES; SPAM_DESCRIPTION_CHARS overrides the profile's description cap"""
+        self.fetch_profile = profile_name
+        self.fetch_fields = FETCH_PROFILES[profile_name]['fields']
+        self.description_chars = FETCH_PROFILES[profile_name]['description_chars']
+        if os.getenv('SPAM_DESCRIPTION_CHARS'):
+            self.description_chars = int(os.getenv('SPAM_DESCRIPTION_CHARS'))
+
+    def save_poll_state(self):
+        """Persist the polling state atomically"""
+        try:
+            tmp_path = self.state_file + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.poll_state, f)
+            os.replace(tmp_path, self.state_file)
+            self.state_saved = time.monotonic()
+        except Exception as e:
+            print(f"Error saving poll state: {e}")
+
+    def get_new_tickets(self, full_rescan=False):
+        """Yield (tickets, page mark) per page of new/open tickets, only those changed since the last poll unless full_rescan
+        The page mark is the (SystemModstamp, Id) of the page's last record, so the watermark also moves over skipped ones"""
+        seen = set()
         try:
             print("Checking for new tickets...")
-            result = self.sf.query("SELECT Id, Subject, Description, Status, SuppliedEmail FROM Case WHERE Status IN ('New', 'Open')")
+            query = f"SELECT {self.fetch_fields} FROM Case WHERE Status IN ('New', 'Open')"
+            
+            last_modstamp = self.poll_state.get('last_modstamp')
+            if last_modstamp and not full_rescan:
+                # >= on the truncated second so nothing at the boundary is missed; unchanged
+                # cases are dropped below by their text hash
+                query += f" AND SystemModstamp >= {soql_datetime(last_modstamp)}"
+            if self.id_range is not None:
+                low, high = self.id_range
+                query += (f" AND Id >= '{low}'" if low else "") + (f" AND Id < '{high}'" if high else "")
+            if self.created_after:
+                query += f" AND CreatedDate >= {self.created_after}"
+            if self.created_before:
+                query += f" AND CreatedDate < {self.created_before}"
+            query += " ORDER BY SystemModstamp, Id"
+            
+            # query_all_iter follows nextRecordsUrl, so only one page is held at a time
+            records = self.sf.query_all_iter(query, headers={'Sforce-Query-Options': f'batchSize={self.page_size}'})
+            fetched = 0
+            pages = chunked(records, self.page_size)
             
-            tickets = result['records']
-            print(f"Found {len(tickets)} tickets to process\n")
+            while True:
+                # Pages are timed as they are pulled, so consumer time is not counted
+                started = time.perf_counter()
+                page = next(pages, None)
+                if page is None:
+                    break
+                self.metrics.observe('salesforce_query_seconds', time.perf_counter() - started)
+                self.metrics.inc('salesforce_api_calls_total', call='query')
+                fetched += len(page)
+                if self.recorder is not None:
+                    self.recorder.record(page)
+                tickets = page
+                page_mark = (page[-1].get('SystemModstamp'), page[-1]['Id']) if page[-1].get('SystemModstamp') else None
+                if self.shard is not None:
+                    # The rest of the page belongs to other workers
+                    tickets = [t for t in tickets if shard_of(t['Id'], self.shard[1]) == self.shard[0]]
+                
+                if full_rescan:
+                    seen.update(t['Id'] for t in tickets)
+                else:
+                    classified = self.poll_state['classified']
+                    changed = [t for t in tickets if classified.get(t['Id']) != ticket_text_hash(t)]
+                    self.stats['skipped_unchanged'] += len(tickets) - len(changed)
+                    tickets = changed
+                
+                print(f"Fetched {len(page)} tickets ({fetched} so far), {len(tickets)} to process\n")
+                yield tickets, page_mark
             
-            return tickets
+            if full_rescan:
+                # Every open case was just listed; the rest were closed or deleted elsewhere
+                classified = self.poll_state['classified']
+                # A snapshot, as the pipelined cycle may still be recording pages
+                stale = [case_id for case_id in list(classified) if case_id not in seen]
+                for case_id in stale:
+                    classified.pop(case_id, None)
+                failures = self.poll_state.setdefault('close_failures', {})
+                for case_id in [case_id for case_id in list(failures) if case_id not in seen]:
+                    failures.pop(case_id, None)
+                if stale:
+                    print(f"Forgot {len(stale)} cases that are no longer open")
             
         except Exception as e:
             print(f"Error getting tickets: {e}")
-            return []
+            self.record_api_error(e, call='query')
+
+    def advance_watermark(self, handled, failed, page_mark=None):
+        """Record handled tickets and move the high-water mark past them (and past the rest of their page)"""
+        classified = self.poll_state['classified']
+        for ticket, closed in handled:
+            # Re-inserted so the dict stays in least recently classified order
+            classified.pop(ticket['Id'], None)
+            if not closed:
+                # Closed cases drop out of the open-case query for good
+                classified[ticket['Id']] = ticket_text_hash(ticket)
+        while len(classified) > self.classified_limit:
+            del classified[next(iter(classified))]
+        
+        failed_marks = [(t['SystemModstamp'], t['Id']) for t in failed if t.get('SystemModstamp')]
+        handled_marks = [(t['SystemModstamp'], t['Id']) for t, _ in handled if t.get('SystemModstamp')]
+        if page_mark is not None:
+            # Unchanged tickets were skipped, not handled, but the page is done with them too
+            handled_marks.append(page_mark)
+        current = (self.poll_state.get('last_modstamp'), self.poll_state.get('last_id'))
+        
+        if failed_marks:
+            # Hold the mark at the oldest failed close so that case is fetched and retried next poll
+            self.poll_state['last_modstamp'], self.poll_state['last_id'] = min(failed_marks)
+        elif handled_marks and (current[0] is None or max(handled_marks) > current):
+            self.poll_state['last_modstamp'], self.poll_state['last_id'] = max(handled_marks)
+        
+        # The hashes make the state large, so it is written every few seconds and at the end of each check
+        if time.monotonic() - self.state_saved >= STATE_SAVE_INTERVAL:
+            self.save_poll_state()
 
     def close_spam_ticket(self, ticket_id, reason):
         """Close a ticket as spam with audit trail"""
         try:
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
-            self.sf.Case.update(ticket_id, {
-                'Status': 'Closed',
-                'Reason': 'Spam',
-                'Comments': f"Auto-closed by AI spam filter at {timestamp}. Reason: {reason}"
-            })
+            self.metrics.inc('salesforce_api_calls_total', call='close')
+            with self.metrics.timer('close_seconds', call='close'):
+                self.sf.Case.update(ticket_id, {
+                    'Status': 'Closed',
+                    'Reason': 'Spam',
+                    'Comments': f"Auto-closed by AI spam filter (model {self.model_version}) at {timestamp}. Reason: {reason}"
+                })
             
             print(f"Closed ticket {ticket_id} as spam\n")
             return True
             
         except Exception as e:
             print(f"Error closing ticket {ticket_id}: {e}")
+            self.metrics.inc('salesforce_api_errors_total', call='close')
             return False
 
-    def check_tickets_periodically(self):
-        """Main loop - classify tickets and optionally close spam"""
-        print("\nStarting periodic ticket checking...")
-        print("Press Ctrl+C to stop")
+    def close_record(self, ticket_id, reason):
+        """sObject Collections record that closes a ticket as spam"""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return {
+            'attributes': {'type': 'Case'},
+            'id': ticket_id,
+            'Status': 'Closed',
+            'Reason': 'Spam',
+            'Comments': f"Auto-closed by AI spam filter (model {self.model_version}) at {timestamp}. Reason: {reason}"
+        }
+
+    def queue_spam_close(self, ticket_id, reason):
+        """Queue a spam close; flushes when the batch is full (process_tickets applies the flush interval)"""
+        if not self.close_queue:
+            self.close_queue_started = time.monotonic()
+        self.close_queue.append(self.close_record(ticket_id, reason))
+        
+        if len(self.close_queue) >= self.close_batch_size:
+            return self.flush_close_queue()
+        return {}
+
+    def flush_close_queue(self):
+        """Send queued closes in sObject Collections batches; returns {ticket_id: closed}"""
+        results = {}
+        
+        while self.close_queue:
+            batch = self.close_queue[:self.close_batch_size]
+            self.close_queue = self.close_queue[self.close_batch_size:]
+            results.update(self.send_close_batch(batch))
+        
+        self.close_queue_started = None
+        return results
+
+    def send_close_batch(self, batch):
+        """Close one batch of up to 200 tickets in a single API call; safe to call from worker threads"""
+        results = {}
         
         try:
-            # for i in range(60):
-            print(f"\n=== Checking at {datetime.now().strftime('%H:%M:%S')} ===")
-            tickets = self.get_new_tickets()
+            self.metrics.inc('salesforce_api_calls_total', call='close_batch')
+            with self.metrics.timer('close_seconds', call='close_batch'):
+                response = self.sf.restful('composite/sobjects', method='PATCH',
+                                           json={'allOrNone': False, 'records': batch})
             
-            if not tickets:
-                print("No tickets to process")
-            else:
-                for ticket in tickets:
-                    subject = ticket.get('Subject', 'No Subject')
-                    description = ticket.get('Description', '')
+            for record, outcome in zip(batch, response):
+                results[record['id']] = outcome.get('success', False)
+                if not results[record['id']]:
+                    errors = '; '.join(e.get('message', '') for e in outcome.get('errors', []))
+                    print(f"Error closing ticket {record['id']}: {errors}")
                     
-                    is_spam, confidence, reason = self.classify_ticket_as_spam(subject, description)
+        except Exception as e:
+            print(f"Error closing batch of {len(batch)} tickets: {e}")
+            self.record_api_error(e, call='close_batch')
+            for record in batch:
+                results[record['id']] = False
+        
+        closed = sum(results.values())
+        with self.stats_lock:
+            self.stats['close_batches'] += 1
+            self.stats['spam_closed'] += closed
+            self.stats['close_failed'] += len(results) - closed
+        if results:
+            print(f"Closed {closed} of {len(results)} spam tickets\n")
+        
+        return results
+
+    def classify_page(self, tickets):
+        """Classify one page; returns kept tickets as (ticket, False) and spam as (ticket, reason)"""
+        results = self.classify_batch(tickets)
+        kept = []
+        spam = []
+        
+        if tickets and 'first_ticket' not in self.startup:
+            self.startup['first_ticket'] = time.perf_counter() - MODULE_STARTED
+        
+        for ticket, (is_spam, confidence, reason) in zip(tickets, results):
+            subject = ticket.get('Subject', 'No Subject')
+            if self.decision_log is not None:
+                spam_prob = confidence if is_spam else 1 - confidence
+                self.pending_decisions[ticket['Id']] = (float(spam_prob), reason, self.model_version)
+            
+            if is_spam and confidence > SPAM_THRESHOLD:
+                print("=== SPAM DETECTED ===")
+                print(f"  Subject: {subject}")
+                print(f"  Confidence: {confidence:.1%}\n")
+                
+                spam.append((ticket, reason))
+            else:
+                self.stats['legitimate_kept'] += 1
+                kept.append((ticket, False))
+            
+            self.stats['total_processed'] += 1
+        
+        return kept, spam
+
+    def process_tickets(self, tickets, failed, page_mark=None):
+        """Classify one page of tickets and queue its spam closes; the page is finished once they are sent"""
+        handled, spam = self.classify_page(tickets)
+        
+        for ticket, reason in spam:
+            self.close_results.update(self.queue_spam_close(ticket['Id'], reason))
+        # The rest may wait for later pages to fill a batch, up to the flush interval
+        if self.close_queue and time.monotonic() - self.close_queue_started >= self.close_flush_interval:
+            self.close_results.update(self.flush_close_queue())
+        
+        self.waiting_pages.append((handled, [ticket for ticket, _ in spam], page_mark))
+        self.finish_closed_pages(failed)
+
+    def finish_closed_pages(self, failed, flush=False):
+        """Finish the waiting pages whose closes have all been sent (all of them after a flush)"""
+        if flush:
+            self.close_results.update(self.flush_close_queue())
+        # In page order, so the watermark never moves past a page whose closes are still queued
+        while self.waiting_pages:
+            handled, spam_tickets, page_mark = self.waiting_pages[0]
+            if any(ticket['Id'] not in self.close_results for ticket in spam_tickets):
+                return
+            self.waiting_pages.pop(0)
+            close_results = {ticket['Id']: self.close_results.pop(ticket['Id']) for ticket in spam_tickets}
+            self.finish_page(handled, spam_tickets, close_results, failed, page_mark)
+
+    def finish_page(self, handled, spam_tickets, close_results, failed, page_mark=None):
+        """Fold a page's close results into the watermark"""
+        if self.decision_log is not None:
+            self.log_decisions(handled, spam_tickets, close_results)
+        
+        if self.waves is not None:
+            for ticket in spam_tickets:
+                wave = self.pending_waves.pop(ticket['Id'], None)
+                if wave is not None and close_results.get(ticket['Id']):
+                    self.waves.mark_spam(*wave)
+        
+        # failed accumulates across the cycle so the mark never moves past an earlier failed close
+        failures = self.poll_state.setdefault('close_failures', {})
+        handled = list(handled)
+        for ticket in spam_tickets:
+            if close_results.get(ticket['Id']):
+                failures.pop(ticket['Id'], None)
+                handled.append((ticket, True))
+                continue
+            attempts = failures[ticket['Id']] = failures.get(ticket['Id'], 0) + 1
+            if attempts < self.close_max_attempts:
+                failed.append(ticket)
+                continue
+            # Give up so one case can't hold the mark forever; it stays open and is skipped while unchanged
+            del failures[ticket['Id']]
+            handled.append((ticket, False))
+            self.stats['close_given_up'] += 1
+            print(f"Giving up on closing ticket {ticket['Id']} after {attempts} failed attempts")
+            self.log_json('close_given_up', case_id=ticket['Id'], attempts=attempts)
+        
+        self.advance_watermark(handled, failed, page_mark)
+
+    def log_decisions(self, kept, spam_tickets, close_results):
+        """Append one page of decisions to the decision log in a single transaction"""
+        now = log_timestamp()
+        actions = [(ticket, 'kept') for ticket, _ in kept]
+        actions += [(ticket, 'closed' if close_results.get(ticket['Id']) else 'close_failed') for ticket in spam_tickets]
+        rows = []
+        for ticket, action in actions:
+            spam_prob, reason, model_version = self.pending_decisions.pop(ticket['Id'], (None, None, None))
+            rows.append((now, ticket['Id'], ticket_text_hash(ticket), model_version, spam_prob, action,
+                         ticket.get('Status'), reason))
+        try:
+            self.decision_log.record(rows)
+        except Exception as e:
+            print(f"Error writing decision log: {e}")
+
+    def reopen_cases(self, since, until=None, dry_run=False):
+        """Reopen cases the filter closed in [since, until); the cases come from the decision log, not a query"""
+        closed = self.decision_log.closed_cases(since, until)
+        print(f"{len(closed)} cases closed as spam between {log_timestamp(since)} and {log_timestamp(until) if until else 'now'}")
+        if dry_run or not closed:
+            return 0
+        
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        reopened = 0
+        for batch in chunked(closed, self.close_batch_size):
+            records = [{
+                'attributes': {'type': 'Case'},
+                'id': row['case_id'],
+                'Status': row['status'] or 'New',
+                'Reason': None,
+                'Comments': f"Reopened by AI spam filter at {timestamp}. Closed as spam by model {row['model_version']} at {row['ts']}"
+            } for row in batch]
+            try:
+                self.metrics.inc('salesforce_api_calls_total', call='reopen_batch')
+                response = self.sf.restful('composite/sobjects', method='PATCH',
+                                           json={'allOrNone': False, 'records': records})
+            except Exception as e:
+                print(f"Error reopening batch of {len(batch)} cases: {e}")
+                self.record_api_error(e, call='reopen_batch')
+                continue
+            
+            rows = []
+            now = log_timestamp()
+            for row, outcome in zip(batch, response):
+                if not outcome.get('success', False):
+                    errors = '; '.join(e.get('message', '') for e in outcome.get('errors', []))
+                    print(f"Error reopening case {row['case_id']}: {errors}")
+                    continue
+                rows.append((now, row['case_id'], row['text_hash'], row['model_version'], row['spam_probability'],
+                             'reopened', row['status'], f"Bulk reopen of closes since {log_timestamp(since)}"))
+                # Incremental polls skip unchanged text, so the reopened case is not closed again
+                self.poll_state['classified'][row['case_id']] = row['text_hash']
+            self.decision_log.record(rows)
+            reopened += len(rows)
+        
+        self.save_poll_state()
+        print(f"Reopened {reopened} of {len(closed)} cases")
+        return reopened
+
+    def run_pipelined_cycle(self, full_rescan=False):
+        """One check with fetching, classification and closing running as overlapping stages"""
+        pages = queue.Queue(maxsize=self.pipeline_depth)
+        close_jobs = queue.Queue(maxsize=self.close_workers * 2)
+        completed = queue.Queue()
+        stop = threading.Event()
+        
+        def put(target, item):
+            # Blocks while the next stage is busy (backpressure) but gives up once the cycle is stopping
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def get(source):
+            while not stop.is_set():
+                try:
+                    return source.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return None
+        
+        def fetch_stage():
+            try:
+                for seq, (tickets, page_mark) in enumerate(self.get_new_tickets(full_rescan=full_rescan)):
+                    if not put(pages, (seq, tickets, page_mark)):
+                        return
+            finally:
+                put(pages, None)
+        
+        def send(queued):
+            # Batches may mix closes from several pages
+            for batch in chunked(queued, self.close_batch_size):
+                if not put(close_jobs, batch):
+                    return False
+            return True
+        
+        def classify_stage():
+            # (page, close record) pairs, sent once a batch is full or the oldest has waited the flush interval
+            queued = []
+            queued_at = None
+            try:
+                while not stop.is_set():
+                    try:
+                        item = pages.get(timeout=0.1)
+                    except queue.Empty:
+                        if queued and time.monotonic() - queued_at >= self.close_flush_interval:
+                            if not send(queued):
+                                return
+                            queued = []
+                        continue
+                    if item is None:
+                        send(queued)
+                        return
+                    seq, tickets, page_mark = item
+                    kept, spam = self.classify_page(tickets)
                     
-                    if is_spam and confidence > 0.53:
-                        print("=== SPAM DETECTED ===")
-                        print(f"  Subject: {subject}")
-                        print(f"  Confidence: {confidence:.1%}\n")
-                        
-                        if self.close_spam_ticket(ticket['Id'], reason):
-                            self.stats['spam_closed'] += 1
-                        else:
-                            print(f"  Failed to close ticket")
+                    page = {'seq': seq, 'handled': kept, 'spam': [t for t, _ in spam], 'mark': page_mark,
+                            'results': {}, 'pending': len(spam)}
+                    if not spam:
+                        completed.put(page)
+                    elif not queued:
+                        queued_at = time.monotonic()
+                    queued += [(page, self.close_record(t['Id'], reason)) for t, reason in spam]
+                    # Full batches go out now, the rest once the flush interval has passed (as in process_tickets)
+                    if queued and time.monotonic() - queued_at >= self.close_flush_interval:
+                        ready = len(queued)
                     else:
-                        self.stats['legitimate_kept'] += 1
-                    
-                    self.stats['total_processed'] += 1
-            
-            # Print stats
-            if self.stats['total_processed'] > 0:
-                spam_rate = self.stats['spam_closed'] / self.stats['total_processed'] * 100
-                print(f"Stats: {self.stats['total_processed']} processed, {self.stats['spam_closed']} closed, {spam_rate:.1f}% spam rate")
+                        ready = len(queued) - len(queued) % self.close_batch_size
+                    if ready:
+                        if not send(queued[:ready]):
+                            return
+                        queued = queued[ready:]
+                        queued_at = time.monotonic()
+            finally:
+                for _ in range(self.close_workers):
+                    put(close_jobs, None)
+        
+        def close_stage():
+            while True:
+                job = get(close_jobs)
+                if job is None:
+                    return
+                results = self.send_close_batch([record for _, record in job])
+                finished = []
+                with self.stats_lock:
+                    for page, record in job:
+                        page['results'][record['id']] = results.get(record['id'], False)
+                        page['pending'] -= 1
+                        if page['pending'] == 0:
+                            finished.append(page)
+                for page in finished:
+                    completed.put(page)
+        
+        threads = [threading.Thread(target=fetch_stage, name='fetch', daemon=True),
+                   threading.Thread(target=classify_stage, name='classify', daemon=True)]
+        threads += [threading.Thread(target=close_stage, name=f'close-{i}', daemon=True) for i in range(self.close_workers)]
+        for thread in threads:
+            thread.start()
+        
+        # Pages can finish out of order; the watermark only moves over pages that finished in sequence
+        finished_pages = {}
+        next_seq = 0
+        failed = []
+        try:
+            while True:
+                try:
+                    page = completed.get(timeout=0.1)
+                except queue.Empty:
+                    if not any(thread.is_alive() for thread in threads) and completed.empty():
+                        break
+                    continue
+                finished_pages[page['seq']] = page
+                while next_seq in finished_pages:
+                    page = finished_pages.pop(next_seq)
+                    self.finish_page(page['handled'], page['spam'], page['results'], failed, page['mark'])
+                    next_seq += 1
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def report_spam_waves(self, limit=5):
+        """Print the largest active spam campaigns"""
+        campaigns = self.waves.campaigns()
+        if not campaigns:
+            return
+        print(f"Active spam campaigns: {len(campaigns)}")
+        for wave in campaigns[:limit]:
+            first_seen = datetime.fromtimestamp(wave.first_seen).strftime('%Y-%m-%d %H:%M')
+            print(f"  Wave #{wave.wave_id}: {wave.size} cases since {first_seen}, {wave.spam_closed} closed by the model - {wave.sample_subject}")
+
+    def run_cycle(self, full_rescan=False, pipelined=False):
+        """Fetch, classify and close one poll's tickets"""
+        if pipelined:
+            self.run_pipelined_cycle(full_rescan=full_rescan)
+        else:
+            failed = []
+            # Closes queued by an interrupted cycle were never sent, and their pages never finished
+            self.close_queue, self.close_results, self.waiting_pages = [], {}, []
+            # The next page downloads in the background while this one is classified and closed
+            for tickets, page_mark in prefetch(self.get_new_tickets(full_rescan=full_rescan)):
+                # Pages with nothing to process still move the watermark over their skipped tickets
+                self.process_tickets(tickets, failed, page_mark)
+            self.finish_closed_pages(failed, flush=True)
+
+    def run_profiled_cycle(self, full_rescan=False, pipelined=False):
+        """Run one cycle under cProfile; saves the profile and prints the top functions"""
+        import pstats
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            self.run_cycle(full_rescan=full_rescan, pipelined=pipelined)
+        finally:
+            profiler.disable()
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"cycle-{datetime.now().strftime('%Y%m%d-%H%M%S')}.prof")
+            profiler.dump_stats(path)
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(15)
+            print(report.getvalue())
+            print(f"Cycle profile saved to {path} (pipelined stages run on other threads and are not included)"
+                  if pipelined else f"Cycle profile saved to {path}")
+
+    def run_check(self, full_rescan=False, pipelined=False):
+        """Run one check for new tickets; returns the number of tickets processed"""
+        print(f"\n=== Checking at {datetime.now().strftime('%H:%M:%S')} ===")
+        processed_before = self.stats['total_processed']
+        closed_before = self.stats['spam_closed']
+        self.stats['polls'] += 1
+        self.apply_pending_model()
+        
+        started = time.perf_counter()
+        if self.profile_cycles > 0:
+            self.profile_cycles -= 1
+            self.run_profiled_cycle(full_rescan=full_rescan, pipelined=pipelined)
+        else:
+            self.run_cycle(full_rescan=full_rescan, pipelined=pipelined)
+        elapsed = time.perf_counter() - started
+        self.metrics.observe('cycle_seconds', elapsed, mode='pipelined' if pipelined else 'sequential')
+        
+        processed = self.stats['total_processed'] - processed_before
+        self.log_json('cycle', duration_s=round(elapsed, 4), processed=processed,
+                      spam_closed=self.stats['spam_closed'] - closed_before, pipelined=pipelined,
+                      stats=self.stats, metrics=self.metrics.snapshot())
+        if self.waves is not None:
+            self.report_spam_waves()
+        if self.rules.hits:
+            print("Top filter rules: " + ', '.join(f"{name} ({count})" for name, count in self.rules.top_hits()))
+        self.save_poll_state()
+        if self.cache_file:
+            self.cache.save(self.cache_file)
+        if processed == 0:
+            print("No tickets to process")
+        if self.on_check is not None:
+            self.on_check(self.stats)
+        
+        # Print stats
+        if self.stats['total_processed'] > 0:
+            spam_rate = self.stats['spam_closed'] / self.stats['total_processed'] * 100
+            print(f"Stats: {self.stats['total_processed']} processed, {self.stats['spam_closed']} closed, {spam_rate:.1f}% spam rate")
+        if self.startup_profile:
+            self.startup_profile = False
+            self.print_startup_profile()
+        
+        return processed
+
+    def print_startup_profile(self):
+        """Import and initialisation timings, and which heavy modules ended up loaded"""
+        labels = {
+            'imports': "Service module imports",
+            'salesforce_import': "  simple_salesforce/requests import",
+            'salesforce_login': "Salesforce login (incl. import)",
+            'model_load': "Model load (background thread)",
+            'model_wait': "  waited for the model after login",
+            'inference_engine': "Inference engine setup",
+            'init': "SpamFilterService() total",
+            'first_ticket': "First ticket classified (since import)"
+        }
+        print("\nStartup profile:")
+        for key, label in labels.items():
+            if key in self.startup:
+                print(f"  {label:<40} {self.startup[key] * 1000:9.1f} ms")
+        heavy = [name for name in ('numpy', 'scipy', 'sklearn', 'simple_salesforce', 'requests') if name in sys.modules]
+        print(f"  Heavy modules loaded: {', '.join(heavy) or 'none'}")
+        print("  (python -X importtime ./services/spam_filter_service.py --startup-profile breaks imports down by module)")
+
+    def check_tickets_periodically(self, full_rescan=False, pipelined=False, daemon=False):
+        """Main loop - classify tickets and optionally close spam"""
+        print("\nStarting periodic ticket checking...")
+        print("Press Ctrl+C to stop")
+        
+        try:
+            while True:
+                errors_before = self.stats['api_errors']
+                processed = self.run_check(full_rescan=full_rescan, pipelined=pipelined)
+                
+                if not daemon or (self.should_stop is not None and self.should_stop()):
+                    break
+                
+                # Only the first poll of a daemon run is a full rescan
+                full_rescan = False
+                if self.session_expired:
+                    self.reconnect()
                 
-                # print("Waiting 30 seconds...")
-                # time.sleep(30)
+                delay = self.scheduler.next_delay(processed, api_error=self.stats['api_errors'] > errors_before)
+                print(f"Waiting {delay:.0f} seconds...")
+                time.sleep(delay)
                 
         except KeyboardInterrupt:
             print("\nStopped checking tickets")
@@ -182,8 +1410,98 @@ class SpamFilterService:
             print(f"Total processed: {self.stats['total_processed']}")
             print(f"Spam closed: {self.stats['spam_closed']}")
             print(f"Legitimate kept: {self.stats['legitimate_kept']}")
+        
+        if self.shadow is not None:
+            # Checks never wait for the candidate (it drops batches when behind); only shutdown drains its queue
+            if not self.shadow.wait_idle():
+                print("Shadow candidate did not finish its queued batches before shutdown")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI spam filter for Salesforce cases")
+    parser.add_argument('--full-rescan', action='store_true',
+                        help="Re-classify every open case instead of only those changed since the last poll")
+    parser.add_argument('--pipelined', action='store_true',
+                        help="Overlap fetching, classification and closing (see SPAM_CLOSE_WORKERS)")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Keep polling with an adaptive interval instead of running a single check")
+    parser.add_argument('--profile', action='store_true',
+                        help="Run the first check under cProfile and save the profile (see SPAM_PROFILE_DIR)")
+    parser.add_argument('--startup-profile', action='store_true',
+                        help="Print import and initialisation timings after the first check")
+    parser.add_argument('--watch-model', action='store_true',
+                        help="Reload the model when ./models changes (same as SPAM_MODEL_RELOAD=on)")
+    parser.add_argument('--shadow-report', action='store_true',
+                        help="Summarise the shadow candidate log (SPAM_SHADOW_LOG) and exit")
+    parser.add_argument('--audit', action='store_true',
+                        help="Print decisions from the local decision log (SPAM_DECISION_LOG) and exit")
+    parser.add_argument('--reopen', action='store_true',
+                        help="Reopen the cases closed as spam between --since and --until, then exit")
+    parser.add_argument('--since', help="Start of the time range, e.g. 2025-08-08 or 2025-08-08T14:00")
+    parser.add_argument('--until', help="End of the time range (exclusive, default now)")
+    parser.add_argument('--case', help="Only decisions for this case Id (--audit)")
+    parser.add_argument('--action', choices=['kept', 'closed', 'close_failed', 'reopened'],
+                        help="Only decisions with this action (--audit)")
+    parser.add_argument('--limit', type=int, default=100, help="Most recent decisions printed by --audit")
+    parser.add_argument('--dry-run', action='store_true', help="With --reopen, only count the cases")
+    parser.add_argument('--record', help="Append every fetched Case to this JSONL file (same as SPAM_RECORD_FILE)")
+    parser.add_argument('--replay', nargs='+', metavar='JSONL',
+                        help="Poll recorded Case snapshots instead of Salesforce until they are all processed")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Replay speed: 1 is the recorded pace, 100 a hundred times faster, 0 everything at once")
+    parser.add_argument('--capture', default='./replay_closes.jsonl', help="Where --replay writes the updates it captured")
+    args = parser.parse_args()
+    
+    if args.shadow_report:
+        from shadow_model import shadow_report
+        load_dotenv()
+        shadow_report(os.getenv('SPAM_SHADOW_LOG', SHADOW_LOG), SPAM_THRESHOLD)
+        raise SystemExit(0)
+    
+    if args.audit:
+        load_dotenv()
+        audit_report(DecisionLog(os.getenv('SPAM_DECISION_LOG') or DECISION_LOG), since=args.since,
+                     until=args.until, case_id=args.case, action=args.action, limit=args.limit)
+        raise SystemExit(0)
+    
+    if args.reopen:
+        if not args.since:
+            parser.error("--reopen needs --since")
+        service = SpamFilterService()
+        if not service.ready:
+            raise SystemExit(1)
+        if service.decision_log is None:
+            parser.error("--reopen needs the decision log (SPAM_DECISION_LOG)")
+        service.reopen_cases(args.since, args.until, dry_run=args.dry_run)
+        raise SystemExit(0)
+    
+    if args.record:
+        os.environ['SPAM_RECORD_FILE'] = args.record
+    
+    if args.replay:
+        from replay_salesforce import ReplaySalesforce
+        # A replay keeps its own polling state and decision log unless they are set in the environment
+        os.environ.setdefault('SPAM_FILTER_STATE_FILE', './replay_state.json')
+        os.environ.setdefault('SPAM_DECISION_LOG', './replay_decisions.db')
+        replay = ReplaySalesforce(args.replay, speed=args.speed, capture_path=args.capture)
+        service = SpamFilterService(sf=replay)
+        if not service.ready:
+            raise SystemExit(1)
+        service.poll_state = {'last_modstamp': None, 'last_id': None, 'classified': {}}
+        service.should_stop = lambda: replay.drained
+        service.startup_profile = args.startup_profile
+        print(f"Replaying {len(replay.snapshots)} Case snapshots at {f'{args.speed:g}x' if args.speed else 'max'} speed")
+        service.check_tickets_periodically(full_rescan=args.full_rescan, pipelined=args.pipelined, daemon=True)
+        replay.report()
+        replay.close()
+        raise SystemExit(0)
+    
     service = SpamFilterService()
+    if not service.ready:
+        raise SystemExit(1)
+    if args.profile:
+        service.profile_cycles = max(service.profile_cycles, 1)
+    if args.watch_model:
+        service.start_model_watcher()
+    service.startup_profile = args.startup_profile
     print("Service ready to run!")
-    service.check_tickets_periodically()
+    service.check_tickets_periodically(full_rescan=args.full_rescan, pipelined=args.pipelined, daemon=args.daemon)
@@ -0,0 +1,203 @@
+"""
+Near-duplicate spam wave detection with MinHash signatures and LSH banding
+Groups lightly templated copies of the same message into campaigns across poll cycles
+"""
+import re
+import time
+import zlib
+import threading
+from itertools import repeat
+from collections import OrderedDict
+import numpy as np
+
+MIX = np.uint64(0x9E3779B97F4A7C15)  # odd 64-bit multiplier for combining word hashes
+WORD = re.compile(r'\w+')
+SIGNED_CHARS = 500  # only the start of a text is signed; templated copies share it, and long texts cost no more
+
+class WordHashes(dict):
+    """Memoized crc32 of each word, so repeated vocabulary is hashed once"""
+
+    def __missing__(self, word):
+        if len(self) >= 200000:
+            self.clear()
+        value = self[word] = zlib.crc32(word.encode('utf-8'))
+        return value
+
+class MinHasher:
+    """MinHash signatures of word shingles from num_perm multiply-shift hash functions"""
+
+    def __init__(self, num_perm=64, shingle_size=3, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        # (a * x + b) mod 2**64, top 32 bits: universal for 32-bit x with odd a, and no slow modulo
+        self.a = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self.word_hashes = WordHashes()
+
+    def shingle_hashes(self, texts):
+        """32-bit hashes of every word shingle of every text, plus where each text's shingles start"""
+        size = self.shingle_size
+        lookup = self.word_hashes.__getitem__
+        word_hashes = []
+        counts = []
+        for text in texts:
+            words = WORD.findall(text[:SIGNED_CHARS].lower())
+            word_hashes.extend(map(lookup, words))
+            # Padding keeps shingles from spanning two texts and gives short or empty texts one shingle
+            word_hashes.extend(repeat(0, size - 1 if words else size))
+            counts.append(max(len(words), 1))
+
+        values = np.array(word_hashes, dtype=np.int64).view(np.uint64)
+        positions = len(values) - size + 1
+        combined = values[:positions].copy()
+        for offset in range(1, size):
+            combined = combined * MIX + values[offset:offset + positions]
+
+        counts = np.array(counts, dtype=np.int64)
+        segment_starts = np.concatenate([[0], np.cumsum(counts + size - 1)[:-1]])
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        index = np.repeat(segment_starts - starts, counts) + np.arange(counts.sum())
+        shingles = combined[index]
+        return (shingles >> np.uint64(32)) ^ (shingles & np.uint64(0xFFFFFFFF)), starts
+
+    def signatures(self, texts):
+        """(len(texts), num_perm) signatures, computed for the whole batch at once"""
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint64)
+        if len(texts) == 0:
+            return signatures
+        values, starts = self.shingle_hashes(texts)
+        shift = np.uint64(32)
+        for i in range(self.num_perm):
+            signatures[:, i] = np.minimum.reduceat((self.a[i] * values + self.b[i]) >> shift, starts)
+        return signatures
+
+class SpamWave:
+    """One cluster of near-duplicate cases"""
+    __slots__ = ('wave_id', 'signature', 'band_keys', 'keyed_members', 'size', 'first_seen', 'last_seen',
+                 'spam_closed', 'confidence', 'sample_subject')
+
+    def __init__(self, wave_id, signature, now, sample_subject):
+        self.wave_id = wave_id
+        self.signature = signature
+        self.band_keys = []
+        self.keyed_members = 0
+        self.size = 1
+        self.first_seen = now
+        self.last_seen = now
+        self.spam_closed = 0
+        self.confidence = 0.0
+        self.sample_subject = sample_subject
+
+class SpamWaveIndex:
+    """LSH index of MinHash signatures that keeps clusters alive across polls, with time-based eviction"""
+
+    def __init__(self, num_perm=64, bands=32, similarity=0.4, ttl=86400, max_clusters=50000, max_keyed_members=5):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.similarity = similarity
+        self.ttl = ttl
+        self.max_clusters = max_clusters
+        self.max_keyed_members = max_keyed_members
+        self.buckets = [{} for _ in range(bands)]
+        self.clusters = OrderedDict()  # least recently seen first
+        self.next_id = 1
+        self._lock = threading.Lock()
+
+    def assign(self, texts, subjects=None, now=None, counts=None):
+        """Put each text in its near-duplicate cluster (creating one if needed); returns wave ids
+        counts gives how many cases share each text, so exact repeats are signed once but still counted"""
+        now = time.time() if now is None else now
+        subjects = subjects or [''] * len(texts)
+        counts = counts or [1] * len(texts)
+        signatures = self.hasher.signatures(texts)
+        min_matches = self.similarity * signatures.shape[1]
+
+        # One integer key per band: the band's rows packed together
+        banded = signatures.reshape(len(texts), self.bands, self.rows)
+        band_keys = banded[:, :, 0].copy()
+        for row in range(1, self.rows):
+            band_keys = band_keys * MIX + banded[:, :, row]
+        band_keys = band_keys.tolist()
+        wave_ids = []
+
+        with self._lock:
+            self.evict(now)
+            for signature, keys, subject, count in zip(signatures, band_keys, subjects, counts):
+
+                # Candidate clusters share at least one band; the first one whose estimated
+                # Jaccard similarity is high enough wins
+                wave = None
+                tried = set()
+                for bucket, key in zip(self.buckets, keys):
+                    wave_id = bucket.get(key)
+                    if wave_id is None or wave_id in tried:
+                        continue
+                    tried.add(wave_id)
+                    candidate = self.clusters.get(wave_id)
+                    if candidate is not None and np.count_nonzero(candidate.signature == signature) >= min_matches:
+                        wave = candidate
+                        break
+
+                if wave is None:
+                    wave = SpamWave(self.next_id, signature, now, subject)
+                    wave.size = count
+                    self.clusters[wave.wave_id] = wave
+                    self.next_id += 1
+                else:
+                    wave.size += count
+                    wave.last_seen = now
+                    self.clusters.move_to_end(wave.wave_id)
+
+                # A few members per cluster are indexed so drifting variants still match
+                if wave.keyed_members < self.max_keyed_members:
+                    wave.keyed_members += 1
+                    for bucket, key in zip(self.buckets, keys):
+                        bucket.setdefault(key, wave.wave_id)
+                    wave.band_keys.append(keys)
+
+                wave_ids.append(wave.wave_id)
+
+            while len(self.clusters) > self.max_clusters:
+                self._remove(next(iter(self.clusters)))
+
+        return wave_ids
+
+    def mark_spam(self, wave_id, confidence):
+        """Record a confidently closed spam case in the wave"""
+        with self._lock:
+            wave = self.clusters.get(wave_id)
+            if wave is not None:
+                wave.spam_closed += 1
+                wave.confidence = max(wave.confidence, float(confidence))
+
+    def spam_wave(self, wave_id):
+        """The wave if it already contains closed spam, else None"""
+        wave = self.clusters.get(wave_id)
+        return wave if wave is not None and wave.spam_closed else None
+
+    def evict(self, now=None):
+        """Drop clusters not seen within the ttl"""
+        now = time.time() if now is None else now
+        while self.clusters:
+            wave = next(iter(self.clusters.values()))
+            if wave.last_seen >= now - self.ttl:
+                break
+            self._remove(wave.wave_id)
+
+    def _remove(self, wave_id):
+        wave = self.clusters.pop(wave_id)
+        # Keys another cluster got to first still belong to that cluster
+        for keys in wave.band_keys:
+            for bucket, key in zip(self.buckets, keys):
+                if bucket.get(key) == wave_id:
+                    del bucket[key]
+
+    def campaigns(self, min_size=3):
+        """Spam waves with at least min_size cases, largest first"""
+        with self._lock:
+            waves = [w for w in self.clusters.values() if w.spam_closed and w.size >= min_size]
+        return sorted(waves, key=lambda w: w.size, reverse=True)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Supervisor for several spam filter workers, one process per org or per shard of one org's cases
+The model is loaded once before the workers are forked and shared copy-on-write; worker stats are aggregated here
+"""
+import os
+import gc
+import json
+import queue
+import string
+import argparse
+import multiprocessing
+from dotenv import load_dotenv
+from metrics import Metrics, MetricsServer
+from spam_filter_service import SpamFilterService, load_model_artifacts, MODEL_DIR, DECISION_LOG, SHADOW_LOG
+
+# Base62 digits in the order SOQL compares Ids
+ID_DIGITS = string.digits + string.ascii_uppercase + string.ascii_lowercase
+# Files every worker writes to, with their defaults; each worker gets its own copy
+WORKER_FILES = [('SPAM_FILTER_STATE_FILE', './spam_filter_state.json'), ('SPAM_CACHE_FILE', None),
+                ('SPAM_DECISION_LOG', DECISION_LOG), ('SPAM_SHADOW_LOG', SHADOW_LOG), ('SPAM_JSON_LOG', None),
+                ('SPAM_RECORD_FILE', None)]
+
+def worker_path(path, name):
+    """Per-worker variant of a state file path, e.g. ./spam_filter_state.us-0.json"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{name}{ext}"
+
+def id_value(case_id):
+    """The ordered 15-character part of a Salesforce Id as a number"""
+    value = 0
+    for char in case_id[:15]:
+        value = value * 62 + ID_DIGITS.index(char)
+    return value
+
+def id_string(value):
+    """15-character Id for a number from id_value"""
+    chars = []
+    for _ in range(15):
+        value, digit = divmod(value, 62)
+        chars.append(ID_DIGITS[digit])
+    return ''.join(reversed(chars))
+
+def id_ranges(sf, shards):
+    """shards (low, high) Id bounds splitting the span of the org's open case Ids evenly, or None without open cases
+    The outer ends are left open (''), so cases created later fall in the last range"""
+    bounds = []
+    for direction in ('ASC', 'DESC'):
+        records = sf.query_all(f"SELECT Id FROM Case WHERE Status IN ('New', 'Open') ORDER BY Id {direction} LIMIT 1")['records']
+        if not records:
+            return None
+        bounds.append(id_value(records[0]['Id']))
+    low, high = bounds
+    cuts = [id_string(low + (high - low + 1) * index // shards) for index in range(1, shards)]
+    return list(zip([''] + cuts, cuts + ['']))
+
+def connect_org(env, sf_factory=None):
+    """Salesforce login with an org's env overrides on top of .env"""
+    if sf_factory is not None:
+        return sf_factory()
+    from simple_salesforce import Salesforce
+    return Salesforce(**{arg: env.get(key, os.getenv(key)) for arg, key in
+                         (('username', 'SF_USERNAME'), ('password', 'SF_PASSWORD'), ('security_token', 'SF_SECURITY_TOKEN'))})
+
+def worker_specs(orgs_file=None, workers=1, shard_by='id', sf_factory=None):
+    """(name, env) for every worker
+    Each org in orgs_file is {"name": ..., "env": {...}, "shards": n, "shard_by": "id" or "hash"}; without a file,
+    the .env org is split into workers shards. Id shards log in once here to find the org's range of Ids"""
+    if orgs_file:
+        with open(orgs_file, 'r', encoding='utf-8') as f:
+            orgs = json.load(f)
+    else:
+        orgs = [{'name': 'default', 'env': {}, 'shards': workers}]
+
+    specs = []
+    for org in orgs:
+        shards = max(1, int(org.get('shards', 1)))
+        org_env = {key: str(value) for key, value in org.get('env', {}).items()}
+        ranges = None
+        if shards > 1 and org.get('shard_by', shard_by) == 'id':
+            try:
+                ranges = id_ranges(connect_org(org_env, sf_factory), shards)
+            except Exception as e:
+                print(f"Could not read the Id range of {org['name']}: {e}")
+            if ranges is None:
+                print(f"Sharding {org['name']} by Id hash instead; each worker fetches every page")
+        
+        for index in range(shards):
+            name = org['name'] if shards == 1 else f"{org['name']}-{index}"
+            env = dict(org_env)
+            # Workers never share state, caches or logs; the supervisor serves the metrics
+            for key, default in WORKER_FILES:
+                path = os.getenv(key, default)
+                if path and path != '-':
+                    env.setdefault(key, worker_path(path, name))
+            env['SPAM_METRICS_PORT'] = ''
+            if ranges is not None:
+                env['SPAM_ID_RANGE'] = ':'.join(ranges[index])
+            elif shards > 1:
+                env['SPAM_SHARD'] = f"{index}/{shards}"
+            specs.append((name, env))
+    return specs
+
+def run_worker(name, env, model, stats_queue, sf_factory, full_rescan, pipelined, daemon):
+    """Worker process: one SpamFilterService reporting its stats after every check"""
+    os.environ.update(env)
+    service = SpamFilterService(sf_factory=sf_factory, model=model)
+    if getattr(service, 'sf', None) is None:
+        stats_queue.put((name, {'error': 'Salesforce connection failed'}))
+        return
+    service.on_check = lambda stats: stats_queue.put((name, dict(stats)))
+    service.check_tickets_periodically(full_rescan=full_rescan, pipelined=pipelined, daemon=daemon)
+
+class Supervisor:
+    """Starts the workers, collects their stats and prints per-worker and total figures"""
+
+    def __init__(self, specs, sf_factory=None):
+        self.specs = specs
+        self.sf_factory = sf_factory
+        self.worker_stats = {}
+        self.processes = []
+        self.metrics = Metrics()
+        self.metrics.add_collector(self.totals)
+
+    def start(self, full_rescan=False, pipelined=False, daemon=False):
+        """Load the model once and fork one process per worker"""
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        model = None
+        if 'fork' in methods:
+            print("Loading spam classification model for all workers...")
+            model = load_model_artifacts(MODEL_DIR, os.getenv('SPAM_MODEL_FORMAT', 'auto'))
+            print(f"Spam model {model[2]} loaded, sharing it with {len(self.specs)} workers")
+            # Keep the garbage collector from writing to (and so copying) the model's pages in every worker
+            gc.freeze()
+        else:
+            print("Processes can't be forked here, each worker loads its own model")
+
+        self.stats_queue = context.Queue()
+        for name, env in self.specs:
+            process = context.Process(target=run_worker, name=name, args=(
+                name, env, model, self.stats_queue, self.sf_factory, full_rescan, pipelined, daemon))
+            process.start()
+            self.processes.append(process)
+        print(f"Started {len(self.processes)} workers: {', '.join(name for name, _ in self.specs)}")
+        return self
+
+    def totals(self):
+        """Numeric stats summed over every worker's latest report"""
+        totals = {'workers': len(self.processes), 'workers_alive': sum(p.is_alive() for p in self.processes)}
+        for stats in list(self.worker_stats.values()):
+            for key, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def report(self, name):
+        stats = self.worker_stats[name]
+        if 'error' in stats:
+            print(f"[{name}] {stats['error']}")
+            return
+        totals = self.totals()
+        print(f"[{name}] {stats['total_processed']} processed, {stats['spam_closed']} closed | "
+              f"all workers: {totals['total_processed']} processed, {totals['spam_closed']} closed")
+
+    def run(self):
+        """Collect stats until every worker has exited"""
+        try:
+            while True:
+                try:
+                    name, stats = self.stats_queue.get(timeout=0.5)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in self.processes):
+                        break
+                    continue
+                self.worker_stats[name] = stats
+                self.report(name)
+        except KeyboardInterrupt:
+            print("\nStopping workers...")
+        finally:
+            for process in self.processes:
+                process.join()
+
+        print("\nFinal stats:")
+        for name, stats in sorted(self.worker_stats.items()):
+            if 'error' not in stats:
+                print(f"  {name}: {stats['total_processed']} processed, {stats['spam_closed']} closed, "
+                      f"{stats['close_failed']} close failures, {stats['api_errors']} API errors")
+        totals = self.totals()
+        print(f"  total: {totals.get('total_processed', 0)} processed, {totals.get('spam_closed', 0)} closed")
+        return totals
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several spam filter workers (orgs or shards) from one process")
+    parser.add_argument('--workers', type=int, default=2,
+                        help="Number of shards of the .env org (ignored with --orgs)")
+    parser.add_argument('--shard-by', choices=['id', 'hash'], default='id',
+                        help="Split shards into Id ranges Salesforce filters on, or by Id hash after fetching every page")
+    parser.add_argument('--orgs', help="JSON list of orgs, each {\"name\", \"env\", \"shards\"}")
+    parser.add_argument('--full-rescan', action='store_true')
+    parser.add_argument('--pipelined', action='store_true')
+    parser.add_argument('--daemon', action='store_true')
+    args = parser.parse_args()
+
+    load_dotenv()
+    supervisor = Supervisor(worker_specs(args.orgs, args.workers, args.shard_by))
+    supervisor.start(full_rescan=args.full_rescan, pipelined=args.pipelined, daemon=args.daemon)
+    if os.getenv('SPAM_METRICS_PORT'):
+        # Started after forking so the workers don't inherit the server thread
+        server = MetricsServer(supervisor.metrics, int(os.getenv('SPAM_METRICS_PORT')),
+                               os.getenv('SPAM_METRICS_HOST', '127.0.0.1')).start()
+        print(f"Aggregated metrics at http://{os.getenv('SPAM_METRICS_HOST', '127.0.0.1')}:{server.port}/metrics")
+    supervisor.run()